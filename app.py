@@ -27,16 +27,38 @@ except:
     pass
 # 导入必要的模块
 import json
+import re
+import glob
+import concurrent.futures
+import contextlib
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, fields, replace
+from typing import Optional
+import time
+from datetime import datetime, timezone
+import math
+import mmap
+import bisect
+from array import array
+import itertools
+import functools
+import inspect
 import threading
 import urllib.parse
+import uuid
 import tempfile
 import subprocess
 import shutil
 import traceback
+import sqlite3
+import zlib
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
+from werkzeug.http import http_date, is_resource_modified
+from werkzeug.sansio import multipart
 
 # 在导入 yt-dlp 之前，确保 SSL 验证已禁用
 import urllib3
@@ -47,6 +69,12 @@ import requests
 requests.packages.urllib3.disable_warnings()
 
 import yt_dlp
+from yt_dlp.extractor import gen_extractor_classes, get_info_extractor
+from yt_dlp.postprocessor import FFmpegExtractAudioPP
+from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor, FFmpegPostProcessorError
+from yt_dlp.downloader import FileDownloader
+from yt_dlp.downloader.http import HttpFD
+from yt_dlp.utils import determine_protocol, variadic
 
 # 尝试自动检测 ffmpeg 路径
 FFMPEG_PATH = None
@@ -83,1086 +111,5324 @@ DOWNLOAD_DIR.mkdir(exist_ok=True)  # 如果目录不存在则创建
 MP3_DIR = VIDEO_DIR / 'MP3'
 MP3_DIR.mkdir(exist_ok=True)  # 如果目录不存在则创建
 
-# 全局任务状态字典，用于存储每个任务的进度信息
+# 程序数据目录（缓存数据库等）
+DATA_DIR = Path(os.environ.get('V2V_DATA_DIR', VIDEO_DIR / 'data'))
+DATA_DIR.mkdir(exist_ok=True)
+
+@dataclass(slots=True)
+class TaskState:
+    """
+    单个任务的状态记录
+    只保存原始数值，显示用字符串在序列化时生成（见 serialize_task）
+    字段读写需持有该任务自己的 lock
+    """
+    task_id: str
+    url: str = ''
+    filename: str = ''
+    status: str = 'pending'
+    message: str = ''
+    title: str = ''
+    priority: int = 0
+    profile: str = 'mp3'  # 下载的输出档位（见 OUTPUT_PROFILES）
+    progress_percent: float = 0
+    downloaded_bytes: int = 0
+    total_bytes: int = 0
+    speed: Optional[float] = None  # 字节/秒
+    eta: Optional[int] = None  # 剩余秒数
+    stage_percent: Optional[float] = None  # 当前 ffmpeg 阶段（转换、编码分割）的进度百分比，总时长未知时为 None
+    realtime_factor: Optional[float] = None  # 当前 ffmpeg 阶段的处理速度（媒体时长 / 实际耗时）
+    start_time: float = 0
+    elapsed_time: float = 0
+    completed_time: Optional[float] = None
+    metadata_time: Optional[float] = None
+    saved_time: Optional[float] = None  # 下载阶段复用解析结果省去的第二次解析耗时
+    cache_saved_time: Optional[float] = None  # 命中元数据缓存省去的解析耗时
+    segments: int = 0
+    output_files: list = field(default_factory=list)  # 生成的音频文件名（MP3 目录下）
+    parent_id: Optional[str] = None  # 所属播放列表任务的 ID
+    children: list = field(default_factory=list)  # 播放列表任务展开出的子任务 ID
+    playlist_total: int = 0  # 播放列表的条目数（展开完成前为 0）
+    playlist_completed: int = 0
+    playlist_failed: int = 0
+    playlist_active_percent: float = 0  # 进行中子任务的进度百分比之和（子任务更新时增量维护）
+    version: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def to_dict(self):
+        """返回除锁以外的全部字段"""
+        return {name: getattr(self, name) for name in TASK_STATE_FIELDS}
+
+
+TASK_STATE_FIELDS = tuple(f.name for f in fields(TaskState) if f.name != 'lock')
+
+# 全局任务状态字典（task_id -> TaskState），用于存储每个任务的进度信息
 tasks_status = {}
-tasks_lock = threading.Lock()  # 线程锁，保证任务状态更新的线程安全
+# 全局锁只保护任务字典的增删和版本号；任务字段的读写使用各自的任务锁
+tasks_lock = threading.Lock()
+# 只有进度等字段变化（状态不变）的任务 ID：update_task 不加全局锁直接追加，
+# 读取状态时由 flush_progress_changes 在全局锁内统一分配版本号
+pending_progress = deque()
+# 任务 ID 计数器，清除记录后也不会重复
+task_id_counter = itertools.count(1)
 
+# 已结束任务的保留策略：超过数量上限或保留时长的最早记录会被自动清除
+MAX_FINISHED_TASKS = int(os.environ.get('V2V_MAX_FINISHED_TASKS', 200))
+FINISHED_TASK_MAX_AGE = float(os.environ.get('V2V_FINISHED_TASK_MAX_AGE', 24 * 3600))
+FINISHED_STATUSES = ('completed', 'error')
+finished_tasks = OrderedDict()  # task_id -> 结束时间，按结束先后排列
 
-def progress_hook(d, task_id):
+# 下载进度的最小更新间隔（秒），yt-dlp 的高频回调在间隔内直接丢弃
+PROGRESS_MIN_INTERVAL = float(os.environ.get('V2V_PROGRESS_INTERVAL', 0.5))
+progress_last_update = {}  # task_id -> 上次写入进度的时间（单个字典操作，无需加锁）
+
+# 任务状态版本号：每次修改任务都分配一个新的递增版本号，
+# /api/status?since=<cursor> 据此只返回有变化的任务
+status_versions = itertools.count(1)
+status_cursor = 0  # 最近一次修改的版本号
+task_change_order = OrderedDict()  # task_id -> 最近一次修改的版本号，按修改先后排列
+removed_tasks = deque(maxlen=1000)  # 已删除任务的记录 (版本号, task_id)
+# 版本号只在本进程内有效，ETag 中带上进程启动标识，重启后旧的 ETag 不会误命中
+SERVER_EPOCH = f'{time.time_ns():x}'
+# 状态或文件列表变化时唤醒 /api/events 的推送线程（与 tasks_lock 共用同一把锁）
+status_changed = threading.Condition(tasks_lock)
+files_version = 0  # 每次发布新的音频文件时递增
+
+# 事件推送每秒最多发送的次数（同一时间窗口内的多次更新合并为一次）
+SSE_MAX_EVENTS_PER_SECOND = float(os.environ.get('V2V_SSE_MAX_EVENTS_PER_SECOND', 2))
+# 无事件时发送心跳注释的间隔（秒），同时用于检测 MP3 目录的外部变化
+SSE_HEARTBEAT_INTERVAL = 15
+
+# 进行中的任务状态（清除记录时保留）
+ACTIVE_STATUSES = ('pending', 'starting', 'downloading', 'converting', 'processing')
+
+
+def touch_task(task_id):
     """
-    下载进度回调函数
-    会在下载过程中被 yt-dlp 调用，更新任务状态
+    为任务分配新的版本号，调用方需持有 tasks_lock
     
     Args:
-        d: yt-dlp 传递的进度信息字典
         task_id: 任务 ID
     """
-    import time
-    from datetime import datetime
+    global status_cursor
+    version = next(status_versions)
+    status_cursor = version
+    tasks_status[task_id].version = version
+    task_change_order[task_id] = version
+    task_change_order.move_to_end(task_id)
+    status_changed.notify_all()
+
+
+def create_task(task_id=None, **initial):
+    """
+    登记新任务
+    
+    Args:
+        task_id: 沿用的任务 ID（重启后恢复任务时使用），None 表示分配新 ID
+        initial: 任务的初始字段（TaskState 的字段）
     
+    Returns:
+        str: 任务 ID
+    """
+    if task_id is None:
+        task_id = f"task_{next(task_id_counter)}"
     with tasks_lock:
-        if d['status'] == 'downloading':
-            # 正在下载，更新进度信息
-            percent = d.get('_percent_str', '0%')
-            speed = d.get('_speed_str', 'N/A')
-            eta = d.get('_eta_str', 'N/A')
-            
-            # 获取下载大小信息
-            downloaded_bytes = d.get('downloaded_bytes', 0)
-            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-            
-            # 格式化大小
-            downloaded_str = format_size(downloaded_bytes) if downloaded_bytes > 0 else '0 B'
-            total_str = format_size(total_bytes) if total_bytes > 0 else '未知'
-            
-            # 计算已用时间
-            start_time = tasks_status[task_id].get('start_time', time.time())
-            elapsed_time = time.time() - start_time
-            elapsed_str = format_time(elapsed_time)
-            
-            # 格式化速度
-            speed_str = format_speed(speed) if speed != 'N/A' else 'N/A'
-            
-            # 格式化剩余时间
-            eta_str = format_eta(eta) if eta != 'N/A' else '计算中...'
-            
-            # 解析进度百分比（安全处理各种格式）
-            try:
-                if '%' in percent:
-                    percent_str = percent.replace('%', '').strip()
-                    progress_percent = int(float(percent_str))
-                else:
-                    progress_percent = 0
-            except (ValueError, AttributeError):
-                progress_percent = 0
-            
-            tasks_status[task_id]['status'] = 'downloading'
-            tasks_status[task_id]['progress'] = percent
-            tasks_status[task_id]['progress_percent'] = progress_percent
-            tasks_status[task_id]['speed'] = speed_str
-            tasks_status[task_id]['speed_raw'] = speed
-            tasks_status[task_id]['eta'] = eta_str
-            tasks_status[task_id]['downloaded_bytes'] = downloaded_bytes
-            tasks_status[task_id]['downloaded_str'] = downloaded_str
-            tasks_status[task_id]['total_bytes'] = total_bytes
-            tasks_status[task_id]['total_str'] = total_str
-            tasks_status[task_id]['elapsed_time'] = elapsed_time
-            tasks_status[task_id]['elapsed_str'] = elapsed_str
-            
-        elif d['status'] == 'finished':
-            # 下载完成，正在进行后处理（转换格式）
-            tasks_status[task_id]['status'] = 'converting'
-            tasks_status[task_id]['progress'] = '100%'
-            tasks_status[task_id]['progress_percent'] = 100
-            tasks_status[task_id]['message'] = '正在转换为 MP3 格式...'
+        tasks_status[task_id] = TaskState(task_id=task_id, **initial)
+        touch_task(task_id)
+    return task_id
 
 
-def download_audio(url, filename, task_id):
+def update_task(task_id, **changes):
     """
-    下载视频并提取音频的主函数
-    在独立线程中执行，不会阻塞主线程
+    更新任务状态字段并递增版本号
+    字段在任务锁内写入；状态切换时在全局锁内登记版本号，
+    只有进度等字段变化时不加全局锁，记入 pending_progress 等读取状态时再登记
     
     Args:
-        url: YouTube 视频 URL
-        filename: 保存的文件名（不含扩展名）
         task_id: 任务 ID
+        changes: 要更新的字段
     """
-    try:
-        # 如果用户没有指定文件名，使用默认值
-        if not filename:
-            filename = '%(title)s'  # yt-dlp 会自动替换为视频标题
-        
-        # 设置 yt-dlp 的下载选项
-        ydl_opts = {
-            'format': 'bestaudio/best',  # 选择最佳音频质量
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',  # 使用 FFmpeg 提取音频
-                'preferredcodec': 'mp3',       # 转换为 MP3 格式
-                'preferredquality': '192',     # 音频比特率 192kbps
-            }],
-            # 如果检测到 ffmpeg 路径，则指定路径
-            **({'ffmpeg_location': FFMPEG_PATH} if FFMPEG_PATH else {}),
-            'outtmpl': str(MP3_DIR / f'{filename}.%(ext)s'),  # 输出文件模板（保存到 mp3 目录）
-            'progress_hooks': [lambda d: progress_hook(d, task_id)],  # 进度回调
-            'quiet': False,  # 显示详细信息
-            'no_warnings': False,
-            # SSL 证书相关配置（彻底禁用 SSL 验证）
-            'nocheckcertificate': True,  # 禁用 SSL 证书验证（yt-dlp 主要选项）
-            'no_check_certificate': True,  # 兼容性选项
-            'verifyssl': False,  # 禁用 SSL 验证
-            'no_check_ssl_certificate': True,  # 另一个 SSL 禁用选项
-            'prefer_insecure': True,  # 优先使用不安全的连接
-            # HTTP 请求头配置
-            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'referer': 'https://www.youtube.com/',
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': '*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate',
-                'Connection': 'keep-alive',
-            },
-            # 网络相关配置
-            'socket_timeout': 30,
-            'extractor_retries': 3,
-            'fragment_retries': 3,
-            'retries': 3,
-            # YouTube 特定配置
-            'geo_bypass': True,
-            'youtube_include_dash_manifest': False,
-            'youtube_include_hls_manifest': False,
-            'ignore_no_formats_error': True,
-        }
-        
-        # 更新任务状态为开始下载
+    task = tasks_status.get(task_id)
+    if task is None:
+        # 任务记录已被清除
+        return
+    with task.lock:
+        previous_status = task.status
+        previous_percent = task.progress_percent
+        for name, value in changes.items():
+            setattr(task, name, value)
+        current_percent = task.progress_percent
+    # 结束状态总是按状态切换登记（播放列表任务会先在任务锁内改状态，防止重复结束）
+    status = changes.get('status', previous_status)
+    if status != previous_status or 'status' in changes and status in FINISHED_STATUSES:
+        job_store.record_status(task_id, changes['status'], changes)
         with tasks_lock:
-            tasks_status[task_id]['status'] = 'starting'
-            tasks_status[task_id]['message'] = '正在获取视频信息...'
-        
-        # 执行下载
-        # 在创建 YoutubeDL 对象之前，再次确保 SSL 验证已禁用
-        import ssl
-        
-        # 保存原始上下文
-        original_context = ssl._create_default_https_context
-        
-        # 创建不验证SSL的上下文并设置为默认
-        unverified_context = ssl._create_unverified_context()
-        ssl._create_default_https_context = lambda: unverified_context
-        
-        # 记录生成的文件名
-        generated_filename = None
+            if task_id in tasks_status:
+                touch_task(task_id)
+                if changes['status'] in FINISHED_STATUSES:
+                    finished_tasks[task_id] = time.time()
+                    enforce_task_retention()
+    else:
+        # deque.append 是原子操作，下载进度的高频更新不争用全局锁
+        pending_progress.append(task_id)
+    # 子任务的进度和结果汇总到所属的播放列表任务
+    if task.parent_id is not None and ('status' in changes or 'progress_percent' in changes):
+        finished_status = None
+        if changes.get('status') in FINISHED_STATUSES and previous_status not in FINISHED_STATUSES:
+            finished_status = changes['status']
+        # 进行中的子任务按各自的百分比计入，只传递变化量
+        percent_delta = (
+            (current_percent if status in ACTIVE_STATUSES else 0)
+            - (previous_percent if previous_status in ACTIVE_STATUSES else 0)
+        )
+        update_playlist_progress(task.parent_id, finished_status, percent_delta)
+
+
+def flush_progress_changes():
+    """
+    为 pending_progress 中的任务分配版本号，调用方需持有 tasks_lock
+    版本号在全局锁内按登记顺序分配，task_change_order 始终按版本号排列
+    """
+    seen = set()
+    # 只处理进入时已有的条目，避免与持续写入的进度更新无限循环
+    for _ in range(len(pending_progress)):
+        task_id = pending_progress.popleft()
+        if task_id not in seen and task_id in tasks_status:
+            seen.add(task_id)
+            touch_task(task_id)
+
+
+def snapshot_task(task_id):
+    """
+    复制任务的当前字段，调用方需持有 tasks_lock
+    
+    Args:
+        task_id: 任务 ID
+    
+    Returns:
+        dict: 任务字段的浅拷贝
+    """
+    task = tasks_status[task_id]
+    with task.lock:
+        return task.to_dict()
+
+
+def remove_task(task_id):
+    """
+    删除任务记录并留下删除标记，调用方需持有 tasks_lock
+    
+    Args:
+        task_id: 任务 ID
+    """
+    global status_cursor
+    tasks_status.pop(task_id, None)
+    finished_tasks.pop(task_id, None)
+    progress_last_update.pop(task_id, None)
+    task_change_order.pop(task_id, None)
+    version = next(status_versions)
+    status_cursor = version
+    removed_tasks.append((version, task_id))
+    status_changed.notify_all()
+
+
+def enforce_task_retention():
+    """
+    按保留策略清除最早结束的任务记录，调用方需持有 tasks_lock
+    结束记录按时间排序，只需检查最早的一条，开销与清除数量成正比
+    """
+    expire_before = time.time() - FINISHED_TASK_MAX_AGE
+    while finished_tasks:
+        task_id, finished_at = next(iter(finished_tasks.items()))
+        if len(finished_tasks) <= MAX_FINISHED_TASKS and finished_at >= expire_before:
+            break
+        remove_task(task_id)
+
+
+def notify_files_changed():
+    """文件索引内容变化后调用（由 file_index 触发），通知事件推送线程刷新文件列表"""
+    global files_version
+    with tasks_lock:
+        files_version += 1
+        status_changed.notify_all()
+
+
+def build_status_delta(since):
+    """
+    计算 since 之后的任务状态增量，调用方需持有 tasks_lock
+    持锁期间只做浅拷贝，序列化由调用方在锁外完成
+    
+    Args:
+        since: 客户端上次同步到的版本号
+    
+    Returns:
+        dict: {'cursor', 'full', 'tasks', 'removed', 'queue'}
+        queue 为排队中的任务 ID（按执行顺序），出队不修改其他任务的版本号，客户端据此更新排队位置
+    """
+    # 登记只更新了进度的任务，顺便清除超过保留时长的记录
+    flush_progress_changes()
+    enforce_task_retention()
+    
+    # 删除记录已被淘汰，无法计算增量时返回全量
+    full = since <= 0 or (
+        len(removed_tasks) == removed_tasks.maxlen and since < removed_tasks[0][0]
+    )
+    changed = {}
+    removed = []
+    if full:
+        changed = {task_id: snapshot_task(task_id) for task_id in tasks_status}
+    else:
+        # 从最近修改的任务往前找，遇到不晚于 since 的即可停止
+        for task_id, version in reversed(task_change_order.items()):
+            if version <= since:
+                break
+            changed[task_id] = snapshot_task(task_id)
+        for version, task_id in reversed(removed_tasks):
+            if version <= since:
+                break
+            removed.append(task_id)
+    
+    return {
+        'cursor': status_cursor,
+        'full': full,
+        'tasks': changed,
+        'removed': removed,
+        'queue': scheduler.queued_task_ids()
+    }
+
+
+def serialize_task(task):
+    """
+    把任务的原始数值字段格式化为前端显示用的字符串
+    只在输出状态时调用（锁外），下载过程中不做任何格式化
+    
+    Args:
+        task: 任务字段的拷贝（会被直接修改）
+    
+    Returns:
+        dict: 可直接序列化为 JSON 的任务信息
+    """
+    percent = task.get('progress_percent') or 0
+    downloaded_bytes = task.get('downloaded_bytes') or 0
+    total_bytes = task.get('total_bytes') or 0
+    
+    # 进行中的任务实时计算已用时间，结束的任务使用记录的总用时
+    if task.get('status') in ACTIVE_STATUSES:
+        elapsed_time = time.time() - task.get('start_time', time.time())
+    else:
+        elapsed_time = task.get('elapsed_time') or 0
+    
+    # 排队位置由调度器按需计算，不随出队写入每个任务
+    task['queue_position'] = scheduler.queue_position(task['task_id']) if task.get('status') == 'pending' else 0
+    if task['queue_position']:
+        task['message'] = f"排队中，前方还有 {task['queue_position'] - 1} 个任务"
+    
+    task['progress_percent'] = int(percent)
+    task['progress'] = f'{percent:.1f}%'
+    if task.get('stage_percent') is not None:
+        task['stage_percent'] = int(task['stage_percent'])
+    realtime_factor = task.get('realtime_factor')
+    task['realtime_str'] = f'{realtime_factor:.1f}x' if realtime_factor else 'N/A'
+    task['speed'] = format_speed(task.get('speed'))
+    task['eta'] = format_eta(task.get('eta'))
+    task['downloaded_str'] = format_size(downloaded_bytes)
+    task['total_str'] = format_size(total_bytes) if total_bytes > 0 else '未知'
+    task['elapsed_time'] = elapsed_time
+    task['elapsed_str'] = format_time(elapsed_time)
+    return task
+
+
+def serialize_status_delta(delta):
+    """格式化增量中的每个任务（锁外调用）"""
+    for task in delta['tasks'].values():
+        serialize_task(task)
+    return delta
+
+
+# =========================================================================
+# 音频文件索引（内存缓存，增量维护）
+# =========================================================================
+
+# 音频文件扩展名 -> MIME 类型（文件列表和播放接口只处理这些文件）
+AUDIO_MIME_TYPES = {
+    '.mp3': 'audio/mpeg',
+    '.wav': 'audio/wav',
+    '.m4a': 'audio/mp4',
+    '.opus': 'audio/ogg',
+    '.ogg': 'audio/ogg',
+    '.flac': 'audio/flac',
+}
+
+# 文件列表排序字段：请求参数 -> 排序键
+FILE_SORT_KEYS = {
+    'modified': lambda entry: entry['modified_timestamp'],
+    'name': lambda entry: entry['name'].lower(),
+    'size': lambda entry: entry['size'],
+}
+
+
+class FileIndex:
+    """
+    MP3 目录的内存索引
+    
+    下载和分割完成时通过 publish()/discard() 增量更新；目录被外部修改时
+    （目录 mtime 变化）才重新扫描一次。每个条目在加入时格式化一次，
+    排序结果按 (排序字段, 方向) 缓存，直到索引内容再次变化。
+    """
+    
+    def __init__(self, directory, suffixes=('.mp3',)):
+        self.directory = Path(directory)
+        self._resolved_dir = self.directory.resolve()
+        self.suffixes = tuple(suffixes)
+        self._lock = threading.Lock()
+        self._entries = {}  # 文件名 -> 格式化后的条目
+        self._sorted = {}  # (排序字段, 是否倒序) -> 排好序的条目列表
+        self._dir_mtime = None  # 最近一次扫描时的目录 mtime，None 表示尚未扫描
+        self.version = 0
+    
+    def etag(self, version=None, variant=''):
+        """
+        索引版本对应的 ETag 值（不含引号，内容不变则 ETag 不变）
         
+        Args:
+            version: 索引版本号，None 表示当前版本
+            variant: 区分同一版本的不同响应（排序方式、分页），不同查询的 ETag 不会互相命中
+        """
+        return f'files-{SERVER_EPOCH}-{self.version if version is None else version}-{variant}'
+    
+    def _make_entry(self, path, stat):
+        return {
+            'name': path.name,
+            'size': stat.st_size,
+            'size_str': format_size(stat.st_size),
+            'modified': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stat.st_mtime)),
+            'modified_timestamp': stat.st_mtime,
+            'path': str(path.relative_to(Path(__file__).parent)),
+            'url': f'/api/audio/{urllib.parse.quote(path.name)}'  # URL 编码文件名
+        }
+    
+    def _changed(self):
+        """索引内容变化，调用方需持有 self._lock"""
+        self._sorted.clear()
+        self.version += 1
+    
+    def _sync_dir_mtime(self):
+        """
+        发布或删除文件后更新记录的目录 mtime（索引已包含这次变化），
+        避免下一次列表请求把本程序自己的修改当作外部修改而重新扫描；调用方需持有 self._lock
+        """
+        if self._dir_mtime is not None:
+            self._dir_mtime = self._dir_stat_mtime()
+    
+    def _accepts(self, path):
+        return path.suffix.lower() in self.suffixes and path.parent.resolve() == self._resolved_dir
+    
+    def _dir_stat_mtime(self):
         try:
-            # 创建 YoutubeDL 对象并执行下载
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # 先获取视频信息
-                info = ydl.extract_info(url, download=False)
-                video_title = info.get('title', 'Unknown')
-                video_duration = info.get('duration', 0)  # 获取视频时长（秒）
-                
-                with tasks_lock:
-                    tasks_status[task_id]['title'] = video_title
-                    tasks_status[task_id]['message'] = f'开始下载: {video_title}'
-                
-                # 开始下载和转换
-                ydl.download([url])
-                
-                # 获取生成的文件名
-                if '%(title)s' in filename:
-                    generated_filename = ydl.prepare_filename(info).replace('.webm', '.mp3').replace('.m4a', '.mp3')
-                else:
-                    generated_filename = str(MP3_DIR / f'{filename}.mp3')
-        finally:
-            # 恢复原始的 SSL 上下文
-            ssl._create_default_https_context = original_context
-        
-        # 检查是否成功生成了文件
-        if not generated_filename or not os.path.exists(generated_filename):
-            with tasks_lock:
-                tasks_status[task_id]['status'] = 'error'
-                tasks_status[task_id]['message'] = '❌ 错误: 下载失败，未生成音频文件'
-            return
-        
-        # 转换为 Path 对象
-        generated_file_path = Path(generated_filename)
-        base_name = generated_file_path.stem
-        
-        # 更新任务状态为开始分割检查
-        with tasks_lock:
-            tasks_status[task_id]['status'] = 'processing'
-            tasks_status[task_id]['message'] = '正在检查文件大小...'
+            return self.directory.stat().st_mtime_ns
+        except OSError:
+            return 0
+    
+    def refresh_if_stale(self):
+        """
+        目录 mtime 变化时重新扫描（只有一次 stat 的开销）
         
-        # 计算需要分割的段数
-        bitrate_kbps = 192
-        format_type = 'mp3'
+        Returns:
+            bool: 索引内容是否发生了变化
+        """
+        dir_mtime = self._dir_stat_mtime()
+        if dir_mtime == self._dir_mtime:
+            return False
         
-        # 估算文件大小
-        estimated_size_mb = estimate_audio_size(video_duration, bitrate_kbps, format_type) / (1024 * 1024)
+        # 在锁外扫描目录，避免阻塞其他请求
+        entries = {}
+        try:
+            with os.scandir(self.directory) as it:
+                for dir_entry in it:
+                    path = self.directory / dir_entry.name
+                    if path.suffix.lower() not in self.suffixes:
+                        continue
+                    try:
+                        if not dir_entry.is_file():
+                            continue
+                        entries[dir_entry.name] = self._make_entry(path, dir_entry.stat())
+                    except OSError:
+                        continue  # 扫描期间被删除
+        except OSError:
+            pass
         
-        # 记录分割信息
-        print(f"YouTube 视频时长: {format_time(video_duration)}")
-        print(f"预计大小: {estimated_size_mb:.2f} MB")
+        with self._lock:
+            self._dir_mtime = dir_mtime
+            old = self._entries
+            changed = entries.keys() != old.keys() or any(
+                entry['size'] != old[name]['size'] or
+                entry['modified_timestamp'] != old[name]['modified_timestamp']
+                for name, entry in entries.items()
+            )
+            if changed:
+                self._entries = entries
+                self._changed()
+        if changed:
+            notify_files_changed()
+        return changed
+    
+    def publish(self, *paths):
+        """将新生成（或被覆盖）的文件加入索引，并为 MP3 文件建立定位索引"""
+        published = []
+        with self._lock:
+            for path in paths:
+                path = Path(path)
+                if not self._accepts(path):
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                self._entries[path.name] = self._make_entry(path, stat)
+                published.append(path)
+            if published:
+                self._changed()
+                self._sync_dir_mtime()
+        if published:
+            notify_files_changed()
+            seek_index.build(*published)
+    
+    def discard(self, *paths):
+        """将已删除的文件移出索引"""
+        discarded = []
+        with self._lock:
+            for path in paths:
+                path = Path(path)
+                if self._accepts(path) and self._entries.pop(path.name, None) is not None:
+                    discarded.append(path)
+            if discarded:
+                self._changed()
+                self._sync_dir_mtime()
+        if discarded:
+            notify_files_changed()
+            seek_index.discard(*discarded)
+    
+    def listing(self, sort='modified', descending=True, offset=0, limit=None):
+        """
+        按指定顺序返回一页文件条目
         
-        # 如果实际文件存在，使用实际大小
-        if generated_file_path.exists():
-            actual_size_mb = generated_file_path.stat().st_size / (1024 * 1024)
-            print(f"实际大小: {actual_size_mb:.2f} MB")
+        Returns:
+            tuple: (条目列表, 文件总数, 版本号)
+        """
+        self.refresh_if_stale()
+        key = (sort, descending)
+        with self._lock:
+            ordered = self._sorted.get(key)
+            if ordered is None:
+                ordered = sorted(self._entries.values(), key=FILE_SORT_KEYS[sort], reverse=descending)
+                self._sorted[key] = ordered
+            end = None if limit is None else offset + limit
+            return ordered[offset:end], len(ordered), self.version
+
+
+file_index = FileIndex(MP3_DIR, suffixes=AUDIO_MIME_TYPES)
+
+
+# =========================================================================
+# MP3 定位索引（时间 -> 帧的字节偏移，按时间定位播放位置）
+# =========================================================================
+
+# 每隔多少帧记录一个偏移（MPEG1 Layer III 每帧约 26 毫秒，32 帧约 0.84 秒），其间的帧定位时逐帧读取帧头
+SEEK_INDEX_FRAME_STEP = 32
+# 内存中保留的定位索引数（其余的从磁盘读取）
+SEEK_INDEX_CACHE_SIZE = 64
+# MPEG 音频帧的最大长度（Layer II 384kbps / 32kHz 约 1.7 KB），逐帧定位时按此预读
+MP3_MAX_FRAME_SIZE = 2048
+
+
+@dataclass(slots=True)
+class Mp3SeekTable:
+    """单个 MP3 文件的定位索引：offsets[i] 为第 i × frame_step 帧的字节偏移"""
+    size: int  # 建立索引时的文件大小和修改时间，不一致时索引失效
+    mtime_ns: int
+    frame_step: int
+    seconds_per_frame: float
+    frame_count: int
+    audio_end: int  # 最后一个音频帧的结束偏移
+    offsets: array
+    
+    @property
+    def duration(self):
+        return self.frame_count * self.seconds_per_frame
+    
+    def locate(self, path, seconds):
+        """
+        查找包含指定时间点的帧
         
-        # 获取音频时长
-        audio_duration = get_video_duration(generated_file_path)
-        if audio_duration <= 0:
-            audio_duration = video_duration  # 使用视频时长作为备选
+        Args:
+            path: MP3 文件路径（逐帧定位时读取帧头）
+            seconds: 时间点（秒），超过时长时定位到音频数据末尾
         
-        # 计算需要分割的段数
-        segments = calculate_segments(
-            audio_duration, 
-            max_size_mb=90, 
-            bitrate_kbps=bitrate_kbps, 
-            format=format_type
-        )
+        Returns:
+            tuple: (帧的字节偏移, 帧的开始时间)
+        """
+        frame_no = max(0, int(seconds / self.seconds_per_frame))
+        if frame_no >= self.frame_count:
+            return self.audio_end, self.duration
         
-        # 如果需要分割
-        if len(segments) > 1:
-            with tasks_lock:
-                tasks_status[task_id]['status'] = 'processing'
-                tasks_status[task_id]['message'] = f'文件过大，正在分割为 {len(segments)} 个文件...'
-                tasks_status[task_id]['progress'] = '100%'
-            
-            # 记录分割信息
-            print(f"需要分割为 {len(segments)} 段")
-            
-            for i, (start, end) in enumerate(segments, 1):
-                print(f"段 {i}: {format_time(start)} - {format_time(end)}")
-            
+        entry = frame_no // self.frame_step
+        offset = self.offsets[entry]
+        skip = frame_no - entry * self.frame_step
+        walked = 0
+        if skip:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(skip * MP3_MAX_FRAME_SIZE + 4)
+            pos = 0
+            while walked < skip:
+                frame = parse_mp3_frame_header(data[pos:pos + 4])
+                if frame is None:
+                    break  # 帧之间夹杂了其他数据：停在最后一个确认的帧边界
+                pos += frame['frame_size']
+                walked += 1
+            offset += pos
+        return offset, (entry * self.frame_step + walked) * self.seconds_per_frame
+
+
+def build_seek_table(path, stat=None):
+    """
+    扫描 MP3 文件建立定位索引
+    
+    Returns:
+        Mp3SeekTable
+    
+    Raises:
+        ValueError: 不是可以解析的 MPEG 音频流
+    """
+    stat = stat or os.stat(path)
+    index = index_mp3_frames(path)
+    offsets = index['offsets']
+    return Mp3SeekTable(
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        frame_step=SEEK_INDEX_FRAME_STEP,
+        seconds_per_frame=index['frame']['samples'] / index['frame']['sample_rate'],
+        frame_count=len(offsets) - 1,
+        audio_end=offsets[-1],
+        offsets=offsets[:-1:SEEK_INDEX_FRAME_STEP],
+    )
+
+
+class SeekIndexStore:
+    """
+    MP3 定位索引的磁盘缓存（SQLite），最近使用的索引同时保存在内存中
+    
+    文件发布时（FileIndex.publish）建立索引；没有索引或文件已变化时，在首次按时间定位时建立。
+    """
+    
+    def __init__(self, db_path, cache_size):
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # 文件名 -> Mp3SeekTable
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS seek_index (
+                filename TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                frame_step INTEGER NOT NULL,
+                seconds_per_frame REAL NOT NULL,
+                frame_count INTEGER NOT NULL,
+                audio_end INTEGER NOT NULL,
+                offsets BLOB NOT NULL
+            )
+        ''')
+        self._db.commit()
+        self.hits = 0
+        self.builds = 0
+    
+    def _remember(self, name, table):
+        """加入内存缓存，调用方需持有 self._lock"""
+        self._memory[name] = table
+        self._memory.move_to_end(name)
+        while len(self._memory) > self.cache_size:
+            self._memory.popitem(last=False)
+    
+    def _load(self, name, stat):
+        """读取与文件当前大小和修改时间一致的索引，没有时返回 None，调用方需持有 self._lock"""
+        table = self._memory.get(name)
+        if table is not None and (table.size, table.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            self._memory.move_to_end(name)
+            return table
+        row = self._db.execute(
+            'SELECT size, mtime_ns, frame_step, seconds_per_frame, frame_count, audio_end, offsets '
+            'FROM seek_index WHERE filename = ?', (name,)
+        ).fetchone()
+        if row is None or (row[0], row[1]) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        offsets = array('Q')
+        offsets.frombytes(row[6])
+        table = Mp3SeekTable(*row[:6], offsets)
+        self._remember(name, table)
+        return table
+    
+    def build(self, *paths):
+        """为新发布的 MP3 文件建立（或重建）索引，其他文件忽略"""
+        for path in paths:
+            path = Path(path)
+            if path.suffix.lower() != '.mp3':
+                continue
             try:
-                # 提取并分割音频
-                output_files = extract_audio_segments(
-                    generated_file_path,
-                    MP3_DIR,
-                    base_name,
-                    segments,
-                    output_format=format_type,
-                    bitrate_kbps=bitrate_kbps
+                table = build_seek_table(path)
+            except (OSError, ValueError) as e:
+                print(f"建立定位索引失败: {path.name} - {e}")
+                continue
+            with self._lock:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO seek_index '
+                    '(filename, size, mtime_ns, frame_step, seconds_per_frame, frame_count, audio_end, offsets) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        path.name, table.size, table.mtime_ns, table.frame_step, table.seconds_per_frame,
+                        table.frame_count, table.audio_end, table.offsets.tobytes(),
+                    )
                 )
-                
-                # 删除原始文件
-                os.remove(generated_file_path)
-                
-                print(f"音频分割完成，共生成 {len(output_files)} 个文件")
-                for file_info in output_files:
-                    print(f"- {file_info['filename']} ({file_info['size'] / (1024 * 1024):.2f} MB)")
-                    
-                with tasks_lock:
-                    tasks_status[task_id]['segments'] = len(output_files)
-            except Exception as e:
-                print(f"音频分割失败: {e}")
-                traceback.print_exc()
-                with tasks_lock:
-                    tasks_status[task_id]['status'] = 'error'
-                    tasks_status[task_id]['message'] = f'❌ 错误: 音频分割失败 - {str(e)}'
-                return
-        else:
-            print("音频文件大小在限制范围内，不需要分割")
+                self._db.commit()
+                self._remember(path.name, table)
+                self.builds += 1
+    
+    def get(self, path):
+        """
+        取文件的定位索引，没有或已失效时立即建立
         
-        # 任务完成
-        import time
-        with tasks_lock:
-            start_time = tasks_status[task_id].get('start_time', time.time())
-            total_time = time.time() - start_time
-            
-            tasks_status[task_id]['status'] = 'completed'
-            tasks_status[task_id]['progress'] = '100%'
-            tasks_status[task_id]['progress_percent'] = 100
-            tasks_status[task_id]['message'] = '✅ 下载完成！'
-            tasks_status[task_id]['elapsed_time'] = total_time
-            tasks_status[task_id]['elapsed_str'] = format_time(total_time)
-            tasks_status[task_id]['completed_time'] = time.time()
-            
-    except Exception as e:
-        # 发生错误，记录错误信息
-        with tasks_lock:
-            tasks_status[task_id]['status'] = 'error'
-            tasks_status[task_id]['message'] = f'❌ 错误: {str(e)}'
+        Returns:
+            Mp3SeekTable: 无法解析为 MP3 时返回 None
+        """
+        path = Path(path)
+        stat = path.stat()
+        with self._lock:
+            table = self._load(path.name, stat)
+            if table is not None:
+                self.hits += 1
+                return table
+        self.build(path)
+        with self._lock:
+            return self._load(path.name, stat)
+    
+    def discard(self, *paths):
+        """删除已删除文件的索引"""
+        with self._lock:
+            for path in paths:
+                name = Path(path).name
+                self._memory.pop(name, None)
+                self._db.execute('DELETE FROM seek_index WHERE filename = ?', (name,))
+            self._db.commit()
+    
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute('SELECT COUNT(*) FROM seek_index').fetchone()[0]
+            return {
+                'entries': entries,
+                'in_memory': len(self._memory),
+                'hits': self.hits,
+                'builds': self.builds,
+            }
+
+
+seek_index = SeekIndexStore(DATA_DIR / 'seek.db', SEEK_INDEX_CACHE_SIZE)
+
+
+def parse_time_range(start, end=None):
+    """
+    解析按时间定位的起止时间（秒）
+    
+    Args:
+        start: 开始时间字符串
+        end: 结束时间字符串，None 或空表示到文件末尾
+    
+    Returns:
+        tuple: (开始秒数, 结束秒数或 None)，格式错误时返回 None
+    """
+    try:
+        start_seconds = float(start)
+        end_seconds = float(end) if end not in (None, '') else None
+    except ValueError:
+        return None
+    if not math.isfinite(start_seconds) or start_seconds < 0:
+        return None
+    if end_seconds is not None and (not math.isfinite(end_seconds) or end_seconds <= start_seconds):
+        return None
+    return start_seconds, end_seconds
+
+
+# =========================================================================
+# 任务调度器（有界工作线程池 + 优先级队列）
+# =========================================================================
+
+# 工作线程数：同时处于运行状态的任务上限
+MAX_WORKERS = int(os.environ.get('V2V_MAX_WORKERS', 4))
+# 网络密集阶段（解析、下载）的并发上限
+NETWORK_CONCURRENCY = int(os.environ.get('V2V_NETWORK_CONCURRENCY', 4))
+# CPU 密集阶段（转码、分割）的并发上限，默认等于 CPU 核数
+CPU_CONCURRENCY = int(os.environ.get('V2V_CPU_CONCURRENCY', os.cpu_count() or 2))
+# 单个任务内分段并行编码的最大并行度（实际还受 CPU 槽位空闲数限制）
+SEGMENT_WORKERS = int(os.environ.get('V2V_SEGMENT_WORKERS', CPU_CONCURRENCY))
+
+
+class JobScheduler:
+    """
+    任务调度器
+    使用固定数量的工作线程从优先级队列（同优先级按 FIFO）中取任务执行，
+    并用两个信号量分别限制网络阶段和 CPU 阶段的并发数
+    """
+
+    def __init__(self, max_workers, network_slots, cpu_slots):
+        self.max_workers = max(1, max_workers)
+        # 等待队列，元素为 (-priority, -seq, task_id, func, args)，按升序保存，
+        # 即下一个要执行的任务在列表末尾，出队用 O(1) 的 pop()
+        self._queue = []
+        self._keys = {}  # task_id -> (-priority, -seq)，用于二分查找排队位置
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._slots = {
+            'network': threading.BoundedSemaphore(max(1, network_slots)),
+            'cpu': threading.BoundedSemaphore(max(1, cpu_slots)),
+        }
+        # 每个工作线程当前占用的阶段槽位
+        self._local = threading.local()
+
+    def submit(self, task_id, func, *args, priority=0):
+        """
+        提交任务到队列
+
+        Args:
+            task_id: 任务 ID
+            func: 任务函数
+            args: 任务函数参数
+            priority: 优先级，数值越小越先执行
+        """
+        with self._cond:
+            entry = (-priority, -next(self._seq), task_id, func, args)
+            bisect.insort(self._queue, entry)
+            self._keys[task_id] = entry[:2]
+            self._ensure_workers()
+            self._cond.notify()
+
+    def queue_length(self):
+        with self._cond:
+            return len(self._queue)
+
+    def queue_position(self, task_id):
+        """
+        任务的排队位置（从 1 开始），不在队列中时返回 0
+        排队位置不写入任务状态，在输出状态时按需计算
+
+        Args:
+            task_id: 任务 ID
+        """
+        with self._cond:
+            key = self._keys.get(task_id)
+            return 0 if key is None else len(self._queue) - bisect.bisect_left(self._queue, key)
+
+    def queued_task_ids(self):
+        """按执行顺序返回排队中的任务 ID"""
+        with self._cond:
+            return [entry[2] for entry in reversed(self._queue)]
+
+    def enter_stage(self, kind):
+        """
+        切换当前工作线程所处的阶段（'network' 或 'cpu'）
+        先释放旧阶段的槽位再申请新槽位，避免占有并等待造成死锁
+
+        Args:
+            kind: 阶段类型
+        """
+        current = getattr(self._local, 'stage', None)
+        if current == kind:
+            return
+        self.leave_stage()
+        self._slots[kind].acquire()
+        self._local.stage = kind
+
+    def leave_stage(self):
+        """释放当前工作线程占用的阶段槽位"""
+        current = getattr(self._local, 'stage', None)
+        if current is not None:
+            self._local.stage = None
+            self._slots[current].release()
+
+    def holds_stage(self, kind):
+        """当前线程是否占用着指定阶段的槽位"""
+        return getattr(self._local, 'stage', None) == kind
+
+    def borrow_slots(self, kind, wanted, block_first=False):
+        """
+        额外借用槽位（用于任务内部的并行处理）
+        只做非阻塞申请，借不到就少借，避免多个任务互相等待
+
+        Args:
+            kind: 阶段类型
+            wanted: 希望借用的数量
+            block_first: 为 True 时第一个槽位阻塞等待，保证至少借到一个
+
+        Returns:
+            int: 实际借到的数量，用完后需调用 return_slots 归还
+        """
+        got = 0
+        if block_first and wanted > 0:
+            self._slots[kind].acquire()
+            got = 1
+        while got < wanted and self._slots[kind].acquire(blocking=False):
+            got += 1
+        return got
+
+    def return_slots(self, kind, count):
+        """归还通过 borrow_slots 借用的槽位"""
+        for _ in range(count):
+            self._slots[kind].release()
+
+    def _ensure_workers(self):
+        # 调用方需持有 self._cond
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f'v2v-worker-{len(self._workers) + 1}',
+                daemon=True  # 守护线程，主程序退出时自动结束
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, _, task_id, func, args = self._queue.pop()
+                self._keys.pop(task_id, None)
+
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"任务 {task_id} 执行异常: {e}")
+                traceback.print_exc()
+            finally:
+                self.leave_stage()
+
+
+scheduler = JobScheduler(MAX_WORKERS, NETWORK_CONCURRENCY, CPU_CONCURRENCY)
+
+
+# =========================================================================
+# 输出档位（编码、CBR/VBR、比特率、采样率、分段大小上限）
+# =========================================================================
+
+# 单个输出文件的默认大小上限（MB），超过时分割为多个文件
+MAX_PART_MB = float(os.environ.get('V2V_MAX_PART_MB', 90))
+# LAME VBR 质量等级（-q:a 0~9）对应码率范围的上限（kbps），按上限估算大小保证分段不超限
+LAME_VBR_MAX_KBPS = (260, 250, 210, 195, 185, 150, 130, 120, 105, 85)
+
+
+@dataclass(frozen=True)
+class OutputProfile:
+    """
+    命名的输出档位
+    codec 为 mp3 / wav / original（保留源音频编码，无法直接保存时按默认档位转码）
+    """
+    name: str
+    label: str
+    codec: str = 'mp3'
+    bitrate_kbps: int = 192  # CBR 比特率（vbr_quality 为 None 时使用）
+    vbr_quality: Optional[int] = None  # LAME VBR 质量等级 0~9（0 最高），设置后使用 VBR
+    sample_rate: int = 44100
+    max_part_mb: float = MAX_PART_MB
+    
+    @property
+    def nominal_kbps(self):
+        """估算文件大小用的比特率：VBR 取该质量等级码率范围的上限，WAV 按 16 位立体声计算"""
+        if self.codec == 'wav':
+            return self.sample_rate * 16 * 2 / 1000
+        if self.vbr_quality is not None:
+            return LAME_VBR_MAX_KBPS[self.vbr_quality]
+        return self.bitrate_kbps
+    
+    def codec_params(self):
+        """
+        重新编码时的 ffmpeg 编码参数（含采样率）
+        
+        Returns:
+            list: ffmpeg 参数
+        """
+        if self.codec == 'wav':
+            params = ['-acodec', 'pcm_s16le']
+        elif self.vbr_quality is not None:
+            params = ['-acodec', 'libmp3lame', '-q:a', str(self.vbr_quality)]
+        else:
+            params = ['-acodec', 'libmp3lame', '-b:a', f'{self.bitrate_kbps}k']
+        return params + ['-ar', str(self.sample_rate)]
+    
+    def postprocessor_quality(self):
+        """yt-dlp FFmpegExtractAudioPP 的 preferredquality：小于 10 表示 VBR 质量等级，否则为比特率"""
+        return str(self.vbr_quality if self.vbr_quality is not None else self.bitrate_kbps)
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'label': self.label,
+            'codec': self.codec,
+            'mode': 'vbr' if self.vbr_quality is not None else 'cbr',
+            'bitrate_kbps': self.bitrate_kbps,
+            'vbr_quality': self.vbr_quality,
+            'sample_rate': self.sample_rate,
+            'max_part_mb': self.max_part_mb,
+        }
+
+
+def load_output_profiles(overrides):
+    """
+    内置档位加上 V2V_OUTPUT_PROFILES 中的自定义档位（JSON 对象：档位名 -> OutputProfile 字段），
+    同名时覆盖内置档位的对应字段
+    
+    Args:
+        overrides: JSON 字符串，为空时只使用内置档位
+    
+    Returns:
+        dict: 档位名 -> OutputProfile
+    """
+    profiles = {
+        'mp3': OutputProfile('mp3', 'MP3 192kbps'),
+        'mp3-128': OutputProfile('mp3-128', 'MP3 128kbps（体积小）', bitrate_kbps=128),
+        'mp3-320': OutputProfile('mp3-320', 'MP3 320kbps（高音质）', bitrate_kbps=320),
+        'mp3-vbr': OutputProfile('mp3-vbr', 'MP3 VBR（V2，约 190kbps）', vbr_quality=2),
+        'wav': OutputProfile('wav', 'WAV（无损，体积大）', codec='wav'),
+        'original': OutputProfile('original', '原始编码（不转码，AAC 存为 M4A、Opus 存为 OPUS）', codec='original'),
+    }
+    if overrides:
+        for name, options in json.loads(overrides).items():
+            base = profiles.get(name, OutputProfile(name, name))
+            profile = replace(base, **dict(options, name=name))
+            if profile.codec not in ('mp3', 'wav', 'original'):
+                raise ValueError(f'输出档位 {name} 的编码不受支持: {profile.codec}')
+            if profile.vbr_quality is not None and not 0 <= profile.vbr_quality <= 9:
+                raise ValueError(f'输出档位 {name} 的 VBR 质量等级应为 0~9: {profile.vbr_quality}')
+            profiles[name] = profile
+    return profiles
+
+
+# 档位名也是下载结果复用的键的一部分，修改已有档位的参数后旧结果不会自动失效
+OUTPUT_PROFILES = load_output_profiles(os.environ.get('V2V_OUTPUT_PROFILES'))
+DEFAULT_PROFILE = 'mp3'
+
+
+def get_output_profile(name):
+    """按名称取输出档位，未知名称时返回默认档位"""
+    return OUTPUT_PROFILES.get(name) or OUTPUT_PROFILES[DEFAULT_PROFILE]
+
+
+# =========================================================================
+# 下载去重（按视频 ID 复用已完成的结果，合并进行中的相同下载）
+# =========================================================================
+
+
+# 离线匹配 URL 用的提取器类（不含通用提取器：只能靠网络识别的 URL 不做去重）
+_video_extractors = None
+
+
+@functools.lru_cache(maxsize=1024)
+def match_extractor(url):
+    """
+    按 yt-dlp 的规则找出处理该 URL 的提取器类（与 yt-dlp 一样取第一个匹配的），不发起网络请求
+    
+    Returns:
+        提取器类；只有通用提取器能处理时返回 None
+    """
+    global _video_extractors
+    if _video_extractors is None:
+        _video_extractors = [ie for ie in gen_extractor_classes() if ie.ie_key() != 'Generic']
+    try:
+        for ie in _video_extractors:
+            if ie.suitable(url):
+                return ie
+    except Exception as e:
+        print(f"URL 匹配提取器失败: {e}")
+    return None
+
+
+def url_return_type(url):
+    """
+    离线判断 URL 指向单个视频还是播放列表/频道
+    
+    Returns:
+        str: 'video' / 'playlist'；两者皆有可能（如 YouTube 的 watch?v=…&list=…）或无法识别时返回 None
+    """
+    ie = match_extractor(url)
+    return_type = getattr(ie, '_RETURN_TYPE', None)
+    return return_type if return_type in ('video', 'playlist') else None
+
+
+@functools.lru_cache(maxsize=1024)
+def resolve_video_key(url):
+    """
+    用 yt-dlp 提取器的 URL 规则把 URL 归一化为 (提取器, 视频 ID)，不发起网络请求
+    youtu.be/…、watch?v=…&t=… 等不同写法会得到同一个键
+    
+    Args:
+        url: 用户提交的 URL
+    
+    Returns:
+        tuple: (提取器名, 视频 ID)；无法识别，或 URL 可能指向播放列表时返回 None
+    """
+    if url_return_type(url) != 'video':
+        return None
+    ie = match_extractor(url)
+    try:
+        video_id = ie.get_temp_id(url)
+    except Exception as e:
+        print(f"URL 归一化失败: {e}")
+        return None
+    return (ie.ie_key(), video_id) if video_id else None
+
+
+class DownloadRegistry:
+    """
+    按 (提取器, 视频 ID, 输出档位) 记录下载结果和进行中的下载
+    
+    同一视频已有完成的输出文件时，新任务直接复用；正在下载时，新任务挂到
+    进行中的任务上等待其结果，而不是再下载、转码一次（也避免按标题命名时互相覆盖）
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}  # key -> {'title', 'files'}
+        self._inflight = {}  # key -> (主任务 ID, 挂起的任务 ID 列表)
+    
+    def claim(self, key, task_id):
+        """
+        为新任务登记下载，判断和登记在同一把锁内完成
+        
+        Returns:
+            tuple: ('cached', 结果) / ('attached', 主任务 ID) / ('primary', None)
+        """
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                if all((MP3_DIR / name).exists() for name in result['files']):
+                    return 'cached', result
+                del self._results[key]  # 输出文件已被删除，重新下载
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                inflight[1].append(task_id)
+                return 'attached', inflight[0]
+            self._inflight[key] = (task_id, [])
+            return 'primary', None
+    
+    def finish(self, key, task_id, result=None):
+        """
+        主任务结束，result 为 None 表示失败
+        
+        Returns:
+            list: 挂在该任务上的任务 ID
+        """
+        with self._lock:
+            inflight = self._inflight.get(key)
+            if inflight is None or inflight[0] != task_id:
+                return []
+            del self._inflight[key]
+            if result is not None:
+                self._results[key] = result
+            return inflight[1]
+
+
+download_registry = DownloadRegistry()
+
+
+def run_download_job(url, filename, task_id, key=None, video_key=None, profile=DEFAULT_PROFILE):
+    """
+    调度器执行的下载任务：下载结束后把结果（或错误）同步给挂起的相同视频任务
+    
+    Args:
+        url: 视频 URL
+        filename: 保存的文件名（不含扩展名）
+        task_id: 任务 ID
+        key: download_registry 的键，None 表示不参与去重
+        video_key: (提取器, 视频 ID)，URL 无法离线识别、但已解析出视频 ID 时传入
+        profile: 输出档位（见 OUTPUT_PROFILES）
+    """
+    try:
+        download_audio(url, filename, task_id, video_key, profile)
+    finally:
+        if key is not None:
+            result = None
+            message = '❌ 错误: 下载失败'
+            try:
+                # 任务记录可能已被清除或按保留策略淘汰
+                task = tasks_status.get(task_id)
+                if task is not None:
+                    with task.lock:
+                        status, title, files = task.status, task.title, list(task.output_files)
+                        message = task.message or message
+                    if status == 'completed' and files:
+                        result = {'title': title, 'files': files}
+            finally:
+                # 无论如何都要结束登记，否则之后相同视频的任务会一直挂起等待
+                followers = download_registry.finish(key, task_id, result)
+            for follower_id in followers:
+                if result is not None:
+                    complete_from_existing(follower_id, result)
+                else:
+                    update_task(follower_id, status='error', message=f'{message}（同一视频的任务 {task_id}）')
+
+
+def complete_from_existing(task_id, result):
+    """
+    直接用同一视频已有的输出文件完成任务
+    
+    Args:
+        task_id: 任务 ID
+        result: download_registry 中记录的结果 {'title', 'files'}
+    """
+    files = list(result['files'])
+    update_task(task_id, title=result['title'], segments=len(files) if len(files) > 1 else 0)
+    mark_task_completed(task_id, files, message=f'✅ 已复用相同视频的音频: {", ".join(files)}')
+
+
+# =========================================================================
+# 元数据缓存（SQLite，按提取器 + 视频 ID 缓存 yt-dlp 的解析结果）
+# =========================================================================
+
+# 缓存有效期（秒）：超过后重新解析；流媒体地址自带的过期时间更早时以其为准
+METADATA_CACHE_TTL = float(os.environ.get('V2V_METADATA_CACHE_TTL', 3 * 3600))
+# 缓存条目上限，超过后淘汰最久未使用的条目
+METADATA_CACHE_SIZE = int(os.environ.get('V2V_METADATA_CACHE_SIZE', 1000))
+# 流媒体地址剩余有效期不足此值（秒）时视为过期，避免下载到一半地址失效
+FORMAT_URL_MIN_LIFETIME = 300
+
+# 下载用不到、但体积很大的字段，写入缓存前删除
+METADATA_DROP_FIELDS = ('automatic_captions', 'subtitles', 'thumbnails', 'heatmap', 'chapters')
+
+
+class MetadataCache:
+    """
+    yt-dlp 解析结果的磁盘缓存
+    
+    保存经 sanitize_info 处理（可 JSON 序列化）的信息字典，重试和重复提交时
+    直接交给 process_ie_result 下载，省去 extract_info 的网络往返。
+    另存标题、时长、选中的格式和大小，便于查看。
+    """
+    
+    def __init__(self, db_path, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                title TEXT,
+                duration REAL,
+                format_id TEXT,
+                filesize INTEGER,
+                extract_time REAL,
+                info BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS metadata_last_used ON metadata (last_used)')
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def make_key(extractor, video_id):
+        return f'{extractor}:{video_id}'
+    
+    @staticmethod
+    def _format_urls_expire_at(info):
+        """返回所选格式地址中最早的过期时间（地址里的 expire 参数），没有时返回 None"""
+        expires = []
+        for fmt in info.get('requested_formats') or [info]:
+            query = urllib.parse.urlparse(fmt.get('url') or '').query
+            value = urllib.parse.parse_qs(query).get('expire')
+            if value and value[0].isdigit():
+                expires.append(int(value[0]))
+        return min(expires) if expires else None
+    
+    def get(self, key):
+        """
+        查询缓存
+        
+        Returns:
+            tuple: (信息字典, 当初解析的耗时)；未命中或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT info, created_at, extract_time FROM metadata WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            info = json.loads(zlib.decompress(row[0]))
+            expire_at = self._format_urls_expire_at(info)
+            if now - row[1] > self.ttl or (expire_at is not None and expire_at - now < FORMAT_URL_MIN_LIFETIME):
+                self._db.execute('DELETE FROM metadata WHERE key = ?', (key,))
+                self._db.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE metadata SET last_used = ? WHERE key = ?', (now, key))
+            self._db.commit()
+            self.hits += 1
+            return info, row[2]
+    
+    def put(self, key, info, extract_time):
+        """写入解析结果，并按条目上限淘汰最久未使用的条目"""
+        info = yt_dlp.YoutubeDL.sanitize_info(info)
+        for name in METADATA_DROP_FIELDS:
+            info.pop(name, None)
+        blob = zlib.compress(json.dumps(info, ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO metadata '
+                '(key, title, duration, format_id, filesize, extract_time, info, created_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    key, info.get('title'), info.get('duration'), info.get('format_id'),
+                    info.get('filesize') or info.get('filesize_approx'), extract_time,
+                    blob, now, now,
+                )
+            )
+            cursor = self._db.execute(
+                'DELETE FROM metadata WHERE key IN '
+                '(SELECT key FROM metadata ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            self.evictions += max(cursor.rowcount, 0)
+            self._db.commit()
+    
+    def invalidate(self, key):
+        """删除条目（缓存的格式地址已失效时调用）"""
+        with self._lock:
+            self._db.execute('DELETE FROM metadata WHERE key = ?', (key,))
+            self._db.commit()
+            self.invalidations += 1
+    
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0,
+                'expired': self.expired,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+            }
+
+
+metadata_cache = MetadataCache(DATA_DIR / 'metadata.db', METADATA_CACHE_TTL, METADATA_CACHE_SIZE)
+
+
+# =========================================================================
+# 持久化任务存储（SQLite，服务重启后恢复未完成的任务）
+# =========================================================================
+
+# 任务状态 -> 持久化记录的处理阶段
+# 'starting'（解析中）仍记为 queued：播放列表任务在子任务全部写库后才进入 downloading，
+# 解析或展开途中重启时按 queued 重新展开
+JOB_STAGES = {
+    'pending': 'queued',
+    'starting': 'queued',
+    'downloading': 'downloading',
+    'converting': 'transcoding',
+    'processing': 'splitting',
+    'completed': 'done',
+    'error': 'error',
+}
+# 已结束的阶段，重启时不再恢复
+JOB_FINISHED_STAGES = ('done', 'error')
+
+
+class JobStore:
+    """
+    下载任务的持久化记录
+    
+    每个任务保存 URL、文件名、优先级和当前阶段（queued / downloading /
+    transcoding / splitting / done / error），只在阶段变化时写库。
+    服务重启后据此重新排队未完成的任务；下载中的 .part 文件路径也记录在此，
+    恢复时保留该文件，由 yt-dlp 断点续传。开始写入 MP3 目录的输出文件路径同样记录，
+    恢复时删除未完成的输出，避免文件列表提供截断的文件。
+    """
+    
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._stages = {}  # task_id -> 最近写入的阶段（只含未结束的持久化任务）
+        self._partials = {}  # task_id -> 最近写入的 .part 文件路径
+        self._outputs = {}  # task_id -> 最近写入的输出文件路径
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')  # WAL 模式下断电最多丢失最近的提交
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                task_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                filename TEXT NOT NULL DEFAULT '',
+                priority INTEGER NOT NULL DEFAULT 0,
+                stage TEXT NOT NULL,
+                message TEXT,
+                partial_path TEXT,
+                kind TEXT NOT NULL DEFAULT 'download',
+                parent_id TEXT,
+                profile TEXT NOT NULL DEFAULT 'mp3',
+                output_path TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        # 旧版本创建的表没有 kind / parent_id / profile / output_path 列
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(jobs)')}
+        if 'kind' not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN kind TEXT NOT NULL DEFAULT 'download'")
+        if 'parent_id' not in columns:
+            self._db.execute('ALTER TABLE jobs ADD COLUMN parent_id TEXT')
+        if 'profile' not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN profile TEXT NOT NULL DEFAULT 'mp3'")
+        if 'output_path' not in columns:
+            self._db.execute('ALTER TABLE jobs ADD COLUMN output_path TEXT')
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_stage ON jobs (stage)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_parent ON jobs (parent_id)')
+        self._db.commit()
+    
+    def add(self, task_id, url, filename, priority, kind='download', parent_id=None, profile=DEFAULT_PROFILE):
+        """登记新提交的任务（阶段为 queued）"""
+        self.add_many([(task_id, url, filename, priority, kind, parent_id, profile)])
+    
+    def add_many(self, jobs):
+        """
+        在一个事务中登记多个任务
+        
+        Args:
+            jobs: (task_id, url, filename, priority, kind, parent_id, profile) 列表
+        """
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO jobs '
+                '(task_id, url, filename, priority, stage, kind, parent_id, profile, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [job[:4] + ('queued',) + job[4:] + (now, now) for job in jobs]
+            )
+            self._db.commit()
+            for job in jobs:
+                self._stages[job[0]] = 'queued'
+    
+    def convert_to_download(self, task_id, url):
+        """播放列表任务经解析发现是单个视频：改为普通下载任务，URL 换成规范地址"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET kind = 'download', url = ?, updated_at = ? WHERE task_id = ?",
+                (url, time.time(), task_id)
+            )
+            self._db.commit()
+    
+    def resume(self, task_id, partial_path=None, stage='queued'):
+        """
+        重新跟踪重启前未完成的任务，阶段回到 queued（已展开的播放列表保持 downloading；保留 .part 路径，
+        未完成的输出已由 cleanup_orphaned_files 删除，清空输出路径）
+        """
+        with self._lock:
+            self._db.execute(
+                'UPDATE jobs SET stage = ?, output_path = NULL, updated_at = ? WHERE task_id = ?',
+                (stage, time.time(), task_id)
+            )
+            self._db.commit()
+            self._stages[task_id] = stage
+            if partial_path:
+                self._partials[task_id] = partial_path
+    
+    def record_status(self, task_id, status, changes):
+        """
+        任务状态变化时调用（见 update_task），阶段不变或不是持久化任务时不写库
+        
+        Args:
+            task_id: 任务 ID
+            status: 新的任务状态
+            changes: 本次更新的全部字段（出错时保存 message）
+        """
+        stage = JOB_STAGES.get(status)
+        with self._lock:
+            current = self._stages.get(task_id)
+            if current is None or stage is None or stage == current:
+                return
+            self._db.execute(
+                'UPDATE jobs SET stage = ?, message = ?, updated_at = ? WHERE task_id = ?',
+                (stage, changes.get('message'), time.time(), task_id)
+            )
+            if stage in JOB_FINISHED_STAGES:
+                self._db.execute('UPDATE jobs SET partial_path = NULL, output_path = NULL WHERE task_id = ?', (task_id,))
+                self._stages.pop(task_id, None)
+                self._partials.pop(task_id, None)
+                self._outputs.pop(task_id, None)
+            else:
+                self._stages[task_id] = stage
+            self._db.commit()
+    
+    def record_partial(self, task_id, path):
+        """记录任务正在写入的 .part 文件（路径不变时不写库）"""
+        with self._lock:
+            if not path or task_id not in self._stages or self._partials.get(task_id) == path:
+                return
+            self._partials[task_id] = path
+            self._db.execute('UPDATE jobs SET partial_path = ? WHERE task_id = ?', (path, task_id))
+            self._db.commit()
+    
+    def record_output(self, task_id, path):
+        """
+        记录任务开始写入的输出文件（下载完成的源音频，或分段输出的名义路径），路径不变时不写库
+        重启时删除该文件及同名的转换结果和分段（见 cleanup_orphaned_files）
+        """
+        path = str(path) if path else None
+        with self._lock:
+            if not path or task_id not in self._stages or self._outputs.get(task_id) == path:
+                return
+            self._outputs[task_id] = path
+            self._db.execute('UPDATE jobs SET output_path = ? WHERE task_id = ?', (path, task_id))
+            self._db.commit()
+    
+    def unfinished(self):
+        """按提交顺序返回未结束的任务记录"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT task_id, url, filename, priority, stage, partial_path, kind, parent_id, profile, output_path FROM jobs '
+                'WHERE stage NOT IN (?, ?) ORDER BY created_at, rowid',
+                JOB_FINISHED_STAGES
+            ).fetchall()
+        columns = (
+            'task_id', 'url', 'filename', 'priority', 'stage', 'partial_path', 'kind', 'parent_id', 'profile', 'output_path'
+        )
+        return [dict(zip(columns, row)) for row in rows]
+    
+    def child_counts(self, parent_id):
+        """
+        统计播放列表任务的子任务
+        
+        Returns:
+            tuple: (子任务总数, 已完成数, 失败数)
+        """
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT stage, COUNT(*) FROM jobs WHERE parent_id = ? GROUP BY stage', (parent_id,)
+            ).fetchall()
+        counts = dict(rows)
+        return sum(counts.values()), counts.get('done', 0), counts.get('error', 0)
+    
+    def delete_children(self, parent_id):
+        """删除播放列表任务的子任务记录（展开中途中断，重启后重新展开时调用）"""
+        with self._lock:
+            self._db.execute('DELETE FROM jobs WHERE parent_id = ?', (parent_id,))
+            self._db.commit()
+    
+    def max_task_number(self):
+        """已记录的最大任务序号（新任务 ID 从其后开始分配，避免与恢复的任务重复）"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MAX(CAST(SUBSTR(task_id, 6) AS INTEGER)) FROM jobs WHERE task_id LIKE 'task\\_%' ESCAPE '\\'"
+            ).fetchone()
+        return row[0] or 0
+    
+    def prune(self, max_age):
+        """删除结束超过 max_age 秒的记录（所属播放列表未结束的子任务除外，用于统计播放列表进度）"""
+        with self._lock:
+            self._db.execute(
+                'DELETE FROM jobs WHERE stage IN (?, ?) AND updated_at < ? AND (parent_id IS NULL OR parent_id NOT IN '
+                '(SELECT task_id FROM jobs WHERE stage NOT IN (?, ?)))',
+                JOB_FINISHED_STAGES + (time.time() - max_age,) + JOB_FINISHED_STAGES
+            )
+            self._db.commit()
+    
+    def stats(self):
+        with self._lock:
+            rows = self._db.execute('SELECT stage, COUNT(*) FROM jobs GROUP BY stage').fetchall()
+        return dict(rows)
+
+
+job_store = JobStore(DATA_DIR / 'jobs.db')
+
+
+def cleanup_orphaned_files(resumed_task_ids, partial_paths, output_paths=()):
+    """
+    删除上次运行中断留下的中间文件
+    恢复任务的 .part 文件（及同名的 .ytdl / .chunks 断点记录）和已下载的原始音频会保留；
+    未完成任务已开始写入 MP3 目录的输出（源音频、转换中或分割到一半的最终文件）会删除，任务恢复后重新生成
+    
+    Args:
+        resumed_task_ids: 将要恢复的任务 ID 集合
+        partial_paths: 将要恢复的任务正在写入的 .part 文件路径
+        output_paths: 未完成任务记录的输出文件路径（见 JobStore.record_output）
+    """
+    # 同一下载的 .part/.ytdl/.part-FragN/.part.chunks 文件都以最终文件名开头
+    keep_prefixes = tuple(
+        str(Path(path).with_suffix('')) if path.endswith('.part') else path
+        for path in partial_paths
+    )
+    candidates = []
+    for pattern in (
+        '*.part', '*.part-Frag*', '*.ytdl', f'*{CHUNK_STATE_SUFFIX}', f'*{CHUNK_STATE_SUFFIX}.tmp',
+        '.*.splitting.*', '.*.streaming.*'
+    ):
+        candidates.extend(MP3_DIR.glob(pattern))
+    # 输出文件本身、同名的转换结果（{名称}.mp3 等）和分段（{名称}_partN.mp3 等）
+    mp3_dir = MP3_DIR.resolve()
+    outputs = []
+    for output_path in output_paths:
+        output_path = Path(output_path)
+        if output_path.parent.resolve() != mp3_dir:
+            continue  # 融合流水线下载到 DOWNLOAD_DIR 的原始音频按任务 ID 保留
+        stem = glob.escape(output_path.stem)
+        outputs.append(output_path)
+        for suffix in AUDIO_MIME_TYPES:
+            outputs.append(MP3_DIR / f'{output_path.stem}{suffix}')
+            outputs.extend(MP3_DIR.glob(f'{stem}_part*{suffix}'))
+    outputs = [path for path in dict.fromkeys(outputs) if path.is_file()]
+    candidates.extend(outputs)
+    # 融合流水线的原始音频、本地提取的上传目录以任务 ID 命名
+    candidates.extend(
+        path for path in DOWNLOAD_DIR.glob('task_*')
+        if path.name.split('.', 1)[0] not in resumed_task_ids
+    )
+    for path in candidates:
+        if path.suffix in ('.part', '.ytdl', CHUNK_STATE_SUFFIX) or '.part-Frag' in path.name:
+            if str(path).startswith(keep_prefixes) or path.name.split('.', 1)[0] in resumed_task_ids:
+                continue
+        try:
+            if path.is_dir():
+                shutil.rmtree(path)  # 本地提取上传的临时目录
+            else:
+                path.unlink()
+            print(f"已删除中断遗留的文件: {path.name}")
+        except OSError as e:
+            print(f"删除遗留文件失败: {path.name} ({e})")
+    file_index.discard(*outputs)
+
+
+def recover_jobs():
+    """
+    服务启动时恢复上次运行未完成的任务：清理遗留的中间文件后重新排队，
+    沿用原来的任务 ID（融合流水线的原始音频以任务 ID 命名，可断点续传）
+    """
+    global task_id_counter
+    job_store.prune(FINISHED_TASK_MAX_AGE)
+    task_id_counter = itertools.count(job_store.max_task_number() + 1)
+    
+    jobs = job_store.unfinished()
+    # 未完成任务（包括下面丢弃的子任务）写了一半的输出文件都要删除
+    output_paths = [job['output_path'] for job in jobs if job['output_path']]
+    # 展开到一半中断的播放列表重新展开，已登记的部分子任务丢弃
+    reexpand = {job['task_id'] for job in jobs if job['kind'] == 'playlist' and job['stage'] == 'queued'}
+    for parent_id in reexpand:
+        job_store.delete_children(parent_id)
+    jobs = [job for job in jobs if job['parent_id'] not in reexpand]
+    
+    cleanup_orphaned_files(
+        {job['task_id'] for job in jobs},
+        [job['partial_path'] for job in jobs if job['partial_path']],
+        output_paths
+    )
+    playlists = []
+    for job in jobs:
+        task_id = job['task_id']
+        message = f'服务重启，已恢复任务（中断于 {job["stage"]} 阶段）'
+        if job['kind'] == 'playlist' and task_id not in reexpand:
+            # 已展开的播放列表：由子任务记录还原汇总进度，子任务各自恢复
+            total, completed, failed = job_store.child_counts(task_id)
+            job_store.resume(task_id, stage='downloading')
+            create_task(
+                task_id, url=job['url'], filename=job['filename'], status='downloading', message=message,
+                priority=job['priority'], profile=job['profile'], start_time=time.time(),
+                playlist_total=total, playlist_completed=completed, playlist_failed=failed
+            )
+            playlists.append(task_id)
+            continue
+        
+        job_store.resume(task_id, job['partial_path'])
+        create_task(
+            task_id,
+            url=job['url'],
+            filename=job['filename'],
+            message=message,
+            priority=job['priority'],
+            profile=job['profile'],
+            parent_id=job['parent_id'],
+            start_time=time.time()
+        )
+        if job['kind'] == 'playlist':
+            scheduler.submit(
+                task_id, run_playlist_job, job['url'], job['filename'], task_id, job['priority'], job['profile'],
+                priority=job['priority']
+            )
+            continue
+        parent = tasks_status.get(job['parent_id']) if job['parent_id'] else None
+        if parent is not None:
+            with parent.lock:
+                parent.children.append(task_id)
+        enqueue_download(task_id, job['url'], job['filename'], job['priority'], profile=job['profile'])
+    
+    for parent_id in playlists:
+        update_playlist_progress(parent_id)
+    if jobs:
+        print(f"已恢复 {len(jobs)} 个未完成的任务")
+
+
+def fetch_video_info(ydl, url, cache_key):
+    """
+    获取视频信息：优先使用元数据缓存，未命中时调用 extract_info 并写入缓存
+    
+    Args:
+        ydl: YoutubeDL 实例
+        url: 视频 URL
+        cache_key: 元数据缓存的键，None 表示不使用缓存
+    
+    Returns:
+        tuple: (信息字典, 本次获取耗时, 省去的解析耗时, 是否来自缓存)
+    """
+    start = time.time()
+    if cache_key is not None:
+        cached = metadata_cache.get(cache_key)
+        if cached is not None:
+            info, extract_time = cached
+            return info, time.time() - start, extract_time or 0, True
+    
+    info = ydl.extract_info(url, download=False)
+    extract_time = time.time() - start
+    if cache_key is not None and info.get('_type', 'video') == 'video':
+        metadata_cache.put(cache_key, info, extract_time)
+    return info, extract_time, 0, False
+
+
+def process_info_with_retry(ydl, info, url, cache_key, from_cache):
+    """
+    用信息字典驱动下载；缓存的格式地址已失效导致下载失败时，
+    删除缓存条目、重新解析后再试一次
+    
+    Returns:
+        dict: process_ie_result 返回的信息字典
+    """
+    try:
+        return ydl.process_ie_result(info, download=True)
+    except yt_dlp.utils.DownloadError as e:
+        if not from_cache:
+            raise
+        print(f"缓存的格式地址可能已失效，重新解析后重试: {e}")
+        metadata_cache.invalidate(cache_key)
+        info, _, _, _ = fetch_video_info(ydl, url, cache_key)
+        return ydl.process_ie_result(info, download=True)
+
+
+def progress_hook(d, task_id):
+    """
+    下载进度回调函数
+    会在下载过程中被 yt-dlp 调用（每秒多次），更新任务状态
+    按 PROGRESS_MIN_INTERVAL 节流，只保存原始数值，不做字符串格式化
+    
+    Args:
+        d: yt-dlp 传递的进度信息字典
+        task_id: 任务 ID
+    """
+    if d['status'] == 'downloading':
+        # 节流：距上次更新不足间隔时直接返回，不加锁
+        now = time.monotonic()
+        if now - progress_last_update.get(task_id, 0) < PROGRESS_MIN_INTERVAL:
+            return
+        progress_last_update[task_id] = now
+        
+        # 记录正在写入的 .part 文件，重启后据此断点续传
+        job_store.record_partial(task_id, d.get('tmpfilename'))
+        
+        # 获取下载大小信息
+        downloaded_bytes = d.get('downloaded_bytes') or 0
+        total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+        
+        update_task(
+            task_id,
+            status='downloading',
+            progress_percent=downloaded_bytes * 100 / total_bytes if total_bytes else 0,
+            downloaded_bytes=downloaded_bytes,
+            total_bytes=total_bytes,
+            speed=d.get('speed'),  # 字节/秒，未知时为 None
+            eta=d.get('eta'),  # 剩余秒数，未知时为 None
+        )
+        
+    elif d['status'] == 'finished':
+        # 下载完成，正在进行后处理（转换格式）
+        progress_last_update.pop(task_id, None)
+        # 之后的转换和分割写入同名的最终文件，重启时据此删除未完成的输出
+        job_store.record_output(task_id, d.get('filename'))
+        task = tasks_status.get(task_id)
+        codec = get_output_profile(task.profile if task is not None else None).codec
+        update_task(
+            task_id,
+            status='converting',
+            progress_percent=100,
+            stage_percent=0,
+            realtime_factor=None,
+            message='正在提取原始音轨...' if codec == 'original' else f'正在转换为 {codec.upper()} 格式...'
+        )
+        # 切换到 CPU 阶段可能需要等待槽位
+        scheduler.enter_stage('cpu')
+
+
+# 单个下载任务同时使用的连接数上限（1 表示关闭多连接下载，全部交给 yt-dlp 的单连接下载器）
+DOWNLOAD_CONNECTIONS = max(1, int(os.environ.get('V2V_DOWNLOAD_CONNECTIONS', 4)))
+# 每个范围请求的大小；文件不足两块时仍用单连接下载
+DOWNLOAD_CHUNK_SIZE = int(float(os.environ.get('V2V_DOWNLOAD_CHUNK_MB', 4)) * 1024 * 1024)
+
+# yt-dlp 的网络和站点相关选项（下载和播放列表展开共用）
+YDL_BASE_OPTS = {
+    # SSL 证书相关配置（彻底禁用 SSL 验证）
+    'nocheckcertificate': True,  # 禁用 SSL 证书验证（yt-dlp 主要选项）
+    'no_check_certificate': True,  # 兼容性选项
+    'verifyssl': False,  # 禁用 SSL 验证
+    'no_check_ssl_certificate': True,  # 另一个 SSL 禁用选项
+    'prefer_insecure': True,  # 优先使用不安全的连接
+    # HTTP 请求头配置
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'referer': 'https://www.youtube.com/',
+    'http_headers': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': '*/*',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+    },
+    # 网络相关配置
+    'socket_timeout': 30,
+    'extractor_retries': 3,
+    'fragment_retries': 3,
+    'retries': 3,
+    # 分片格式（DASH / HLS）的并发分片数，单文件格式由 ParallelHttpFD 分块并发下载
+    'concurrent_fragment_downloads': DOWNLOAD_CONNECTIONS,
+    # YouTube 特定配置
+    'geo_bypass': True,
+    'youtube_include_dash_manifest': False,
+    'youtube_include_hls_manifest': False,
+    'ignore_no_formats_error': True,
+}
+
+
+# ProgressExtractAudioPP.real_run_ffmpeg 按 yt-dlp 2026.08.19 的 FFmpegPostProcessor.real_run_ffmpeg 改写，
+# 命令行的拼接与其逐行对应，只有执行进程的一步换成 run_ffmpeg。升级 yt-dlp 时需对照检查；
+# 该方法的参数发生变化时不再覆盖，退回 yt-dlp 自己的实现（照常转换，只是不报告进度）
+YT_DLP_REAL_RUN_FFMPEG_PARAMS = ('self', 'input_path_opts', 'output_path_opts', 'expected_retcodes')
+REAL_RUN_FFMPEG_COMPATIBLE = (
+    tuple(inspect.signature(FFmpegPostProcessor.real_run_ffmpeg).parameters) == YT_DLP_REAL_RUN_FFMPEG_PARAMS
+)
+if not REAL_RUN_FFMPEG_COMPATIBLE:
+    print(f"yt-dlp {yt_dlp.version.__version__} 的 real_run_ffmpeg 参数已变化，转换阶段不报告进度")
+
+
+class ProgressExtractAudioPP(FFmpegExtractAudioPP):
+    """
+    转换时报告进度的 FFmpegExtractAudioPP
+    ffmpeg 命令与 yt-dlp 的 real_run_ffmpeg 相同，改由 run_ffmpeg 执行以解析 -progress 输出；
+    重新编码时另外指定输出采样率（sample_rate）
+    """
+    
+    def __init__(self, downloader=None, progress_callback=None, sample_rate=None, **kwargs):
+        super().__init__(downloader, **kwargs)
+        self._progress_callback = progress_callback
+        self._sample_rate = sample_rate
+        self._duration = None
+    
+    def run(self, information):
+        self._duration = information.get('duration')
+        return super().run(information)
+    
+    def run_ffmpeg(self, path, out_path, codec, more_opts):
+        # 流复制时不能改变采样率
+        if self._sample_rate and codec != 'copy':
+            more_opts = [*more_opts, '-ar', str(self._sample_rate)]
+        return super().run_ffmpeg(path, out_path, codec, more_opts)
+    
+    def real_run_ffmpeg(self, input_path_opts, output_path_opts, *, expected_retcodes=(0,)):
+        if not REAL_RUN_FFMPEG_COMPATIBLE:
+            return super().real_run_ffmpeg(input_path_opts, output_path_opts, expected_retcodes=expected_retcodes)
+        self.check_version()
+        oldest_mtime = min(os.stat(path).st_mtime for path, _ in input_path_opts if path)
+        
+        cmd = [self.executable, '-y']
+        if self.basename == 'ffmpeg':
+            cmd += ['-loglevel', 'repeat+info']
+        for name, path_opts in (('i', input_path_opts), ('o', output_path_opts)):
+            for number, (path, opts) in enumerate(path_opts, 1):
+                if not path:
+                    continue
+                args = list(opts)
+                keys = [f'_{name}{number}', f'_{name}']
+                if name == 'o':
+                    args += ['-movflags', '+faststart']
+                    if number == 1:
+                        keys.append('')
+                args += self._configuration_args(self.basename, keys)
+                if name == 'i':
+                    args.append('-i')
+                cmd += args + [self._ffmpeg_filename_argument(path)]
+        
+        self.write_debug(f'ffmpeg command line: {" ".join(cmd)}')
+        try:
+            stderr = run_ffmpeg(cmd, self._duration, self._progress_callback, kind='convert')
+        except subprocess.CalledProcessError as e:
+            if e.returncode not in variadic(expected_retcodes):
+                self.write_debug(e.stderr)
+                lines = e.stderr.strip().splitlines()
+                raise FFmpegPostProcessorError(lines[-1] if lines else f'ffmpeg exited with code {e.returncode}')
+            stderr = e.stderr
+        for out_path, _ in output_path_opts:
+            if out_path:
+                self.try_utime(out_path, oldest_mtime, oldest_mtime)
+        return stderr
+
+
+def download_audio(url, filename, task_id, video_key=None, profile=DEFAULT_PROFILE):
+    """
+    下载视频并提取音频的主函数
+    在独立线程中执行，不会阻塞主线程
+    
+    Args:
+        url: YouTube 视频 URL
+        filename: 保存的文件名（不含扩展名）
+        task_id: 任务 ID
+        video_key: (提取器, 视频 ID)，None 时由 URL 离线识别
+        profile: 输出档位（见 OUTPUT_PROFILES）
+    """
+    try:
+        # 如果用户没有指定文件名，使用默认值
+        if not filename:
+            filename = '%(title)s'  # yt-dlp 会自动替换为视频标题
+        
+        # 输出参数
+        output_profile = get_output_profile(profile)
+        keep_original = output_profile.codec == 'original'
+        format_type = output_profile.codec
+        
+        # 设置 yt-dlp 的下载选项
+        # MP3 转换的后处理器在解析完信息、确定是否走融合流水线后再添加
+        ydl_opts = {
+            'format': 'bestaudio/best',  # 选择最佳音频质量
+            # 如果检测到 ffmpeg 路径，则指定路径
+            **({'ffmpeg_location': FFMPEG_PATH} if FFMPEG_PATH else {}),
+            'outtmpl': str(MP3_DIR / f'{filename}.%(ext)s'),  # 输出文件模板（保存到 mp3 目录）
+            'progress_hooks': [lambda d: progress_hook(d, task_id)],  # 进度回调
+            'quiet': False,  # 显示详细信息
+            'no_warnings': False,
+            'continuedl': True,  # 已有 .part 文件时断点续传（重启后恢复的任务）
+            'noplaylist': True,  # 带 list= 参数的视频地址只下载该视频（播放列表由 run_playlist_job 展开）
+            **YDL_BASE_OPTS,
+        }
+        
+        # 元数据缓存的键（同一视频的不同 URL 写法共用）
+        video_key = video_key or resolve_video_key(url)
+        cache_key = MetadataCache.make_key(*video_key) if video_key else None
+        
+        # 解析和下载属于网络密集阶段
+        scheduler.enter_stage('network')
+        
+        # 更新任务状态为开始下载
+        update_task(task_id, status='starting', message='正在获取视频信息...')
+        
+        # 执行下载
+        # 在创建 YoutubeDL 对象之前，再次确保 SSL 验证已禁用
+        import ssl
+        
+        # 保存原始上下文
+        original_context = ssl._create_default_https_context
+        
+        # 创建不验证SSL的上下文并设置为默认
+        unverified_context = ssl._create_unverified_context()
+        ssl._create_default_https_context = lambda: unverified_context
+        
+        # 记录生成的文件名
+        generated_filename = None
+        # 融合流水线模式下的原始音频文件和分段计划
+        raw_audio_path = None
+        planned_segments = None
+        
+        try:
+            # 创建 YoutubeDL 对象并执行下载
+            with ParallelYoutubeDL(ydl_opts) as ydl:
+                # 先获取视频信息（只解析一次页面和格式清单；重试和重复提交时直接读缓存）
+                info, metadata_time, cached_extract_time, from_cache = fetch_video_info(ydl, url, cache_key)
+                video_title = info.get('title', 'Unknown')
+                video_duration = info.get('duration', 0)  # 获取视频时长（秒）
+                
+                # 复用已解析的信息下载，省去第二次解析的耗时（与一次解析相当）；命中缓存时按当初记录的解析耗时计，
+                # 缓存另外省去的第一次解析单独记在 cache_saved_time
+                saved_time = cached_extract_time if from_cache else metadata_time
+                cache_saved_time = cached_extract_time if from_cache else None
+                update_task(
+                    task_id,
+                    title=video_title,
+                    message=f'开始下载: {video_title}',
+                    metadata_time=metadata_time,
+                    saved_time=saved_time,
+                    cache_saved_time=cache_saved_time,
+                )
+                if from_cache:
+                    print(f"元数据缓存命中，省去解析耗时 {cache_saved_time:.2f} 秒（下载阶段复用另省 {saved_time:.2f} 秒）")
+                else:
+                    print(f"元数据解析耗时 {metadata_time:.2f} 秒（下载阶段复用，节省同等耗时）")
+                
+                # 根据元数据时长预先判断是否需要分割（保留原始编码时按所选音频流的码率估算）
+                if video_duration:
+                    planned_segments = calculate_segments(
+                        video_duration,
+                        max_size_mb=output_profile.max_part_mb,
+                        bitrate_kbps=(info.get('abr') or info.get('tbr') or get_output_profile(DEFAULT_PROFILE).nominal_kbps)
+                        if keep_original else output_profile.nominal_kbps,
+                        format=format_type
+                    )
+                
+                if planned_segments and len(planned_segments) > 1:
+                    # 融合流水线：只下载原始音频流，之后由一次 ffmpeg 调用同时完成编码和分段，
+                    # 避免先整体转为 MP3 再逐段二次编码，也不在磁盘上留下完整的中间 MP3
+                    if '%(title)s' in filename:
+                        base_name = Path(ydl.prepare_filename(info)).stem
+                    else:
+                        base_name = filename
+                    raw_opts = dict(ydl_opts, outtmpl=str(DOWNLOAD_DIR / f'{task_id}.%(ext)s'))
+                    with ParallelYoutubeDL(raw_opts) as raw_ydl:
+                        info = process_info_with_retry(raw_ydl, info, url, cache_key, from_cache)
+                    requested = info.get('requested_downloads') or []
+                    if requested and requested[0].get('filepath'):
+                        raw_audio_path = Path(requested[0]['filepath'])
+                else:
+                    # 源音频已是目标编码时后处理器直接流复制；'best' 表示保留原始编码，只换成纯音频封装
+                    ydl.add_post_processor(
+                        ProgressExtractAudioPP(
+                            ydl,
+                            progress_callback=ffmpeg_progress_updater(task_id),
+                            sample_rate=None if keep_original else output_profile.sample_rate,
+                            preferredcodec='best' if keep_original else format_type,  # 转换为档位的编码
+                            preferredquality=output_profile.postprocessor_quality(),  # CBR 比特率或 VBR 质量等级
+                        ),
+                        when='post_process'
+                    )
+                    
+                    # 直接用已解析的信息字典驱动下载和转换，不再重新解析 URL
+                    info = process_info_with_retry(ydl, info, url, cache_key, from_cache)
+                    
+                    # 获取生成的文件名（优先使用后处理完成后的实际路径）
+                    requested = info.get('requested_downloads') or []
+                    if requested and requested[0].get('filepath'):
+                        generated_filename = requested[0]['filepath']
+                    else:
+                        # 扩展名由档位的编码决定；保留原始编码时随源编码而定，取实际生成的文件
+                        if '%(title)s' in filename:
+                            prepared = Path(ydl.prepare_filename(info))
+                        else:
+                            prepared = MP3_DIR / f'{filename}.{info.get("ext") or format_type}'
+                        if keep_original:
+                            candidates = [prepared.with_suffix(suffix) for suffix in AUDIO_MIME_TYPES]
+                            generated_filename = str(next((path for path in candidates if path.exists()), prepared))
+                        else:
+                            generated_filename = str(prepared.with_suffix(f'.{format_type}'))
+        finally:
+            # 恢复原始的 SSL 上下文
+            ssl._create_default_https_context = original_context
+        
+        if planned_segments and len(planned_segments) > 1:
+            encode_and_split_raw_audio(raw_audio_path, base_name, planned_segments, task_id, output_profile)
+            return
+        
+        # 检查是否成功生成了文件
+        if not generated_filename or not os.path.exists(generated_filename):
+            update_task(task_id, status='error', message='❌ 错误: 下载失败，未生成音频文件')
+            return
+        
+        # 之后的检查和分割属于 CPU 密集阶段
+        scheduler.enter_stage('cpu')
+        
+        # 转换为 Path 对象
+        generated_file_path = Path(generated_filename)
+        base_name = generated_file_path.stem
+        # 保留原始编码时扩展名随源编码而定
+        format_type = generated_file_path.suffix[1:] or format_type
+        
+        # 更新任务状态为开始分割检查
+        update_task(task_id, status='processing', message='正在检查文件大小...')
+        
+        # 记录分割信息
+        actual_size = generated_file_path.stat().st_size
+        print(f"YouTube 视频时长: {format_time(video_duration)}")
+        print(f"实际大小: {actual_size / (1024 * 1024):.2f} MB")
+        
+        # 获取音频时长
+        audio_duration = get_video_duration(generated_file_path)
+        if audio_duration <= 0:
+            audio_duration = video_duration  # 使用视频时长作为备选
+        
+        # 计算需要分割的段数（按编码后的实际大小规划，VBR 和原始编码同样准确）
+        segments = calculate_segments(
+            audio_duration,
+            max_size_mb=output_profile.max_part_mb,
+            format=format_type,
+            total_bytes=actual_size
+        )
+        
+        # 如果需要分割
+        if len(segments) > 1:
+            update_task(
+                task_id,
+                status='processing',
+                message=f'文件过大，正在分割为 {len(segments)} 个文件...',
+                progress_percent=100,
+                stage_percent=0,
+                realtime_factor=None,
+            )
+            
+            # 记录分割信息
+            print(f"需要分割为 {len(segments)} 段")
+            
+            for i, (start, end) in enumerate(segments, 1):
+                print(f"段 {i}: {format_time(start)} - {format_time(end)}")
+            
+            try:
+                # 提取并分割音频
+                output_files = split_encoded_audio(
+                    generated_file_path, base_name, segments, format_type,
+                    output_profile.max_part_mb, ffmpeg_progress_updater(task_id)
+                )
+                
+                # 删除原始文件
+                os.remove(generated_file_path)
+                file_index.discard(generated_file_path)
+                
+                print(f"音频分割完成，共生成 {len(output_files)} 个文件")
+                for file_info in output_files:
+                    print(f"- {file_info['filename']} ({file_info['size'] / (1024 * 1024):.2f} MB)")
+                    
+                update_task(task_id, segments=len(output_files))
+            except Exception as e:
+                print(f"音频分割失败: {e}")
+                traceback.print_exc()
+                update_task(task_id, status='error', message=f'❌ 错误: 音频分割失败 - {str(e)}')
+                return
+        else:
+            print("音频文件大小在限制范围内，不需要分割")
+            file_index.publish(generated_file_path)
+            output_files = [{'filename': generated_file_path.name}]
+        
+        # 任务完成
+        mark_task_completed(task_id, [file_info['filename'] for file_info in output_files])
+            
+    except Exception as e:
+        # 发生错误，记录错误信息
+        update_task(task_id, status='error', message=f'❌ 错误: {str(e)}')
+
+
+def encode_and_split_raw_audio(raw_audio_path, base_name, segments, task_id, profile):
+    """
+    融合流水线的后半段：把下载的原始音频流一次性编码并分段写入 MP3 目录
+    源音频已满足输出格式（或保留原始编码）时只流复制分段，不转码
+    完成后删除原始音频文件
+    
+    Args:
+        raw_audio_path: 原始音频文件路径（yt-dlp 下载的 bestaudio 流）
+        base_name: 输出文件名基础
+        segments: 分割段的时间范围列表
+        task_id: 任务 ID
+        profile: 输出档位（OutputProfile）；直接复制时按原始音频的实际大小重新规划分段
+    """
+    if raw_audio_path is None or not raw_audio_path.exists():
+        update_task(task_id, status='error', message='❌ 错误: 下载失败，未生成音频文件')
+        return
+    
+    # 编码和分段属于 CPU 密集阶段
+    scheduler.enter_stage('cpu')
+    
+    source = probe_audio_stream(raw_audio_path)
+    source_codec = source['codec']
+    output_format, copy, encode_profile = plan_audio_output(source_codec, profile, source['bitrate_kbps'])
+    # 分段按 {base_name}_partN.{ext} 写入 MP3 目录，重启时据此删除已写出的部分分段
+    job_store.record_output(task_id, MP3_DIR / f'{base_name}.{output_format}')
+    if copy:
+        # 复制后的大小与原始音频相当（只换封装），按实际大小规划，分段尽量填满上限
+        total_duration = segments[-1][1]
+        segments = calculate_segments(
+            total_duration,
+            max_size_mb=profile.max_part_mb,
+            format=output_format,
+            total_bytes=raw_audio_path.stat().st_size
+        )
+    
+    update_task(
+        task_id,
+        status='processing',
+        message=f'正在{"分割" if copy else "编码并分割"}为 {len(segments)} 个文件...',
+        progress_percent=100,
+        stage_percent=0,
+        realtime_factor=None,
+    )
+    
+    print(f"融合流水线：源音频编码 {source_codec or '未知'}，一次{'复制' if copy else '编码'}并分割为 {len(segments)} 段")
+    for i, (start, end) in enumerate(segments, 1):
+        print(f"段 {i}: {format_time(start)} - {format_time(end)}")
+    
+    try:
+        if copy and len(segments) > 1:
+            output_files = split_encoded_audio(
+                raw_audio_path, base_name, segments, output_format,
+                profile.max_part_mb, ffmpeg_progress_updater(task_id)
+            )
+        else:
+            output_files = extract_audio_segments(
+                raw_audio_path,
+                MP3_DIR,
+                base_name,
+                segments,
+                output_format=output_format,
+                profile=encode_profile,
+                split_mode='copy' if copy else 'single_pass',
+                progress_callback=ffmpeg_progress_updater(task_id)
+            )
+    except Exception as e:
+        print(f"音频编码分割失败: {e}")
+        traceback.print_exc()
+        update_task(task_id, status='error', message=f'❌ 错误: 音频分割失败 - {str(e)}')
+        return
+    finally:
+        # 删除原始音频文件
+        if raw_audio_path.exists():
+            os.remove(raw_audio_path)
+    
+    print(f"音频编码分割完成，共生成 {len(output_files)} 个文件")
+    for file_info in output_files:
+        print(f"- {file_info['filename']} ({file_info['size'] / (1024 * 1024):.2f} MB)")
+    
+    update_task(task_id, segments=len(output_files))
+    
+    mark_task_completed(task_id, [file_info['filename'] for file_info in output_files])
+
+
+def split_encoded_audio(path, base_name, segments, output_format, max_part_mb, progress_callback=None):
+    """
+    分割已是目标编码的音频文件（不转码）：MP3 按帧边界和字节预算直接切分（split_mp3），
+    无法按帧解析或其他格式时按 segments 的时间范围用 ffmpeg 流复制分段
+    
+    Args:
+        path: 音频文件路径
+        base_name: 输出文件名基础
+        segments: calculate_segments 规划的时间范围（按 ffmpeg 分段时使用）
+        output_format: 音频格式（文件扩展名）
+        max_part_mb: 单个文件的大小上限（MB）
+        progress_callback: 进度回调 callback(完成百分比, 实时倍率)
+    
+    Returns:
+        list: 生成的音频文件列表（与 extract_audio_segments 格式相同）
+    """
+    if output_format == 'mp3' and Path(path).suffix.lower() == '.mp3':
+        try:
+            return split_mp3(path, MP3_DIR, base_name, int(max_part_mb * 1024 * 1024), progress_callback)
+        except ValueError as e:
+            print(f"按帧分割失败，改用 ffmpeg 分割: {e}")
+    return extract_audio_segments(
+        path,
+        MP3_DIR,
+        base_name,
+        segments,
+        output_format=output_format,
+        split_mode='copy',  # 已是目标格式，直接流复制分段
+        progress_callback=progress_callback
+    )
+
+
+def mark_task_completed(task_id, output_files, message='✅ 下载完成！'):
+    """
+    将任务标记为完成并记录总用时
+    
+    Args:
+        task_id: 任务 ID
+        output_files: 生成的音频文件名列表
+        message: 完成提示
+    """
+    task = tasks_status.get(task_id)
+    if task is None:
+        return
+    total_time = time.time() - task.start_time
+    
+    update_task(
+        task_id,
+        status='completed',
+        progress_percent=100,
+        message=message,
+        output_files=output_files,
+        elapsed_time=total_time,
+        completed_time=time.time(),
+    )
+
+
+@app.route('/')
+def index():
+    """
+    主页路由
+    返回 index.html 页面
+    """
+    return render_template('index.html')
+
+
+# =========================================================================
+# 多连接分块下载（并发范围请求，写入稀疏文件）
+# =========================================================================
+
+# 每次从响应中读取并写入文件的字节数
+DOWNLOAD_BLOCK_SIZE = 256 * 1024
+# 单个分块失败后的重试次数（从断开的位置继续）
+DOWNLOAD_CHUNK_RETRIES = 5
+# 分块完成情况的记录文件后缀（与 .part 文件同名），重启后据此只下载缺失的分块
+CHUNK_STATE_SUFFIX = '.chunks'
+
+
+class ParallelHttpFD(FileDownloader):
+    """
+    多连接分块下载器：把文件按 DOWNLOAD_CHUNK_SIZE 分块，最多 DOWNLOAD_CONNECTIONS 个连接并发发送范围请求，
+    各块按偏移直接写入预先设置好大小的 .part 文件（稀疏文件），全部完成后改名为最终文件
+    服务器按连接限速时，总速度随连接数增加；服务器不支持范围请求或文件较小时交给 yt-dlp 的 HttpFD
+    """
+    
+    FD_NAME = 'v2v-parallel'
+    
+    @staticmethod
+    def suitable(info_dict, params=None):
+        """
+        是否为可以分块下载的单文件 HTTP 格式（分片格式由 yt-dlp 按 concurrent_fragment_downloads 并发下载）
+        设置了限速（ratelimit / throttledratelimit）或不使用 .part 文件（nopart）时交给 yt-dlp 的 HttpFD，
+        由它按这些选项下载
+        """
+        params = params or {}
+        return (
+            DOWNLOAD_CONNECTIONS > 1
+            and not params.get('ratelimit')
+            and not params.get('throttledratelimit')
+            and not params.get('nopart')
+            and not info_dict.get('requested_formats')
+            and not info_dict.get('is_live')
+            and not (info_dict.get('section_start') or info_dict.get('section_end'))
+            and determine_protocol(info_dict) in ('http', 'https')
+        )
+    
+    def _request(self, url, headers, start, end):
+        # 范围按原始字节计算，不接受压缩编码
+        range_headers = {**headers, 'Range': f'bytes={start}-{end}', 'Accept-Encoding': 'identity'}
+        return self.ydl.urlopen(yt_dlp.networking.Request(url, headers=range_headers))
+    
+    def _probe_size(self, url, headers):
+        """
+        请求第一个字节，确认服务器支持范围请求并读取文件总大小
+        
+        Returns:
+            int: 文件大小，不支持范围请求或无法得知大小时返回 None
+        """
+        try:
+            with contextlib.closing(self._request(url, headers, 0, 0)) as response:
+                content_range = response.headers.get('Content-Range') or ''
+                if response.status != 206 or '/' not in content_range:
+                    return None
+                total = content_range.rsplit('/', 1)[1].strip()
+                return int(total) if total.isdigit() else None
+        except (yt_dlp.networking.exceptions.RequestError, OSError) as e:
+            self.report_warning(f'范围请求失败，改用单连接下载: {e}')
+            return None
+    
+    def _fallback(self, filename, info_dict, tmpfilename, state_path):
+        """交给 yt-dlp 的单连接下载器（删除分块下载留下的稀疏文件，避免被当作已下载的前缀续传）"""
+        if state_path.exists():
+            for path in (Path(tmpfilename), state_path):
+                path.unlink(missing_ok=True)
+        fd = HttpFD(self.ydl, self.params)
+        for hook in self._progress_hooks:
+            fd.add_progress_hook(hook)
+        return fd.real_download(filename, info_dict)
+    
+    def _load_done_chunks(self, tmpfilename, state_path, total, chunk_count):
+        """
+        读取已完成的分块：有记录文件时按记录；只有 .part 文件时（单连接下载中断）视其内容为连续的前缀
+        
+        Returns:
+            set: 已完成的分块序号
+        """
+        if not os.path.exists(tmpfilename):
+            return set()
+        if state_path.exists():
+            try:
+                state = json.loads(state_path.read_text())
+                if state['total'] == total and state['chunk_size'] == DOWNLOAD_CHUNK_SIZE:
+                    return {i for i in state['done'] if 0 <= i < chunk_count}
+            except (OSError, ValueError, KeyError):
+                pass
+            return set()
+        prefix = os.path.getsize(tmpfilename)
+        if prefix > total:
+            return set()
+        return {i for i in range(chunk_count) if min((i + 1) * DOWNLOAD_CHUNK_SIZE, total) <= prefix}
+    
+    def _save_done_chunks(self, state_path, total, done):
+        temp_path = state_path.with_name(state_path.name + '.tmp')
+        temp_path.write_text(json.dumps({'total': total, 'chunk_size': DOWNLOAD_CHUNK_SIZE, 'done': sorted(done)}))
+        os.replace(temp_path, state_path)
+    
+    def real_download(self, filename, info_dict):
+        url = info_dict['url']
+        headers = info_dict.get('http_headers') or {}
+        tmpfilename = self.temp_name(filename)
+        state_path = Path(tmpfilename + CHUNK_STATE_SUFFIX)
+        
+        total = self._probe_size(url, headers)
+        if total is None or total < 2 * DOWNLOAD_CHUNK_SIZE:
+            return self._fallback(filename, info_dict, tmpfilename, state_path)
+        
+        chunk_count = math.ceil(total / DOWNLOAD_CHUNK_SIZE)
+        done = self._load_done_chunks(tmpfilename, state_path, total, chunk_count)
+        pending = iter([i for i in range(chunk_count) if i not in done])
+        connections = min(DOWNLOAD_CONNECTIONS, chunk_count - len(done))
+        
+        self.report_destination(filename)
+        if done:
+            self.to_screen(f'[download] 继续下载缺失的 {chunk_count - len(done)}/{chunk_count} 个分块')
+        self.to_screen(f'[download] 多连接下载: {connections} 个连接，{chunk_count} 个分块')
+        
+        # 预先设置文件大小（稀疏文件，未写入的部分不占用磁盘），各块按偏移写入
+        with open(tmpfilename, 'r+b' if os.path.exists(tmpfilename) else 'wb') as f:
+            f.truncate(total)
+        self._save_done_chunks(state_path, total, done)
+        
+        lock = threading.Lock()
+        stop = threading.Event()
+        started = time.time()
+        progress = {'downloaded': sum(min((i + 1) * DOWNLOAD_CHUNK_SIZE, total) - i * DOWNLOAD_CHUNK_SIZE for i in done)}
+        resumed_bytes = progress['downloaded']
+        
+        def report(written):
+            with lock:
+                progress['downloaded'] += written
+                downloaded = progress['downloaded']
+            elapsed = time.time() - started
+            speed = (downloaded - resumed_bytes) / elapsed if elapsed > 0 else None
+            self._hook_progress({
+                'status': 'downloading',
+                'downloaded_bytes': downloaded,
+                'total_bytes': total,
+                'tmpfilename': tmpfilename,
+                'filename': filename,
+                'elapsed': elapsed,
+                'speed': speed,
+                'eta': int((total - downloaded) / speed) if speed else None,
+            }, info_dict)
+        
+        def download_chunk(fd, index):
+            start = index * DOWNLOAD_CHUNK_SIZE
+            end = min(start + DOWNLOAD_CHUNK_SIZE, total) - 1
+            position = start
+            retries = 0
+            while position <= end:
+                if stop.is_set():
+                    return
+                try:
+                    with contextlib.closing(self._request(url, headers, position, end)) as response:
+                        content_range = response.headers.get('Content-Range') or ''
+                        if response.status != 206 or not content_range.startswith(f'bytes {position}-'):
+                            raise yt_dlp.utils.DownloadError(f'服务器没有按范围返回分块 {index}')
+                        while position <= end and not stop.is_set():
+                            block = response.read(min(DOWNLOAD_BLOCK_SIZE, end - position + 1))
+                            if not block:
+                                break
+                            os.pwrite(fd, block, position)
+                            position += len(block)
+                            report(len(block))
+                    if position <= end and not stop.is_set():
+                        raise yt_dlp.utils.DownloadError(f'分块 {index} 的连接提前结束')
+                except (yt_dlp.networking.exceptions.RequestError, yt_dlp.utils.DownloadError, OSError) as e:
+                    retries += 1
+                    if retries > DOWNLOAD_CHUNK_RETRIES:
+                        raise
+                    self.report_retry(e, retries, DOWNLOAD_CHUNK_RETRIES)
+                    time.sleep(min(2 ** retries, 30))
+            with lock:
+                done.add(index)
+                self._save_done_chunks(state_path, total, done)
+        
+        def worker(fd):
+            # 每个连接依次领取下一个未完成的分块，较快的连接多下载几块
+            while not stop.is_set():
+                with lock:
+                    index = next(pending, None)
+                if index is None:
+                    return
+                download_chunk(fd, index)
+        
+        fd = os.open(tmpfilename, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            with concurrent.futures.ThreadPoolExecutor(connections, thread_name_prefix='v2v-chunk') as executor:
+                futures = [executor.submit(worker, fd) for _ in range(connections)]
+                try:
+                    for future in concurrent.futures.as_completed(futures):
+                        future.result()
+                except BaseException:
+                    stop.set()  # 任一分块最终失败时让其他连接尽快结束，已完成的分块保留用于续传
+                    raise
+        finally:
+            os.close(fd)
+        
+        elapsed = time.time() - started
+        self.try_rename(tmpfilename, filename)
+        state_path.unlink(missing_ok=True)
+        self._hook_progress({
+            'status': 'finished',
+            'downloaded_bytes': total,
+            'total_bytes': total,
+            'filename': filename,
+            'elapsed': elapsed,
+        }, info_dict)
+        return True
+
+
+class ParallelYoutubeDL(yt_dlp.YoutubeDL):
+    """单文件 HTTP 格式改用 ParallelHttpFD 下载的 YoutubeDL，其他情况与 yt-dlp 相同"""
+    
+    def dl(self, name, info, subtitle=False, test=False):
+        if subtitle or test or name == '-' or not info.get('url') or not ParallelHttpFD.suitable(info, self.params):
+            return super().dl(name, info, subtitle=subtitle, test=test)
+        fd = ParallelHttpFD(self, self.params)
+        for hook in self._progress_hooks:
+            fd.add_progress_hook(hook)
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        return fd.download(name, new_info, subtitle)
+
+
+# =========================================================================
+# 播放列表 / 频道展开（平铺解析，不逐条抓取页面）
+# =========================================================================
+
+# 单个播放列表最多展开的条目数
+PLAYLIST_MAX_ENTRIES = int(os.environ.get('V2V_PLAYLIST_MAX_ENTRIES', 1000))
+# 嵌套展开的最大层数（频道 -> 标签页 -> 视频）
+PLAYLIST_MAX_DEPTH = 3
+
+
+def entry_return_type(entry):
+    """
+    平铺条目的类型：条目自带的提取器（ie_key）优先，没有时按 URL 匹配
+    
+    Returns:
+        str: 'video' / 'playlist' / 'any'；无法判断时返回 None（按视频处理）
+    """
+    if entry.get('_type') == 'playlist':
+        return 'playlist'
+    ie_key = entry.get('ie_key')
+    if ie_key:
+        try:
+            return getattr(get_info_extractor(ie_key), '_RETURN_TYPE', None)
+        except Exception:
+            pass
+    return getattr(match_extractor(entry.get('url') or ''), '_RETURN_TYPE', None)
+
+
+def collect_playlist_entries(ydl, info, seen, depth=0):
+    """
+    收集平铺解析结果中的视频条目，按视频 ID 去重
+    视频条目直接使用平铺结果（不抓取视频页面），只有子播放列表（如频道的标签页）会再解析一次
+    
+    Args:
+        ydl: extract_flat 模式的 YoutubeDL 实例
+        info: 播放列表的解析结果
+        seen: 已收集的视频键（跨层共用）
+        depth: 当前嵌套层数
+    
+    Returns:
+        list: (视频 URL, 标题) 列表
+    """
+    entries = []
+    for entry in info.get('entries') or []:
+        if len(seen) >= PLAYLIST_MAX_ENTRIES:
+            break
+        if not entry:
+            continue
+        url = entry.get('webpage_url') or entry.get('url')
+        if not url:
+            continue
+        
+        if entry_return_type(entry) in ('playlist', 'any') and depth + 1 < PLAYLIST_MAX_DEPTH:
+            try:
+                nested = entry if entry.get('entries') is not None else ydl.extract_info(url, download=False)
+            except Exception as e:
+                print(f"解析子播放列表失败，跳过: {url} ({e})")
+                continue
+            if nested.get('_type', 'video') in ('playlist', 'multi_video'):
+                entries.extend(collect_playlist_entries(ydl, nested, seen, depth + 1))
+                continue
+            entry = nested
+            url = nested.get('webpage_url') or url
+        
+        key = resolve_video_key(url) or (
+            (entry.get('ie_key') or entry.get('extractor_key'), entry['id']) if entry.get('id') else url
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+        entries.append((url, entry.get('title') or ''))
+    return entries
+
+
+def run_playlist_job(url, filename, task_id, priority, profile=DEFAULT_PROFILE):
+    """
+    调度器执行的播放列表任务：平铺解析后为每个视频创建子任务并加入下载队列
+    URL 实际指向单个视频时，直接在当前任务中下载（解析结果写入元数据缓存，不再重复解析）
+    
+    Args:
+        url: 播放列表、频道或无法离线判断类型的 URL
+        filename: 文件名前缀（为空时子任务使用视频标题）
+        task_id: 任务 ID
+        priority: 优先级，子任务沿用
+        profile: 输出档位，子任务沿用
+    """
+    scheduler.enter_stage('network')
+    update_task(task_id, status='starting', message='正在解析播放列表...')
+    
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'extract_flat': 'in_playlist',  # 只读取列表本身，不抓取每个视频的页面
+        'noplaylist': True,
+        'playlistend': PLAYLIST_MAX_ENTRIES,
+        'quiet': True,
+        **YDL_BASE_OPTS,
+    }
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            start = time.time()
+            info = ydl.extract_info(url, download=False)
+            extract_time = time.time() - start
+            is_playlist = info.get('_type', 'video') in ('playlist', 'multi_video')
+            entries = collect_playlist_entries(ydl, info, set()) if is_playlist else []
+    except Exception as e:
+        update_task(task_id, status='error', message=f'❌ 错误: 解析失败 - {str(e)}')
+        return
+    
+    if not is_playlist:
+        # 单个视频：换成规范地址（便于去重和缓存），复用这次的解析结果
+        video_url = info.get('webpage_url') or url
+        video_key = resolve_video_key(video_url)
+        if video_key is None and info.get('extractor_key') and info.get('id'):
+            video_key = (info['extractor_key'], info['id'])
+        if video_key is not None:
+            metadata_cache.put(MetadataCache.make_key(*video_key), info, extract_time)
+        job_store.convert_to_download(task_id, video_url)
+        update_task(task_id, url=video_url)
+        enqueue_download(task_id, video_url, filename, priority, run_now=True, video_key=video_key, profile=profile)
+        return
+    
+    if not entries:
+        update_task(task_id, status='error', message='❌ 错误: 播放列表中没有可下载的视频')
+        return
+    
+    total = len(entries)
+    padding = len(str(total))
+    children = []
+    for index, (entry_url, entry_title) in enumerate(entries, 1):
+        child_filename = f'{filename}_{index:0{padding}d}' if filename else ''
+        child_id = create_task(
+            url=entry_url,
+            filename=child_filename,
+            title=entry_title,
+            message='等待开始...',
+            priority=priority,
+            profile=profile,
+            parent_id=task_id,
+            start_time=time.time()
+        )
+        children.append((child_id, entry_url, child_filename))
+    
+    # 先持久化全部子任务，再标记播放列表已展开，最后入队（中途重启不会丢失或重复条目）
+    job_store.add_many([
+        (child_id, entry_url, child_filename, priority, 'download', task_id, profile)
+        for child_id, entry_url, child_filename in children
+    ])
+    update_task(
+        task_id,
+        status='downloading',
+        title=info.get('title') or url,
+        children=[child[0] for child in children],
+        playlist_total=total,
+        progress_percent=0,
+        message=f'播放列表共 {total} 个视频，已加入下载队列',
+    )
+    print(f"播放列表展开完成: {total} 个视频（解析耗时 {extract_time:.2f} 秒）")
+    
+    for child_id, entry_url, child_filename in children:
+        enqueue_download(child_id, entry_url, child_filename, priority, profile=profile)
+
+
+def update_playlist_progress(parent_id, finished_status=None, percent_delta=0):
+    """
+    汇总子任务的进度到播放列表任务；全部子任务结束后将播放列表任务标记为结束
+    只更新播放列表任务上的计数，不遍历子任务，开销与播放列表大小无关
+    
+    Args:
+        parent_id: 播放列表任务 ID
+        finished_status: 刚结束的子任务的最终状态（'completed' / 'error'），只在子任务结束时传入
+        percent_delta: 进行中子任务的进度百分比之和的变化量
+    """
+    parent = tasks_status.get(parent_id)
+    if parent is None:
+        return
+    with parent.lock:
+        if finished_status == 'completed':
+            parent.playlist_completed += 1
+        elif finished_status == 'error':
+            parent.playlist_failed += 1
+        parent.playlist_active_percent = max(0, parent.playlist_active_percent + percent_delta)
+        total = parent.playlist_total
+        completed = parent.playlist_completed
+        failed = parent.playlist_failed
+        active_percent = parent.playlist_active_percent
+        if not total or parent.status in FINISHED_STATUSES:
+            return  # 尚未展开完成，或已经结束
+        finished = completed + failed
+        if finished >= total:
+            # 在任务锁内先改状态，避免并发结束的子任务重复完成播放列表任务
+            parent.status = 'completed' if completed else 'error'
+    
+    message = f'播放列表 {finished}/{total}：完成 {completed} 个' + (f'，失败 {failed} 个' if failed else '')
+    if finished >= total:
+        if completed:
+            mark_task_completed(parent_id, [], message=f'✅ {message}')
+        else:
+            update_task(parent_id, status='error', message=f'❌ {message}')
+        return
+    
+    update_task(
+        parent_id,
+        progress_percent=(finished * 100 + active_percent) / total,
+        message=message,
+    )
+
+
+def enqueue_download(task_id, url, filename, priority, run_now=False, video_key=None, profile=DEFAULT_PROFILE):
+    """
+    把已登记的下载任务加入调度队列
+    同一视频（不论 URL 写法）已下载过或正在下载时不再重复下载
+    
+    Args:
+        task_id: 任务 ID
+        url: 视频 URL
+        filename: 保存的文件名（不含扩展名）
+        priority: 优先级，数值越小越先执行
+        run_now: 为 True 时在当前工作线程中直接执行（调用方已是调度器执行的任务）
+        video_key: (提取器, 视频 ID)，None 时由 URL 离线识别
+        profile: 输出档位（见 OUTPUT_PROFILES）
+    """
+    video_key = video_key or resolve_video_key(url)
+    key = None
+    if video_key is not None:
+        key = video_key + (profile,)
+        role, detail = download_registry.claim(key, task_id)
+        if role == 'cached':
+            complete_from_existing(task_id, detail)
+            return
+        if role == 'attached':
+            update_task(task_id, message=f'与任务 {detail} 是同一视频，等待其完成...')
+            return
+    
+    if run_now:
+        run_download_job(url, filename, task_id, key, video_key, profile)
+        return
+    
+    # 加入调度队列，由工作线程池执行
+    scheduler.submit(task_id, run_download_job, url, filename, task_id, key, video_key, profile, priority=priority)
+
+
+@app.route('/api/download', methods=['POST'])
+def start_download():
+    """
+    开始下载任务的 API 接口
+    接收前端发送的任务列表，将每个任务提交到调度器队列
+    播放列表和频道 URL 先由 run_playlist_job 展开，每个视频成为一个子任务
+    
+    Returns:
+        JSON 响应，包含任务 ID 列表
+    """
+    try:
+        # 获取前端发送的 JSON 数据
+        data = request.get_json()
+        tasks = data.get('tasks', [])
+        
+        if not tasks:
+            return jsonify({'error': '没有提供任务'}), 400
+        
+        invalid_profiles = {task.get('profile') for task in tasks} - set(OUTPUT_PROFILES) - {None, ''}
+        if invalid_profiles:
+            return jsonify({'error': f'不支持的输出档位: {", ".join(map(str, invalid_profiles))}'}), 400
+        
+        task_ids = []
+        
+        # 将每个任务提交到调度器
+        for task in tasks:
+            url = task.get('url', '').strip()
+            filename = task.get('filename', '').strip()
+            
+            if not url:
+                continue
+            
+            # 优先级（数值越小越先执行，默认 0）
+            try:
+                priority = int(task.get('priority', 0))
+            except (TypeError, ValueError):
+                priority = 0
+            
+            # 输出档位（默认转码为 MP3）
+            profile = task.get('profile') or DEFAULT_PROFILE
+            
+            # 初始化任务状态（分配唯一的任务 ID），并写入持久化存储
+            task_id = create_task(
+                url=url,
+                filename=filename,
+                message='等待开始...',
+                priority=priority,
+                profile=profile,
+                start_time=time.time()
+            )
+            task_ids.append(task_id)
+            
+            if url_return_type(url) == 'video':
+                job_store.add(task_id, url, filename, priority, profile=profile)
+                enqueue_download(task_id, url, filename, priority, profile=profile)
+            else:
+                # 播放列表、频道，或无法离线判断类型的 URL：先平铺解析再展开
+                job_store.add(task_id, url, filename, priority, kind='playlist', profile=profile)
+                scheduler.submit(
+                    task_id, run_playlist_job, url, filename, task_id, priority, profile, priority=priority
+                )
+        
+        return jsonify({
+            'success': True,
+            'task_ids': task_ids,
+            'queued': scheduler.queue_length(),
+            'message': f'已提交 {len(task_ids)} 个下载任务'
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def not_modified_response(etag, last_modified=None, cache_control='no-cache'):
+    """
+    按 If-None-Match / If-Modified-Since 判断客户端缓存是否仍然有效
+    
+    Args:
+        etag: 当前内容的强 ETag（不含引号）
+        last_modified: 当前内容的修改时间（datetime，可选）
+        cache_control: 304 响应中携带的 Cache-Control
+    
+    Returns:
+        缓存有效时返回 304 响应，否则返回 None
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+@app.route('/api/status', methods=['GET'])
+def get_status():
+    """
+    获取任务状态的 API 接口
+    前端会定期调用此接口更新显示
+    
+    Query:
+        since: 上次返回的 cursor；提供时只返回此后有变化的任务
+    
+    Returns:
+        不带 since：JSON 响应，包含所有任务的当前状态
+        带 since：{'cursor', 'full', 'tasks', 'removed'}，
+                  full 为 true 时 tasks 是全量数据，客户端应整体替换
+    """
+    since = request.args.get('since', type=int)
+    
+    with tasks_lock:
+        flush_progress_changes()
+        enforce_task_retention()
+        # 响应内容由状态版本号决定；有进行中的任务时已用时间每秒变化，ETag 也随之按秒变化
+        etag = f'status-{SERVER_EPOCH}-{since}-{status_cursor}'
+        if any(task.status in ACTIVE_STATUSES for task in tasks_status.values()):
+            etag += f'-{int(time.time())}'
+        
+        not_modified = not_modified_response(etag)
+        if not_modified is not None:
+            return not_modified
+        
+        # 持锁期间只做浅拷贝，序列化放到锁外，避免阻塞进度回调
+        if since is None:
+            snapshot = {task_id: snapshot_task(task_id) for task_id in tasks_status}
+        else:
+            delta = build_status_delta(since)
+    
+    if since is None:
+        response = jsonify({task_id: serialize_task(task) for task_id, task in snapshot.items()})
+    else:
+        response = jsonify(serialize_status_delta(delta))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events 推送接口
+    任务状态变化时推送 status 事件（内容与 /api/status?since= 相同），
+    音频文件列表变化时推送 files 事件；短时间内的多次更新会合并为一次推送
+    
+    Query:
+        since: 建立连接时已同步到的 cursor
+    
+    Headers:
+        Last-Event-ID: 断线重连时浏览器自动带上最后收到的事件 ID（即 cursor），优先于 since；
+            EventSource 重连时沿用最初的 URL，其中的 since 已经过时
+    
+    Returns:
+        text/event-stream 流式响应
+    """
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+    
+    min_interval = 1.0 / SSE_MAX_EVENTS_PER_SECOND if SSE_MAX_EVENTS_PER_SECOND > 0 else 0
+    # 只更新进度时不会唤醒等待（见 update_task），按此间隔检查 pending_progress
+    poll_interval = max(min_interval, PROGRESS_MIN_INTERVAL, 0.1)
+    
+    def generate():
+        cursor = since
+        seen_files_version = files_version
+        last_sent = 0
+        last_heartbeat = time.monotonic()
+        # 新连接（没有 cursor）立即推送一次全量状态
+        send_full = cursor <= 0
+        
+        # 断线后浏览器 3 秒重连
+        yield 'retry: 3000\n\n'
+        
+        while True:
+            with status_changed:
+                status_changed.wait_for(
+                    lambda: (send_full or status_cursor > cursor or pending_progress
+                             or files_version != seen_files_version),
+                    timeout=poll_interval
+                )
+            
+            # 合并：距上次推送不足最小间隔时先等待，期间的更新会合并到同一个事件中
+            wait = last_sent + min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            
+            # 空闲到心跳间隔时检查目录是否被外部修改（由文件索引重新扫描，并递增 files_version）
+            heartbeat_due = time.monotonic() - last_heartbeat >= SSE_HEARTBEAT_INTERVAL
+            if heartbeat_due:
+                file_index.refresh_if_stale()
+            
+            with tasks_lock:
+                flush_progress_changes()
+                delta = build_status_delta(cursor) if send_full or status_cursor > cursor else None
+                current_files_version = files_version
+            send_full = False
+            
+            sent = False
+            if delta is not None:
+                cursor = delta['cursor']
+                payload = json.dumps(serialize_status_delta(delta), ensure_ascii=False)
+                yield f"event: status\nid: {cursor}\ndata: {payload}\n\n"
+                sent = True
+            
+            # 文件列表变化（本程序发布的文件，或目录被外部修改）
+            if current_files_version != seen_files_version:
+                seen_files_version = current_files_version
+                yield f"event: files\ndata: {json.dumps({'version': current_files_version})}\n\n"
+                sent = True
+            
+            if sent:
+                last_sent = last_heartbeat = time.monotonic()
+            elif heartbeat_due:
+                # 心跳，防止代理断开空闲连接
+                yield ': ping\n\n'
+                last_heartbeat = time.monotonic()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',  # 禁用 nginx 缓冲
+        }
+    )
+
+
+@app.route('/api/clear', methods=['POST'])
+def clear_tasks():
+    """
+    清除已完成的任务记录
+    
+    Returns:
+        JSON 响应，确认清除操作
+    """
+    with tasks_lock:
+        # 只保留正在进行中的任务
+        for task_id in [k for k, v in tasks_status.items() if v.status not in ACTIVE_STATUSES]:
+            remove_task(task_id)
+    
+    return jsonify({'success': True, 'message': '已清除完成的任务'})
+
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """
+    运行统计（缓存命中率等）
+    
+    Returns:
+        JSON 响应
+    """
+    return jsonify({
+        'success': True,
+        'metadata_cache': metadata_cache.stats(),
+        'jobs': job_store.stats(),
+        'queued': scheduler.queue_length(),
+        'ffmpeg': ffmpeg_stats.stats(),
+        'seek_index': seek_index.stats(),
+    })
+
+
+@app.route('/api/profiles', methods=['GET'])
+def get_profiles():
+    """
+    可用的输出档位（下载和本地提取共用）
+    
+    Returns:
+        JSON 响应，包含档位列表和默认档位名
+    """
+    return jsonify({
+        'success': True,
+        'profiles': [profile.to_dict() for profile in OUTPUT_PROFILES.values()],
+        'default': DEFAULT_PROFILE,
+    })
+
+
+@app.route('/api/files', methods=['GET'])
+def get_files():
+    """
+    获取已下载的 MP3 文件列表（来自内存索引，不再每次扫描目录）
+    
+    Query:
+        sort: 排序字段 modified（默认）/ name / size
+        order: desc（默认）/ asc
+        page: 页码，从 1 开始（不指定则返回全部文件）
+        per_page: 每页条数（默认 50）
+    
+    Returns:
+        JSON 响应，包含文件列表和详细信息；带 ETag，内容未变化时返回 304
+    """
+    try:
+        sort = request.args.get('sort', 'modified')
+        if sort not in FILE_SORT_KEYS:
+            return jsonify({'error': f'不支持的排序字段: {sort}'}), 400
+        descending = request.args.get('order', 'desc').lower() != 'asc'
+        
+        page = request.args.get('page', type=int)
+        per_page = request.args.get('per_page', 50, type=int)
+        if page is not None and (page < 1 or per_page < 1):
+            return jsonify({'error': 'page 和 per_page 必须为正整数'}), 400
+        
+        # 目录未变化且客户端已有同一查询的最新列表：直接返回 304
+        variant = f"{sort}-{'desc' if descending else 'asc'}" + (f'-{page}-{per_page}' if page is not None else '')
+        file_index.refresh_if_stale()
+        not_modified = not_modified_response(file_index.etag(variant=variant))
+        if not_modified is not None:
+            return not_modified
+        
+        if page is None:
+            files, total, version = file_index.listing(sort, descending)
+        else:
+            files, total, version = file_index.listing(
+                sort, descending, offset=(page - 1) * per_page, limit=per_page
+            )
+        result = {
+            'success': True,
+            'files': files,
+            'count': len(files),
+            'total': total,
+        }
+        if page is not None:
+            result['page'] = page
+            result['per_page'] = per_page
+        response = jsonify(result)
+        
+        response.set_etag(file_index.etag(version, variant))
+        response.headers['Cache-Control'] = 'no-cache'  # 每次使用前都向服务器验证
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# 音频文件按块发送的大小（字节）：每个请求占用的内存不超过一块
+AUDIO_CHUNK_SIZE = 256 * 1024
+# 单个请求最多接受的字节范围数（合并后），超过时忽略 Range 返回完整文件
+MAX_BYTE_RANGES = 16
+
+
+def parse_byte_ranges(range_header, file_size):
+    """
+    解析 Range 请求头（RFC 7233），支持多段和后缀范围（bytes=-N）
+    
+    Args:
+        range_header: Range 请求头的值
+        file_size: 文件大小（字节）
+    
+    Returns:
+        list: 合并后按起点排序的 (start, end) 列表（end 包含在内），空列表表示范围均不可满足；
+        None 表示请求头格式错误或范围过多，应忽略 Range 返回完整文件
+    """
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+    
+    ranges = []
+    for part in spec.split(','):
+        first, sep, last = part.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else None
+                if start < 0 or (end is not None and end < start):
+                    return None
+                if end is None:
+                    end = file_size - 1
+            else:
+                # 后缀范围：最后 N 个字节
+                suffix_length = int(last)
+                if suffix_length < 0:
+                    return None
+                if suffix_length == 0:
+                    continue
+                start = max(file_size - suffix_length, 0)
+                end = file_size - 1
+        except ValueError:
+            return None
+        if start >= file_size:
+            continue  # 不可满足的范围
+        ranges.append((start, min(end, file_size - 1)))
+    
+    # 合并重叠或相邻的范围，避免重复发送同一段数据
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    
+    if len(merged) > MAX_BYTE_RANGES:
+        return None
+    return merged
+
+
+def iter_file_range(file_path, start, length):
+    """按固定大小的块读取文件的一段，内存占用与范围大小无关"""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(AUDIO_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def if_range_matches(etag, last_modified):
+    """
+    检查 If-Range 条件：没有 If-Range，或其 ETag（强比较）/日期与当前文件一致时返回 True
+    """
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return not if_range.etag.startswith('W/') and if_range.etag.strip('"') == etag
+    if if_range.date is not None:
+        return if_range.date == last_modified
+    return 'If-Range' not in request.headers
+
+
+def file_body_to_eof(file_path, start):
+    """
+    从 start 开始一直发送到文件末尾
+    优先使用服务器提供的 wsgi.file_wrapper（如 gunicorn 会用 sendfile 零拷贝发送）
+    """
+    f = open(file_path, 'rb')
+    f.seek(start)
+    return wrap_file(request.environ, f, AUDIO_CHUNK_SIZE)
+
+
+@app.route('/api/audio/<filename>')
+def serve_audio(filename):
+    """
+    提供音频文件访问（支持 HTTP Range 请求，包括多段范围和后缀范围）
+    文件内容按固定大小的块发送，内存占用与文件或范围大小无关
+    
+    MP3 文件还支持按时间定位，由定位索引直接换算为帧边界的字节位置：
+        ?t=开始秒数[&end=结束秒数]  从包含开始时间的帧起返回（MP3 帧可以独立解码，播放器直接从这里播放），
+                                    返回内容视为一个独立的资源，其中同样可以按字节范围请求
+        Range: seconds=开始-[结束]  按时间范围请求，返回 206，Content-Range 为原文件中对应的字节范围
+    两种方式都在 X-Seek-Time 中返回实际开始的时间、X-Duration 中返回文件总时长
+    
+    Args:
+        filename: 音频文件名
+    
+    Returns:
+        音频文件响应（支持流式播放）
+    """
+    try:
+        from flask import Response, request
+        
+        # 安全检查：确保文件名不包含路径分隔符
+        if '/' in filename or '\\' in filename:
+            return jsonify({'error': 'Invalid filename'}), 400
+        
+        # URL 解码文件名（处理中文文件名）
+        filename = urllib.parse.unquote(filename)
+        
+        # 构建文件路径
+        file_path = MP3_DIR / filename
+        
+        # 检查文件是否存在
+        if not file_path.exists() or not file_path.is_file():
+            return jsonify({'error': 'File not found'}), 404
+        
+        # 检查文件扩展名
+        if file_path.suffix.lower() not in AUDIO_MIME_TYPES:
+            return jsonify({'error': 'Invalid file type'}), 400
+        
+        # 获取文件大小，并由大小和修改时间生成强校验值
+        stat = file_path.stat()
+        file_size = stat.st_size
+        etag = f'{stat.st_size:x}-{stat.st_mtime_ns:x}'
+        last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+        mimetype = AUDIO_MIME_TYPES[file_path.suffix.lower()]
+        
+        # 获取 Range 请求头（字节范围，或按时间定位的 seconds 范围）
+        range_header = request.headers.get('Range', None)
+        
+        # 按时间定位
+        seek_headers = {}
+        base_offset = 0  # ?t= 时返回内容在原文件中的起始偏移
+        time_range = None
+        if 't' in request.args:
+            time_range = parse_time_range(request.args['t'], request.args.get('end'))
+            if time_range is None:
+                return jsonify({'error': 'Invalid time'}), 400
+        elif range_header and range_header.strip().lower().startswith('seconds='):
+            range_start, _, range_end = range_header.split('=', 1)[1].partition('-')
+            time_range = parse_time_range(range_start.strip(), range_end.strip())
+            if time_range is None:
+                return Response('Range Not Satisfiable', status=416)
+        
+        if time_range is not None:
+            if file_path.suffix.lower() != '.mp3':
+                return jsonify({'error': 'Time seeking is only supported for MP3 files'}), 400
+            table = seek_index.get(file_path)
+            if table is None:
+                return jsonify({'error': 'Not a valid MP3 file'}), 400
+            seek_start, start_time = table.locate(file_path, time_range[0])
+            # 不指定结束时间时到最后一个音频帧为止，不包含文件末尾的 ID3v1 / APE 标签
+            seek_end = table.locate(file_path, time_range[1])[0] if time_range[1] is not None else table.audio_end
+            if time_range[0] >= table.duration or seek_start >= seek_end:
+                return Response('Range Not Satisfiable', status=416, headers={
+                    'Content-Range': f'bytes */{file_size}'
+                })
+            seek_headers = {
+                'X-Seek-Time': f'{start_time:.3f}',
+                'X-Duration': f'{table.duration:.3f}',
+                'Access-Control-Expose-Headers': 'X-Seek-Time, X-Duration, Content-Range',
+            }
+            if 't' in request.args:
+                # 返回内容为原文件的 [seek_start, seek_end) 部分，校验值随之区分
+                base_offset = seek_start
+                file_size = seek_end - seek_start
+                etag = f'{etag}-{seek_start:x}-{seek_end:x}'
+            else:
+                range_header = f'bytes={seek_start}-{seek_end - 1}'
+        
+        # 客户端缓存仍然有效：304，不发送文件内容
+        not_modified = not_modified_response(etag, last_modified, cache_control='public, max-age=3600')
+        if not_modified is not None:
+            return not_modified
+        
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': 'public, max-age=3600',
+            'ETag': f'"{etag}"',
+            'Last-Modified': http_date(last_modified),
+            **seek_headers,
+        }
+        
+        # 带 If-Range 时，只有校验值仍然匹配才按范围返回，否则返回完整文件
+        if range_header and not if_range_matches(etag, last_modified):
+            range_header = None
+        ranges = parse_byte_ranges(range_header, file_size) if range_header else None
+        
+        def body_for(start, length):
+            # 一直到（原）文件末尾（浏览器常见的 bytes=N-）：交给 file_wrapper 发送
+            if base_offset + start + length == stat.st_size:
+                return file_body_to_eof(file_path, base_offset + start)
+            return iter_file_range(file_path, base_offset + start, length)
+        
+        if ranges == []:
+            return Response('Range Not Satisfiable', status=416, headers={
+                'Content-Range': f'bytes */{file_size}'
+            })
+        
+        if ranges and len(ranges) > 1:
+            # 多段范围：multipart/byteranges，各段依次按块发送
+            boundary = uuid.uuid4().hex
+            part_headers = [
+                (
+                    f'\r\n--{boundary}\r\n'
+                    f'Content-Type: {mimetype}\r\n'
+                    f'Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n'
+                ).encode('ascii')
+                for start, end in ranges
+            ]
+            closing = f'\r\n--{boundary}--\r\n'.encode('ascii')
+            content_length = sum(len(h) for h in part_headers) + len(closing) + sum(
+                end - start + 1 for start, end in ranges
+            )
+            
+            def generate_parts():
+                for part_header, (start, end) in zip(part_headers, ranges):
+                    yield part_header
+                    yield from iter_file_range(file_path, base_offset + start, end - start + 1)
+                yield closing
+            
+            headers['Content-Length'] = str(content_length)
+            return Response(
+                generate_parts(),
+                status=206,
+                content_type=f'multipart/byteranges; boundary={boundary}',
+                headers=headers,
+                direct_passthrough=True
+            )
+        
+        if ranges:
+            # 单段范围：返回 206 Partial Content
+            byte_start, byte_end = ranges[0]
+            content_length = byte_end - byte_start + 1
+            headers['Content-Range'] = f'bytes {byte_start}-{byte_end}/{file_size}'
+            body = body_for(byte_start, content_length)
+            status = 206
+        else:
+            # 没有 Range 请求或格式错误，返回完整文件（?t= 时为定位后的部分）
+            content_length = file_size
+            body = body_for(0, file_size)
+            status = 200
+        
+        headers['Content-Length'] = str(content_length)
+        return Response(
+            body,
+            status=status,
+            mimetype=mimetype,
+            headers=headers,
+            direct_passthrough=True  # 不经 Werkzeug 再次包装，保留 file_wrapper
+        )
+        
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
+def format_size(size_bytes):
+    """
+    格式化文件大小
+    
+    Args:
+        size_bytes: 文件大小（字节）
+    
+    Returns:
+        格式化后的字符串（如 "1.5 MB"）
+    """
+    if size_bytes == 0:
+        return "0 B"
+    
+    units = ['B', 'KB', 'MB', 'GB', 'TB']
+    unit_index = 0
+    size = float(size_bytes)
+    
+    while size >= 1024 and unit_index < len(units) - 1:
+        size /= 1024
+        unit_index += 1
+    
+    return f"{size:.2f} {units[unit_index]}"
+
+
+def format_speed(speed_str):
+    """
+    格式化下载速度
+    
+    Args:
+        speed_str: 速度（字节/秒的数值，或 yt-dlp 的速度字符串如 "2.5MiB/s"）
+    
+    Returns:
+        格式化后的字符串（如 "2.5 MB/s"）
+    """
+    if speed_str == 'N/A' or not speed_str:
+        return 'N/A'
+    
+    if isinstance(speed_str, (int, float)):
+        return f"{format_size(speed_str)}/s"
+    
+    # yt-dlp 返回的速度格式可能是 "2.5MiB/s" 或 "2.5 MB/s"
+    # 统一转换为 "MB/s" 格式
+    try:
+        # 移除空格和单位，提取数字
+        match = re.search(r'([\d.]+)', speed_str)
+        if match:
+            num = float(match.group(1))
+            # 如果包含 MiB 或 MB，保持原样；否则假设是 MB/s
+            if 'MiB' in speed_str or 'MB' in speed_str:
+                return speed_str.replace('MiB', 'MB')
+            return f"{num:.2f} MB/s"
+    except:
+        pass
+    
+    return speed_str
+
+
+def format_time(seconds):
+    """
+    格式化时间（秒）
+    
+    Args:
+        seconds: 秒数
+    
+    Returns:
+        格式化后的字符串（如 "1分30秒"）
+    """
+    if seconds < 60:
+        return f"{int(seconds)}秒"
+    elif seconds < 3600:
+        minutes = int(seconds // 60)
+        secs = int(seconds % 60)
+        return f"{minutes}分{secs}秒"
+    else:
+        hours = int(seconds // 3600)
+        minutes = int((seconds % 3600) // 60)
+        secs = int(seconds % 60)
+        return f"{hours}小时{minutes}分{secs}秒"
+
+
+def format_eta(eta_str):
+    """
+    格式化剩余时间
+    
+    Args:
+        eta_str: 剩余秒数，或 ETA 字符串（如 "00:02:30"）
+    
+    Returns:
+        格式化后的字符串（如 "剩余2分30秒"）
+    """
+    if isinstance(eta_str, (int, float)):
+        return f"剩余{format_time(eta_str)}"
+    
+    if eta_str == 'N/A' or not eta_str:
+        return '计算中...'
+    
+    # yt-dlp 返回的格式可能是 "00:02:30" 或 "2:30"
+    try:
+        parts = eta_str.split(':')
+        if len(parts) == 3:
+            hours, minutes, seconds = map(int, parts)
+            if hours > 0:
+                return f"剩余{hours}小时{minutes}分{seconds}秒"
+            elif minutes > 0:
+                return f"剩余{minutes}分{seconds}秒"
+            else:
+                return f"剩余{seconds}秒"
+        elif len(parts) == 2:
+            minutes, seconds = map(int, parts)
+            return f"剩余{minutes}分{seconds}秒"
+    except:
+        pass
+    
+    return f"剩余{eta_str}"
+
+
+# 每个 MP3 文件除音频帧以外的开销（ffmpeg 写入的 ID3v2 标签和 Xing/LAME 信息帧），按上限估算
+MP3_HEADER_OVERHEAD = 4096
+# 按时间切分时每段的目标大小占上限的比例：切点落在帧 / 数据包边界，码率也有局部波动，留少量余量
+SEGMENT_FILL_RATIO = 0.98
+
+
+def estimate_audio_size(duration_seconds, bitrate_kbps=192, format='mp3'):
+    """
+    估算音频文件大小
+    
+    Args:
+        duration_seconds: 音频时长（秒）
+        bitrate_kbps: 比特率（kbps，1 kbps = 1000 bit/s）；VBR 时传码率上限，
+            WAV 为 采样率 × 位深 × 声道数（见 OutputProfile.nominal_kbps）
+        format: 音频格式
+    
+    Returns:
+        估算的文件大小（字节）
+    """
+    # 音频文件大小计算公式：文件大小(字节) = 比特率(kbps) × 1000 × 时长(秒) / 8，再加上文件头
+    size_bytes = (bitrate_kbps * 1000 * duration_seconds) / 8
+    if format == 'mp3':
+        size_bytes += MP3_HEADER_OVERHEAD
+    elif format == 'wav':
+        size_bytes += 44  # RIFF 文件头
+    
+    return int(size_bytes)
+
+
+def calculate_segments(duration_seconds, max_size_mb=MAX_PART_MB, bitrate_kbps=192, format='mp3', total_bytes=None):
+    """
+    计算音频文件需要分割的段数和每段时长
+    已知实际文件大小时按实际大小规划，否则按比特率估算；段数取使每段都不超过上限的最小值
+    
+    Args:
+        duration_seconds: 总时长（秒）
+        max_size_mb: 单个文件的大小上限（MB）
+        bitrate_kbps: 比特率（kbps）
+        format: 音频格式
+        total_bytes: 实际（或已编码）的文件大小，None 时估算
+    
+    Returns:
+        list: 每段的开始时间和结束时间（秒）
+    """
+    max_size_bytes = max_size_mb * 1024 * 1024
+    if total_bytes is None:
+        total_bytes = estimate_audio_size(duration_seconds, bitrate_kbps, format)
+    
+    # 如果不需要分割，直接返回一段
+    if total_bytes <= max_size_bytes:
+        return [(0, duration_seconds)]
+    
+    # 计算需要的段数：每段的音频数据不超过上限的 SEGMENT_FILL_RATIO（扣除每个文件的头部开销）
+    overhead = MP3_HEADER_OVERHEAD if format == 'mp3' else 0
+    num_segments = math.ceil((total_bytes - overhead) / (max_size_bytes * SEGMENT_FILL_RATIO - overhead))
+    
+    # 计算每段时长（平均分配）
+    segment_duration = duration_seconds / num_segments
+    
+    # 生成每段的时间范围
+    segments = []
+    for i in range(num_segments):
+        start_time = i * segment_duration
+        end_time = min((i + 1) * segment_duration, duration_seconds)
+        segments.append((start_time, end_time))
+    
+    return segments
+
+
+def max_segment_duration(max_size_mb=MAX_PART_MB, bitrate_kbps=192, format='mp3'):
+    """
+    单个分段文件不超过大小上限时的最大时长（总时长未知、只能定长切分时使用）
+    
+    Returns:
+        float: 时长（秒）
+    """
+    overhead = MP3_HEADER_OVERHEAD if format == 'mp3' else 0
+    usable_bytes = max_size_mb * 1024 * 1024 * SEGMENT_FILL_RATIO - overhead
+    return usable_bytes / (estimate_audio_size(1000, bitrate_kbps, format) - overhead) * 1000
+
+
+def generate_segment_filename(base_name, segment_index, total_segments, extension='mp3'):
+    """
+    为分割后的音频文件生成有逻辑的文件名
+    
+    Args:
+        base_name: 基础文件名
+        segment_index: 段索引（从1开始）
+        total_segments: 总段数
+        extension: 文件扩展名
+    
+    Returns:
+        str: 完整的文件名
+    """
+    # 如果只有一段，不添加分段标识
+    if total_segments == 1:
+        return f"{base_name}.{extension}"
+    
+    # 生成分段标识，确保文件名长度合理
+    segment_padding = len(str(total_segments))
+    segment_str = f"_part{segment_index:0{segment_padding}d}"
+    
+    return f"{base_name}{segment_str}.{extension}"
+
+
+# =========================================================================
+# 媒体时长探测（直接读取容器头，不解码）
+# =========================================================================
+
+# MPEG 音频帧头查表：比特率（kbps），按 (MPEG 版本是否为 1, 层) 索引
+MP3_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# 采样率（Hz），按 MPEG 版本位索引：3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    0: [11025, 12000, 8000],
+}
+
+
+def parse_mp3_frame_header(header):
+    """
+    解析 4 字节的 MPEG 音频帧头
+    
+    Args:
+        header: 帧头的 4 个字节
+    
+    Returns:
+        dict: 帧信息（bitrate_kbps、sample_rate、samples、frame_size、side_info_size 等），
+              不是合法帧头时返回 None
+    """
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = (header[2] >> 4) & 0x0F
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    channel_mode = (header[3] >> 6) & 0x03
+    
+    # 排除保留值
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    
+    is_mpeg1 = version_bits == 3
+    layer = 4 - layer_bits
+    bitrate_kbps = MP3_BITRATES[(is_mpeg1, layer)][bitrate_index]
+    sample_rate = MP3_SAMPLE_RATES[version_bits][sample_rate_index]
+    
+    if layer == 1:
+        samples = 384
+        frame_size = (12 * bitrate_kbps * 1000 // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or is_mpeg1) else 576
+        frame_size = samples // 8 * bitrate_kbps * 1000 // sample_rate + padding
+    
+    mono = channel_mode == 3
+    if is_mpeg1:
+        side_info_size = 17 if mono else 32
+    else:
+        side_info_size = 9 if mono else 17
+    
+    return {
+        'is_mpeg1': is_mpeg1,
+        'layer': layer,
+        'bitrate_kbps': bitrate_kbps,
+        'sample_rate': sample_rate,
+        'samples': samples,
+        'frame_size': frame_size,
+        'side_info_size': side_info_size,
+        'channels': 1 if mono else 2,
+    }
+
+
+def skip_id3v2(data):
+    """
+    计算文件开头 ID3v2 标签的长度
+    
+    Args:
+        data: 文件开头的字节（至少 10 字节）
+    
+    Returns:
+        int: 标签长度（字节），没有标签时返回 0
+    """
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    # 标签大小为 4 个 7 位的同步安全整数
+    size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def find_mp3_first_frame(f, start, search_limit=64 * 1024):
+    """
+    从 start 位置开始查找第一个合法的 MPEG 音频帧
+    要求紧随其后还有一个合法帧头，以排除数据中偶然出现的同步字
+    
+    Args:
+        f: 以二进制模式打开的文件对象
+        start: 开始查找的偏移
+        search_limit: 最多查找的字节数
+    
+    Returns:
+        tuple: (帧偏移, 帧信息)，找不到时返回 (None, None)
+    """
+    f.seek(start)
+    data = f.read(search_limit + 4)
+    pos = data.find(b'\xff')
+    while 0 <= pos < len(data) - 4:
+        frame = parse_mp3_frame_header(data[pos:pos + 4])
+        if frame:
+            next_pos = pos + frame['frame_size']
+            if next_pos + 4 > len(data):
+                return start + pos, frame
+            if parse_mp3_frame_header(data[next_pos:next_pos + 4]):
+                return start + pos, frame
+        pos = data.find(b'\xff', pos + 1)
+    return None, None
+
+
+def probe_mp3_duration(path):
+    """
+    读取 MP3 文件时长（Xing/Info 或 VBRI 头中的帧数，CBR 文件按比特率计算）
+    
+    Args:
+        path: MP3 文件路径
+    
+    Returns:
+        float: 时长（秒），无法解析时返回 0
+    """
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        audio_start = skip_id3v2(f.read(10))
+        offset, frame = find_mp3_first_frame(f, audio_start)
+        if frame is None:
+            return 0
+        
+        f.seek(offset)
+        first_frame = f.read(max(frame['frame_size'], 4 + 32 + 120))
+        
+        # Xing/Info 头位于边信息之后
+        xing_pos = 4 + frame['side_info_size']
+        tag = first_frame[xing_pos:xing_pos + 4]
+        if tag in (b'Xing', b'Info'):
+            flags = int.from_bytes(first_frame[xing_pos + 4:xing_pos + 8], 'big')
+            if flags & 0x01:
+                frames = int.from_bytes(first_frame[xing_pos + 8:xing_pos + 12], 'big')
+                return frames * frame['samples'] / frame['sample_rate']
+        
+        # VBRI 头固定位于帧头后 32 字节处
+        if first_frame[36:40] == b'VBRI':
+            frames = int.from_bytes(first_frame[50:54], 'big')
+            return frames * frame['samples'] / frame['sample_rate']
+        
+        # 没有 VBR 头，按 CBR 计算（扣除末尾的 ID3v1 标签）
+        f.seek(max(0, file_size - 128))
+        id3v1 = 128 if f.read(3) == b'TAG' else 0
+    
+    audio_bytes = file_size - offset - id3v1
+    return audio_bytes * 8 / (frame['bitrate_kbps'] * 1000)
+
+
+def probe_mp4_duration(path):
+    """
+    读取 MP4/MOV/M4A 文件时长（moov/mvhd 原子），moov 在文件末尾时直接跳过 mdat
+    
+    Args:
+        path: 文件路径
+    
+    Returns:
+        float: 时长（秒），无法解析时返回 0
+    """
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        moov_end = None
+        pos = 0
+        while pos + 8 <= file_size:
+            f.seek(pos)
+            header = f.read(16)
+            size = int.from_bytes(header[:4], 'big')
+            box_type = header[4:8]
+            header_size = 8
+            if size == 1:
+                size = int.from_bytes(header[8:16], 'big')
+                header_size = 16
+            elif size == 0:
+                size = file_size - pos
+            if size < header_size:
+                return 0
+            if box_type == b'moov':
+                pos += header_size
+                moov_end = pos - header_size + size
+                continue
+            if box_type == b'mvhd' and moov_end is not None:
+                f.seek(pos + header_size)
+                body = f.read(32)
+                version = body[0]
+                if version == 1:
+                    timescale = int.from_bytes(body[20:24], 'big')
+                    duration = int.from_bytes(body[24:32], 'big')
+                else:
+                    timescale = int.from_bytes(body[12:16], 'big')
+                    duration = int.from_bytes(body[16:20], 'big')
+                return duration / timescale if timescale else 0
+            pos += size
+            if moov_end is not None and pos >= moov_end:
+                return 0
+    return 0
+
+
+def probe_wav_duration(path):
+    """
+    读取 WAV 文件时长（fmt 块的字节率和 data 块的大小）
+    
+    Args:
+        path: WAV 文件路径
+    
+    Returns:
+        float: 时长（秒），无法解析时返回 0
+    """
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return 0
+        byte_rate = 0
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return 0
+            chunk_id = chunk[:4]
+            chunk_size = int.from_bytes(chunk[4:8], 'little')
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                byte_rate = int.from_bytes(fmt[8:12], 'little')
+                continue
+            if chunk_id == b'data':
+                return chunk_size / byte_rate if byte_rate else 0
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def probe_container_duration(path):
+    """
+    不启动外部进程，直接从容器头读取时长
+    
+    Args:
+        path: 媒体文件路径
+    
+    Returns:
+        float: 时长（秒），格式不支持或解析失败时返回 0
+    """
+    suffix = Path(path).suffix.lower()
+    try:
+        if suffix == '.mp3':
+            return probe_mp3_duration(path)
+        if suffix in ('.mp4', '.m4a', '.mov', '.m4v', '.3gp'):
+            return probe_mp4_duration(path)
+        if suffix == '.wav':
+            return probe_wav_duration(path)
+    except (OSError, IndexError, ValueError) as e:
+        print(f"解析容器头失败: {e}")
+    return 0
+
+
+def probe_command():
+    """
+    媒体信息探测使用的命令：优先使用 ffmpeg 同目录或系统 PATH 中的 ffprobe，找不到时回退到 ffmpeg
+    
+    Returns:
+        list: 命令前缀
+    """
+    if FFMPEG_PATH:
+        # 如果有FFMPEG_PATH，那么ffprobe应该在相同目录
+        ffprobe_path = Path(FFMPEG_PATH).parent / 'ffprobe'
+        if ffprobe_path.exists():
+            return [str(ffprobe_path)]
+        ffprobe_path = shutil.which('ffprobe')
+        # 回退到使用ffmpeg
+        return [ffprobe_path] if ffprobe_path else [FFMPEG_PATH]
+    # 尝试使用系统中的ffprobe或ffmpeg
+    ffprobe_path = shutil.which('ffprobe')
+    return [ffprobe_path] if ffprobe_path else ['ffmpeg']
+
+
+def get_video_duration(video_path):
+    """
+    获取媒体文件的时长
+    优先直接读取容器头（MP3/MP4/MOV/WAV，毫秒级），
+    失败时回退到 ffprobe -show_entries format=duration，最后再从 ffmpeg -i 的输出中解析
+    
+    Args:
+        video_path: 视频文件路径
+    
+    Returns:
+        float: 视频时长（秒）
+    """
+    duration = probe_container_duration(video_path)
+    if duration > 0:
+        return duration
+    
+    probe_cmd = probe_command()
+    if Path(probe_cmd[0]).name.startswith('ffprobe'):
+        # 使用ffprobe读取容器级时长（纯音频文件没有视频流，不能只看 v:0）
+        cmd = probe_cmd + [
+            '-v', 'quiet',
+            '-show_entries', 'format=duration',
+            '-of', 'csv=p=0:nk=1',
+            '-i', str(video_path)
+        ]
+    else:
+        # 只打开输入读取头信息，不解码（ffmpeg 会因缺少输出文件而返回非零退出码）
+        cmd = probe_cmd + [
+            '-hide_banner',
+            '-i', str(video_path)
+        ]
+    
+    try:
+        print(f"执行时长获取命令: {' '.join(cmd)}")
+        result = subprocess.run(
+            cmd,
+            check=False,  # 不使用check=True，因为ffmpeg可能返回非零退出码但仍然能输出时长
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+        
+        # 尝试从stdout获取时长
+        duration_str = result.stdout.strip()
+        if duration_str and duration_str != 'N/A':
+            return float(duration_str)
+        
+        # 如果stdout没有，尝试从stderr解析（ffmpeg 把输入信息输出到stderr）
+        match = re.search(r'Duration: ([0-9]{2}):([0-9]{2}):([0-9]{2})\.([0-9]{2})', result.stderr)
+        if match:
+            hours = int(match.group(1))
+            minutes = int(match.group(2))
+            seconds = int(match.group(3))
+            milliseconds = int(match.group(4))
+            total_seconds = hours * 3600 + minutes * 60 + seconds + milliseconds / 100
+            return total_seconds
+        
+        print("无法从输出中解析时长")
+        return 0
+    except Exception as e:
+        print(f"获取视频时长失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return 0
+
+
+# 可以直接流复制保存的源音频编码（ffprobe 的 codec_name）-> 输出扩展名
+COPY_CONTAINERS = {
+    'aac': 'm4a',
+    'alac': 'm4a',
+    'mp3': 'mp3',
+    'opus': 'opus',
+    'vorbis': 'ogg',
+    'flac': 'flac',
+    'pcm_s16le': 'wav',
+}
+# 转码输出格式 -> 可以直接复制的源音频编码
+FORMAT_SOURCE_CODECS = {
+    'mp3': 'mp3',
+    'wav': 'pcm_s16le',
+}
+
+
+def probe_audio_stream(path):
+    """
+    读取媒体文件第一条音轨的编码和比特率
+    
+    Args:
+        path: 媒体文件路径
+    
+    Returns:
+        dict: {'codec': 编码名或 None, 'bitrate_kbps': 比特率或 None}
+    """
+    probe_cmd = probe_command()
+    if Path(probe_cmd[0]).name.startswith('ffprobe'):
+        cmd = probe_cmd + [
+            '-v', 'quiet',
+            '-select_streams', 'a:0',
+            '-show_entries', 'stream=codec_name,bit_rate',
+            '-of', 'json',
+            '-i', str(path)
+        ]
+    else:
+        cmd = probe_cmd + ['-hide_banner', '-i', str(path)]
+    
+    try:
+        result = subprocess.run(cmd, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        if result.stdout.strip():
+            streams = json.loads(result.stdout).get('streams') or [{}]
+            codec = streams[0].get('codec_name')
+            bit_rate = streams[0].get('bit_rate')
+            return {
+                'codec': codec,
+                'bitrate_kbps': int(bit_rate) / 1000 if bit_rate and bit_rate.isdigit() else None,
+            }
+        # ffmpeg -i 的输出: "Stream #0:1(und): Audio: aac (LC) (mp4a / 0x6134706D), 48000 Hz, stereo, fltp, 128 kb/s"
+        match = re.search(r'Stream #\S+: Audio: (\w+)(.*)', result.stderr)
+        if match:
+            bitrate = re.search(r'(\d+) kb/s', match.group(2))
+            return {'codec': match.group(1), 'bitrate_kbps': float(bitrate.group(1)) if bitrate else None}
+    except Exception as e:
+        print(f"读取音轨信息失败: {e}")
+    return {'codec': None, 'bitrate_kbps': None}
+
+
+def plan_audio_output(source_codec, profile, source_bitrate_kbps=None):
+    """
+    根据源音频编码选择输出扩展名，并判断能否直接流复制（不转码）
+    源音轨已是档位的编码、且比特率不高于档位时直接复制（低码率的源重新编码不会提升音质）
+    
+    Args:
+        source_codec: 源音频编码（ffprobe 的 codec_name），未知时为 None
+        profile: 请求的输出档位（OutputProfile）
+        source_bitrate_kbps: 源音轨的比特率，未知时不按比特率判断
+    
+    Returns:
+        tuple: (扩展名, 是否流复制, 重新编码时使用的档位)；original 遇到无法直接保存的编码时按默认档位转码
+    """
+    if profile.codec == 'original':
+        ext = COPY_CONTAINERS.get(source_codec)
+        if ext:
+            return ext, True, profile
+        profile = get_output_profile(DEFAULT_PROFILE)
+        return profile.codec, False, profile
+    copy = (
+        source_codec is not None
+        and FORMAT_SOURCE_CODECS.get(profile.codec) == source_codec
+        and (source_bitrate_kbps is None or source_bitrate_kbps <= profile.nominal_kbps * 1.05)
+    )
+    return profile.codec, copy, profile
+
+
+# =========================================================================
+# MP3 无损分割（按帧边界切分，不调用 ffmpeg、不重新编码）
+# =========================================================================
+
+# Xing/Info 头各字段是否存在的标志位
+XING_FLAG_FRAMES = 0x01
+XING_FLAG_BYTES = 0x02
+XING_FLAG_TOC = 0x04
+XING_FLAG_QUALITY = 0x08
+# LAME 扩展头的长度（紧跟在 Xing/Info 头之后），其中编码器延迟 / 填充、音乐长度和两个 CRC 的偏移
+LAME_TAG_SIZE = 36
+LAME_DELAY_OFFSET = 21
+LAME_MUSIC_LENGTH_OFFSET = 28
+LAME_MUSIC_CRC_OFFSET = 32
+LAME_TAG_CRC_OFFSET = 34
+
+
+def _make_crc16_table():
+    """CRC-16/ARC（多项式 0x8005，反射）查表，LAME 头的校验和使用该算法"""
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC16_TABLE = _make_crc16_table()
+
+
+def crc16(data, crc=0):
+    for byte in data:
+        crc = (crc >> 8) ^ CRC16_TABLE[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def parse_xing_header(frame_bytes, frame):
+    """
+    解析帧中的 Xing/Info 头和 LAME 扩展头
+    
+    Args:
+        frame_bytes: 整个帧的字节
+        frame: parse_mp3_frame_header 返回的帧信息
+    
+    Returns:
+        dict: {'tag', 'flags', 'xing_pos', 'lame_pos'（没有 LAME 头时为 None）, 'delay', 'padding'}，
+              不是 Xing/Info 帧时返回 None
+    """
+    xing_pos = 4 + frame['side_info_size']
+    tag = frame_bytes[xing_pos:xing_pos + 4]
+    if tag not in (b'Xing', b'Info'):
+        return None
+    flags = int.from_bytes(frame_bytes[xing_pos + 4:xing_pos + 8], 'big')
+    # Xing 头长度：标识 + 标志位 + 按标志位出现的帧数、字节数、TOC、质量
+    xing_size = 8 + (4 if flags & XING_FLAG_FRAMES else 0) + (4 if flags & XING_FLAG_BYTES else 0) \
+        + (100 if flags & XING_FLAG_TOC else 0) + (4 if flags & XING_FLAG_QUALITY else 0)
+    lame_pos = xing_pos + xing_size
+    delay = padding = 0
+    if lame_pos + LAME_TAG_SIZE <= len(frame_bytes) and frame_bytes[lame_pos:lame_pos + 3] in (b'LAM', b'Lav'):
+        b0, b1, b2 = frame_bytes[lame_pos + LAME_DELAY_OFFSET:lame_pos + LAME_DELAY_OFFSET + 3]
+        delay = b0 << 4 | b1 >> 4
+        padding = (b1 & 0x0F) << 8 | b2
+    else:
+        lame_pos = None
+    return {
+        'tag': tag,
+        'flags': flags,
+        'xing_pos': xing_pos,
+        'lame_pos': lame_pos,
+        'delay': delay,
+        'padding': padding,
+    }
+
+
+def index_mp3_frames(path):
+    """
+    顺序扫描一遍 MP3 文件（内存映射），建立音频帧的偏移索引
+    
+    Args:
+        path: MP3 文件路径
+    
+    Returns:
+        dict: {
+            'offsets': array('Q')，每个音频帧的起始偏移，末尾追加音频数据的结束偏移,
+            'frame': 第一个音频帧的帧信息,
+            'first_header': 第一个音频帧的帧头（4 字节）,
+            'id3v2': 文件开头的 ID3v2 标签（原样复制到每个分段）,
+            'info_frame': 原文件的 Xing/Info 帧（没有时为 None）,
+            'xing': parse_xing_header 的结果（没有时为 None）,
+            'vbr': 是否出现了不同比特率的帧,
+        }
+    
+    Raises:
+        ValueError: 找不到 MPEG 音频帧
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        id3v2_size = min(skip_id3v2(mm[:10]), size)
+        
+        # 音频数据的结束位置：去掉末尾的 ID3v1 和 APEv2 标签
+        end = size
+        if end - id3v2_size >= 128 and mm[end - 128:end - 125] == b'TAG':
+            end -= 128
+        if end - id3v2_size >= 32 and mm[end - 32:end - 24] == b'APETAGEX':
+            ape_size = int.from_bytes(mm[end - 20:end - 16], 'little')
+            has_header = mm[end - 9] & 0x80
+            end = max(id3v2_size, end - ape_size - (32 if has_header else 0))
+        
+        first, frame = find_mp3_first_frame(f, id3v2_size)
+        if frame is None:
+            raise ValueError('找不到 MPEG 音频帧')
+        
+        # 第一个帧是 Xing/Info 头时不属于音频数据，分段时按分段内容重写
+        info_frame = xing = None
+        head = mm[first:first + frame['frame_size']]
+        if len(head) == frame['frame_size']:
+            xing = parse_xing_header(head, frame)
+            if xing is not None or head[36:40] == b'VBRI':
+                info_frame = head if xing is not None else None
+                first += frame['frame_size']
+        
+        # 只接受与第一个帧的 MPEG 版本、层和采样率一致的帧头，减少误判的同步字
+        first_header = mm[first:first + 4]
+        if len(first_header) < 4 or first + 4 > end:
+            raise ValueError('找不到 MPEG 音频帧')
+        stream_key = (first_header[1] & 0xFE, first_header[2] & 0x0C)
+        frame_sizes = {}  # 帧头第 2、3 字节 -> 帧长度（不合法时为 0）
+        bitrates = set()
+        
+        def frame_size_at(pos):
+            if mm[pos] != 0xFF:
+                return 0
+            key = mm[pos + 1] << 8 | mm[pos + 2]
+            size = frame_sizes.get(key)
+            if size is None:
+                header = parse_mp3_frame_header(mm[pos:pos + 4])
+                valid = header is not None and (mm[pos + 1] & 0xFE, mm[pos + 2] & 0x0C) == stream_key
+                size = frame_sizes[key] = header['frame_size'] if valid else 0
+                if valid:
+                    bitrates.add(header['bitrate_kbps'])
+            return size
+        
+        offsets = array('Q')
+        audio_end = pos = first
+        synced = True
+        while pos + 4 <= end:
+            frame_size = frame_size_at(pos)
+            next_pos = pos + frame_size
+            # 失步后重新找到的帧头还要求紧接着的下一个帧头也合法
+            if frame_size and next_pos <= end and (synced or next_pos + 4 > end or frame_size_at(next_pos)):
+                offsets.append(pos)
+                audio_end = pos = next_pos
+                synced = True
+                continue
+            if frame_size and synced and next_pos > end:
+                break  # 末尾不完整的帧
+            # 失步（中间夹杂了其他数据）：跳到下一个同步字
+            synced = False
+            pos = mm.find(b'\xff', pos + 1, end)
+            if pos < 0:
+                break
+        
+        if not offsets:
+            raise ValueError('找不到 MPEG 音频帧')
+        offsets.append(audio_end)
+        id3v2 = mm[:id3v2_size]
+    
+    return {
+        'offsets': offsets,
+        'frame': frame,
+        'first_header': first_header,
+        'id3v2': id3v2,
+        'info_frame': info_frame,
+        'xing': xing,
+        'vbr': len(bitrates) > 1,
+    }
+
+
+def build_mp3_info_frame(index, frame_offsets, delay, padding):
+    """
+    为一个分段生成 Xing/Info 帧：帧数、字节数和 TOC 按分段内容计算；
+    原文件有 LAME 头时以它为模板，保留编码器信息，改写编码器延迟 / 填充、音乐长度和校验和
+    
+    Args:
+        index: index_mp3_frames 的结果
+        frame_offsets: 分段内各帧的起始偏移，末尾为分段的结束偏移
+        delay: 分段开头需要去掉的编码器延迟（采样数）
+        padding: 分段末尾需要去掉的填充（采样数）
+    
+    Returns:
+        bytes: 完整的 Xing/Info 帧
+    """
+    frame = index['frame']
+    frame_count = len(frame_offsets) - 1
+    audio_bytes = frame_offsets[-1] - frame_offsets[0]
+    
+    if index['xing'] is not None and index['xing']['flags'] & XING_FLAG_TOC:
+        data = bytearray(index['info_frame'])
+        xing = index['xing']
+    else:
+        # 没有可用的模板（无 Xing 头或只有 VBRI 头）：用第一个音频帧的帧头生成，
+        # 选能容纳 Xing 头的最小比特率，去掉 CRC 保护位和填充位，帧体其余部分为 0（解码为静音）
+        header = bytearray(index['first_header'])
+        header[1] |= 0x01
+        xing_pos = 4 + frame['side_info_size']
+        for bitrate_index in range(1, 15):
+            header[2] = (header[2] & 0x0C) | bitrate_index << 4
+            candidate = parse_mp3_frame_header(bytes(header))
+            if candidate['frame_size'] >= xing_pos + 8 + 4 + 4 + 100:
+                break
+        data = bytearray(candidate['frame_size'])
+        data[:4] = header
+        data[xing_pos:xing_pos + 4] = b'Xing' if index['vbr'] else b'Info'
+        data[xing_pos + 4:xing_pos + 8] = (XING_FLAG_FRAMES | XING_FLAG_BYTES | XING_FLAG_TOC).to_bytes(4, 'big')
+        xing = {'flags': XING_FLAG_FRAMES | XING_FLAG_BYTES | XING_FLAG_TOC, 'xing_pos': xing_pos, 'lame_pos': None}
+    
+    total_bytes = len(data) + audio_bytes
+    pos = xing['xing_pos'] + 8
+    if xing['flags'] & XING_FLAG_FRAMES:
+        data[pos:pos + 4] = frame_count.to_bytes(4, 'big')
+        pos += 4
+    if xing['flags'] & XING_FLAG_BYTES:
+        data[pos:pos + 4] = total_bytes.to_bytes(4, 'big')
+        pos += 4
+    if xing['flags'] & XING_FLAG_TOC:
+        # TOC[i] = 播放到 i% 时的字节位置 / 总字节数 × 256
+        start = frame_offsets[0]
+        for i in range(100):
+            offset = frame_offsets[i * frame_count // 100] - start
+            data[pos + i] = min(255, offset * 256 // max(audio_bytes, 1))
+    
+    lame_pos = xing['lame_pos']
+    if lame_pos is not None:
+        delay_pos = lame_pos + LAME_DELAY_OFFSET
+        data[delay_pos:delay_pos + 3] = bytes((delay >> 4, (delay & 0x0F) << 4 | padding >> 8, padding & 0xFF))
+        data[lame_pos + LAME_MUSIC_LENGTH_OFFSET:lame_pos + LAME_MUSIC_LENGTH_OFFSET + 4] = total_bytes.to_bytes(4, 'big')
+        # 音乐数据的 CRC 需要读遍整个分段，解码器不校验，置 0；头部自身的 CRC 必须正确，否则播放器会忽略 LAME 头
+        data[lame_pos + LAME_MUSIC_CRC_OFFSET:lame_pos + LAME_MUSIC_CRC_OFFSET + 2] = bytes(2)
+        tag_crc = crc16(data[:lame_pos + LAME_TAG_CRC_OFFSET])
+        data[lame_pos + LAME_TAG_CRC_OFFSET:lame_pos + LAME_TAG_CRC_OFFSET + 2] = tag_crc.to_bytes(2, 'big')
+    
+    return bytes(data)
+
+
+def split_mp3(path, output_dir, base_name, max_part_bytes, progress_callback=None):
+    """
+    把 MP3 文件按帧边界无损分割为多个不超过 max_part_bytes 的文件（不调用 ffmpeg、不重新编码）
+    先顺序扫描一遍建立帧索引，再按字节预算确定切点，每段用整块复制写出；
+    每段带原文件的 ID3v2 标签和按分段内容重写的 Xing/Info 帧，编码器延迟只保留在第一段、填充只保留在最后一段
+    （第一段以外的分段，开头一帧可能引用上一段的位储备，解码为约 26 毫秒的静音）
+    
+    Args:
+        path: MP3 文件路径
+        output_dir: 输出目录
+        base_name: 输出文件名基础
+        max_part_bytes: 单个文件的大小上限（字节）
+        progress_callback: 进度回调 callback(完成百分比, 实时倍率)
+    
+    Returns:
+        list: 生成的音频文件列表（与 extract_audio_segments 格式相同）
+    
+    Raises:
+        ValueError: 不是可以解析的 MPEG 音频流，或大小上限容不下单个帧
+    """
+    started = time.monotonic()
+    index = index_mp3_frames(path)
+    offsets = index['offsets']
+    frame_count = len(offsets) - 1
+    seconds_per_frame = index['frame']['samples'] / index['frame']['sample_rate']
+    xing = index['xing']
+    delay, padding = (xing['delay'], xing['padding']) if xing else (0, 0)
+    
+    # 每段的固定开销：ID3v2 标签 + Xing/Info 帧（长度与分段内容无关）
+    overhead = len(index['id3v2']) + len(build_mp3_info_frame(index, offsets[:2], 0, 0))
+    budget = max_part_bytes - overhead
+    audio_start, audio_end = offsets[0], offsets[-1]
+    if budget <= 0:
+        raise ValueError('分段大小上限小于文件头')
+    
+    # 段数取使每段都不超过预算的最小值；切点按字节平均分配，落在不超过目标位置的帧边界上
+    parts = math.ceil((audio_end - audio_start) / budget)
+    cuts = [0]  # 每段第一个帧的序号
+    while audio_end - offsets[cuts[-1]] > budget:
+        start = offsets[cuts[-1]]
+        remaining = max(parts - len(cuts) + 1, 1)
+        target = min(start + (audio_end - start) / remaining, start + budget)
+        cut = bisect.bisect_right(offsets, target) - 1
+        if cut <= cuts[-1]:
+            raise ValueError('分段大小上限小于单个帧')
+        cuts.append(cut)
+    cuts.append(frame_count)
+    
+    print(f"按帧分割为 {len(cuts) - 1} 段（共 {frame_count} 帧，每段不超过 {max_part_bytes / (1024 * 1024):.2f} MB）")
+    
+    # 先写入临时文件名，完成后再按 generate_segment_filename 的规则重命名
+    temp_prefix = f'.{base_name}.splitting'
+    segments = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            for i, (first, last) in enumerate(zip(cuts, cuts[1:])):
+                info_frame = build_mp3_info_frame(
+                    index, offsets[first:last + 1],
+                    delay if first == 0 else 0,
+                    padding if last == frame_count else 0
+                )
+                with open(output_dir / f'{temp_prefix}.{i:03d}.mp3', 'wb') as out:
+                    out.write(index['id3v2'])
+                    out.write(info_frame)
+                    out.write(view[offsets[first]:offsets[last]])
+                segments.append((first * seconds_per_frame, last * seconds_per_frame))
+                
+                if progress_callback is not None:
+                    elapsed = time.monotonic() - started
+                    progress_callback(
+                        (offsets[last] - audio_start) * 100 / (audio_end - audio_start),
+                        last * seconds_per_frame / elapsed if elapsed > 0 else None
+                    )
+        except BaseException:
+            for leftover in output_dir.glob(f'{glob.escape(temp_prefix)}.*.mp3'):
+                leftover.unlink()
+            raise
+        finally:
+            view.release()
+    
+    ffmpeg_stats.record('mp3split', frame_count * seconds_per_frame, time.monotonic() - started)
+    output_files = _collect_segment_outputs(output_dir, temp_prefix, base_name, segments, 'mp3')
+    file_index.publish(*(file_info['path'] for file_info in output_files))
+    return output_files
+
+
+# =========================================================================
+# ffmpeg 调用（-progress 进度解析、实时倍率统计）
+# =========================================================================
 
+# 插入到每条 ffmpeg 命令中的全局参数：进度以 key=value 行写到标准输出，
+# -nostats 关闭 stderr 上的进度行，stderr 只保留日志
+FFMPEG_PROGRESS_ARGS = ['-progress', 'pipe:1', '-nostats']
+# ffmpeg 失败时保留的 stderr 行数（错误信息在最后几行）
+FFMPEG_STDERR_TAIL_LINES = 50
 
-@app.route('/')
-def index():
+
+class RealtimeFactorStats:
     """
-    主页路由
-    返回 index.html 页面
+    按调用类别累计 ffmpeg 处理的媒体时长和实际耗时，得到单个进程的平均实时倍率
+    （用于评估 CPU 槽位 / 分段并行度的设置）
+    类别: convert（yt-dlp 转换）、encode（编码分段）、copy（流复制分段）、mp3split（按帧分割，不调用 ffmpeg）
     """
-    return render_template('index.html')
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}  # 类别 -> [次数, 媒体秒数, 实际秒数]
+    
+    def record(self, kind, media_seconds, wall_seconds):
+        if media_seconds <= 0 or wall_seconds <= 0:
+            return
+        with self._lock:
+            totals = self._totals.setdefault(kind, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += media_seconds
+            totals[2] += wall_seconds
+    
+    def stats(self):
+        with self._lock:
+            return {
+                kind: {
+                    'runs': runs,
+                    'media_seconds': round(media_seconds, 1),
+                    'wall_seconds': round(wall_seconds, 1),
+                    'realtime_factor': round(media_seconds / wall_seconds, 2),
+                }
+                for kind, (runs, media_seconds, wall_seconds) in self._totals.items()
+            }
 
 
-@app.route('/api/download', methods=['POST'])
-def start_download():
+ffmpeg_stats = RealtimeFactorStats()
+
+
+def with_progress_args(cmd):
+    """在 ffmpeg 可执行文件之后插入 -progress 参数"""
+    return cmd[:1] + FFMPEG_PROGRESS_ARGS + cmd[1:]
+
+
+def read_ffmpeg_progress(stream, duration=None, progress_callback=None):
     """
-    开始下载任务的 API 接口
-    接收前端发送的任务列表，为每个任务创建独立线程执行下载
+    解析 ffmpeg -progress 输出，每个进度块结束（progress=continue / end）时回调一次
+    
+    Args:
+        stream: ffmpeg 的标准输出（按行迭代的二进制流）
+        duration: 本次要处理的媒体时长（秒），未知时百分比为 None
+        progress_callback: 进度回调 callback(百分比, 实时倍率)，实时倍率未知时为 None
     
     Returns:
-        JSON 响应，包含任务 ID 列表
+        float: 已处理的媒体时长（秒）
     """
-    try:
-        # 获取前端发送的 JSON 数据
-        data = request.get_json()
-        tasks = data.get('tasks', [])
-        
-        if not tasks:
-            return jsonify({'error': '没有提供任务'}), 400
-        
-        task_ids = []
-        
-        # 为每个任务创建线程并启动
-        for task in tasks:
-            url = task.get('url', '').strip()
-            filename = task.get('filename', '').strip()
-            
-            if not url:
-                continue
-            
-            # 生成唯一的任务 ID
-            task_id = f"task_{len(tasks_status) + 1}"
-            task_ids.append(task_id)
-            
-            # 初始化任务状态
-            import time
-            with tasks_lock:
-                tasks_status[task_id] = {
-                    'url': url,
-                    'filename': filename,
-                    'status': 'pending',
-                    'progress': '0%',
-                    'progress_percent': 0,
-                    'speed': 'N/A',
-                    'speed_raw': 'N/A',
-                    'eta': 'N/A',
-                    'message': '等待开始...',
-                    'title': '',
-                    'start_time': time.time(),
-                    'downloaded_bytes': 0,
-                    'downloaded_str': '0 B',
-                    'total_bytes': 0,
-                    'total_str': '未知',
-                    'elapsed_time': 0,
-                    'elapsed_str': '0秒'
-                }
-            
-            # 创建并启动下载线程
-            thread = threading.Thread(
-                target=download_audio,
-                args=(url, filename, task_id),
-                daemon=True  # 守护线程，主程序退出时自动结束
-            )
-            thread.start()
-        
-        return jsonify({
-            'success': True,
-            'task_ids': task_ids,
-            'message': f'已启动 {len(task_ids)} 个下载任务'
-        })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    out_time = 0.0
+    speed = None
+    for line in stream:
+        key, _, value = line.decode('ascii', 'replace').strip().partition('=')
+        # out_time_ms 是旧版本的名字，单位同样是微秒
+        if key in ('out_time_us', 'out_time_ms'):
+            if value.isdigit():
+                out_time = int(value) / 1_000_000
+        elif key == 'speed':
+            try:
+                speed = float(value.rstrip('x')) or None
+            except ValueError:
+                speed = None  # 刚开始时为 N/A
+        elif key == 'progress' and progress_callback is not None:
+            if not duration:
+                percent = None
+            elif value == 'end':
+                percent = 100
+            else:
+                percent = min(out_time * 100 / duration, 100)
+            progress_callback(percent, speed)
+    return out_time
 
 
-@app.route('/api/status', methods=['GET'])
-def get_status():
+def run_ffmpeg(cmd, duration=None, progress_callback=None, kind=None):
     """
-    获取所有任务状态的 API 接口
-    前端会定期调用此接口更新显示
+    执行 ffmpeg 命令，通过 -progress 输出报告进度
+    
+    Args:
+        cmd: ffmpeg 命令（不含 -progress 参数）
+        duration: 本次要处理的媒体时长（秒），用于计算百分比
+        progress_callback: 进度回调 callback(百分比, 实时倍率)
+        kind: 计入 ffmpeg_stats 的类别，None 时不统计
     
     Returns:
-        JSON 响应，包含所有任务的当前状态
+        str: ffmpeg 日志（stderr 的最后部分）
+    
+    Raises:
+        subprocess.CalledProcessError: ffmpeg 返回非 0 时抛出，stderr 为日志的最后部分
     """
-    with tasks_lock:
-        return jsonify(tasks_status)
+    started = time.monotonic()
+    process = subprocess.Popen(
+        with_progress_args(cmd), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    # 另起线程读取 stderr，避免管道写满后 ffmpeg 阻塞
+    stderr_tail = deque(maxlen=FFMPEG_STDERR_TAIL_LINES)
+    reader = threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True)
+    reader.start()
+    with process:
+        media_seconds = read_ffmpeg_progress(process.stdout, duration, progress_callback)
+        returncode = process.wait()
+        reader.join()
+    
+    stderr = b''.join(stderr_tail).decode('utf-8', 'replace')
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    if kind is not None:
+        ffmpeg_stats.record(kind, media_seconds, time.monotonic() - started)
+    return stderr
 
 
-@app.route('/api/clear', methods=['POST'])
-def clear_tasks():
+def ffmpeg_progress_updater(task_id):
     """
-    清除已完成的任务记录
+    生成把 ffmpeg 进度写入任务状态（stage_percent / realtime_factor）的回调
+    按 PROGRESS_MIN_INTERVAL 节流，完成（100%）时总会写入
+    
+    Args:
+        task_id: 任务 ID
     
     Returns:
-        JSON 响应，确认清除操作
+        callable: callback(百分比, 实时倍率)
     """
-    with tasks_lock:
-        # 只保留正在进行中的任务
-        global tasks_status
-        tasks_status = {
-            k: v for k, v in tasks_status.items() 
-            if v['status'] in ['pending', 'starting', 'downloading', 'converting']
-        }
+    last_update = 0
     
-    return jsonify({'success': True, 'message': '已清除完成的任务'})
+    def on_progress(percent, realtime_factor):
+        nonlocal last_update
+        now = time.monotonic()
+        if percent != 100 and now - last_update < PROGRESS_MIN_INTERVAL:
+            return
+        last_update = now
+        changes = {'realtime_factor': realtime_factor}
+        if percent is not None:
+            changes['stage_percent'] = percent
+        update_task(task_id, **changes)
+    
+    return on_progress
 
 
-@app.route('/api/files', methods=['GET'])
-def get_files():
+def extract_audio_segments(input_path, output_dir, base_name, segments, output_format='mp3', profile=None,
+                           split_mode='single_pass', progress_callback=None):
     """
-    获取已下载的 MP3 文件列表
+    从视频文件中提取音频并分割为多个文件
+    
+    Args:
+        input_path: 输入视频文件路径
+        output_dir: 输出目录
+        base_name: 输出文件名基础
+        segments: 分割段的时间范围列表
+        output_format: 输出音频格式（文件扩展名）
+        profile: 重新编码时使用的输出档位（OutputProfile），None 时使用默认档位
+        split_mode: 分割模式
+            'copy'        - 一次 ffmpeg 调用，用 segment 复用器流复制（输入已是目标格式时使用）
+            'single_pass' - 一次 ffmpeg 调用，编码和分段同时完成（输入为原始音频流时使用）
+            'parallel'    - 每段一个 ffmpeg 进程（输入端定位），多段并行编码
+        progress_callback: 进度回调 callback(完成百分比, 实时倍率)，由 ffmpeg 的 -progress 输出驱动
     
     Returns:
-        JSON 响应，包含文件列表和详细信息
+        list: 生成的音频文件列表
     """
-    try:
-        import time
-        from datetime import datetime
-        
-        files = []
-        
-        # 遍历 mp3 目录中的所有文件
-        if MP3_DIR.exists():
-            for file_path in MP3_DIR.iterdir():
-                if file_path.is_file() and file_path.suffix.lower() == '.mp3':
-                    stat = file_path.stat()
-                    
-                    # 获取文件大小（格式化）
-                    size = stat.st_size
-                    size_str = format_size(size)
-                    
-                    # 获取文件修改时间
-                    mtime = datetime.fromtimestamp(stat.st_mtime)
-                    mtime_str = mtime.strftime('%Y-%m-%d %H:%M:%S')
-                    
-                    files.append({
-                        'name': file_path.name,
-                        'size': size,
-                        'size_str': size_str,
-                        'modified': mtime_str,
-                        'modified_timestamp': stat.st_mtime,
-                        'path': str(file_path.relative_to(Path(__file__).parent)),
-                        'url': f'/api/audio/{urllib.parse.quote(file_path.name)}'  # URL 编码文件名
-                    })
-        
-        # 按修改时间倒序排列（最新的在前）
-        files.sort(key=lambda x: x['modified_timestamp'], reverse=True)
-        
-        return jsonify({
-            'success': True,
-            'files': files,
-            'count': len(files)
-        })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    if FFMPEG_PATH:
+        ffmpeg_cmd = [FFMPEG_PATH]
+    else:
+        ffmpeg_cmd = ['ffmpeg']
+    
+    # 设置格式特定参数（编码、比特率和采样率）
+    format_params = (profile or get_output_profile(DEFAULT_PROFILE)).codec_params()
+    
+    if split_mode == 'copy':
+        output_files = _extract_segments_single_pass(
+            ffmpeg_cmd, input_path, output_dir, base_name, segments, output_format,
+            codec_params=['-c', 'copy'],  # 流复制，不重新编码
+            progress_callback=progress_callback
+        )
+    elif split_mode == 'parallel':
+        output_files = _extract_segments_parallel(
+            ffmpeg_cmd, input_path, output_dir, base_name, segments, output_format,
+            codec_params=format_params,
+            progress_callback=progress_callback
+        )
+    else:
+        output_files = _extract_segments_single_pass(
+            ffmpeg_cmd, input_path, output_dir, base_name, segments, output_format,
+            codec_params=format_params,
+            progress_callback=progress_callback
+        )
+    
+    # 新生成的文件加入文件索引
+    file_index.publish(*(file_info['path'] for file_info in output_files))
+    return output_files
 
 
-@app.route('/api/audio/<filename>')
-def serve_audio(filename):
+def _extract_segments_parallel(ffmpeg_cmd, input_path, output_dir, base_name, segments, output_format,
+                               codec_params, progress_callback=None):
     """
-    提供音频文件访问（支持 HTTP Range 请求）
+    多段并行编码：每段一个 ffmpeg 进程，-ss/-t 放在 -i 之前（输入端定位），
+    每个进程只解码自己的那一段
+    并行度受 SEGMENT_WORKERS 和调度器的 CPU 槽位共同限制
+    各段先写入与 single_pass 相同的临时文件名，全部成功后才重命名为最终文件名，
+    任意一段失败时删除所有临时文件，不留下不完整的分段
     
     Args:
-        filename: 音频文件名
+        ffmpeg_cmd: ffmpeg 命令前缀
+        input_path: 输入文件路径
+        output_dir: 输出目录
+        base_name: 输出文件名基础
+        segments: 分割段的时间范围列表
+        output_format: 输出音频格式
+        codec_params: 编码参数
+        progress_callback: 进度回调 callback(完成百分比, 实时倍率)，实时倍率为所有进程合计
     
     Returns:
-        音频文件响应（支持流式播放）
+        list: 生成的音频文件列表，顺序与 segments 一致
     """
+    total = len(segments)
+    total_duration = sum(end - start for start, end in segments)
+    processed = [0.0] * total  # 每段已处理的媒体时长
+    temp_prefix = f'.{base_name}.splitting'
+    progress_lock = threading.Lock()
+    started = time.monotonic()
+    
+    def segment_progress(index, duration, percent):
+        if progress_callback is None or percent is None or not total_duration:
+            return
+        with progress_lock:
+            processed[index - 1] = duration * percent / 100
+            done = sum(processed)
+        elapsed = time.monotonic() - started
+        progress_callback(done * 100 / total_duration, done / elapsed if elapsed > 0 else None)
+    
+    def encode_segment(index, start_time, end_time):
+        temp_path = output_dir / f'{temp_prefix}.{index - 1:03d}.{output_format}'
+        cmd = ffmpeg_cmd + [
+            '-ss', f'{start_time:.3f}',
+            '-t', f'{end_time - start_time:.3f}',
+            '-i', str(input_path),
+            '-vn',  # 禁用视频
+            *codec_params,
+            '-y',
+            str(temp_path)
+        ]
+        print(f"正在处理段 {index}/{total}: {start_time:.2f}s - {end_time:.2f}s")
+        duration = end_time - start_time
+        try:
+            run_ffmpeg(
+                cmd, duration,
+                lambda percent, speed: segment_progress(index, duration, percent),
+                kind='encode'
+            )
+        except subprocess.CalledProcessError as e:
+            print(f"处理段 {index} 失败: {e.stderr}")
+            raise
+    
+    # 当前线程若已占用一个 CPU 槽位，它本身就算一个并行度；其余槽位非阻塞地向调度器借用
+    holds_cpu = scheduler.holds_stage('cpu')
+    wanted = max(1, min(total, SEGMENT_WORKERS))
+    borrowed = scheduler.borrow_slots('cpu', wanted - (1 if holds_cpu else 0), block_first=not holds_cpu)
+    workers = borrowed + (1 if holds_cpu else 0)
+    print(f"并行编码 {total} 段，并行度 {workers}")
+    
+    first_error = None
     try:
-        from flask import Response, request
-        
-        # 安全检查：确保文件名不包含路径分隔符
-        if '/' in filename or '\\' in filename:
-            return jsonify({'error': 'Invalid filename'}), 400
-        
-        # URL 解码文件名（处理中文文件名）
-        filename = urllib.parse.unquote(filename)
-        
-        # 构建文件路径
-        file_path = MP3_DIR / filename
-        
-        # 检查文件是否存在
-        if not file_path.exists() or not file_path.is_file():
-            return jsonify({'error': 'File not found'}), 404
-        
-        # 检查文件扩展名
-        if file_path.suffix.lower() not in ['.mp3', '.wav']:
-            return jsonify({'error': 'Invalid file type'}), 400
-        
-        # 获取文件大小
-        file_size = file_path.stat().st_size
-        
-        # 获取 Range 请求头
-        range_header = request.headers.get('Range', None)
-        
-        if range_header:
-            # 解析 Range 请求
-            # 格式通常是: "bytes=start-end"
-            byte_start = 0
-            byte_end = file_size - 1
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(encode_segment, i, start, end)
+                for i, (start, end) in enumerate(segments, 1)
+            ]
             
-            try:
-                # 提取范围
-                range_match = range_header.replace('bytes=', '').split('-')
-                if range_match[0]:
-                    byte_start = int(range_match[0])
-                if range_match[1]:
-                    byte_end = int(range_match[1])
-                else:
-                    byte_end = file_size - 1
-                
-                # 确保范围有效
-                if byte_start >= file_size:
-                    return Response('Range Not Satisfiable', status=416, headers={
-                        'Content-Range': f'bytes */{file_size}'
-                    })
-                
-                if byte_end >= file_size:
-                    byte_end = file_size - 1
-                
-                content_length = byte_end - byte_start + 1
-                
-                # 读取文件片段
-                with open(file_path, 'rb') as f:
-                    f.seek(byte_start)
-                    data = f.read(content_length)
-                
-                # 返回 206 Partial Content
-                response = Response(
-                    data,
-                    status=206,
-                    mimetype='audio/mpeg',
-                    headers={
-                        'Content-Range': f'bytes {byte_start}-{byte_end}/{file_size}',
-                        'Accept-Ranges': 'bytes',
-                        'Content-Length': str(content_length),
-                        'Content-Type': 'audio/mpeg',
-                        'Cache-Control': 'public, max-age=3600',
-                    }
-                )
-                return response
-                
-            except (ValueError, IndexError):
-                # Range 请求格式错误，返回完整文件
-                pass
-        
-        # 没有 Range 请求或解析失败，返回完整文件
-        def generate():
-            with open(file_path, 'rb') as f:
-                while True:
-                    chunk = f.read(8192)  # 8KB chunks
-                    if not chunk:
-                        break
-                    yield chunk
-        
-        response = Response(
-            generate(),
-            status=200,
-            mimetype='audio/mpeg',
-            headers={
-                'Content-Length': str(file_size),
-                'Accept-Ranges': 'bytes',
-                'Content-Type': 'audio/mpeg',
-                'Cache-Control': 'public, max-age=3600',
-            }
-        )
-        return response
-        
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+            # 按段序号依次等待；某段失败时取消尚未开始的段，已在运行的段仍等它结束，记录序号最小的错误
+            for future in futures:
+                try:
+                    future.result()
+                except concurrent.futures.CancelledError:
+                    pass
+                except Exception as e:
+                    if first_error is None:
+                        first_error = e
+                        for pending in futures:
+                            pending.cancel()
+    finally:
+        scheduler.return_slots('cpu', borrowed)
+    
+    if first_error is not None:
+        # 所有进程都已结束，删除已完成和写了一半的临时文件
+        for leftover in output_dir.glob(f'{glob.escape(temp_prefix)}.*.{output_format}'):
+            leftover.unlink()
+        raise first_error
+    
+    return _collect_segment_outputs(output_dir, temp_prefix, base_name, segments, output_format)
 
 
-def format_size(size_bytes):
+def segment_output_pattern(output_dir, temp_prefix, output_format):
     """
-    格式化文件大小
+    segment 复用器的输出文件名模板（{temp_prefix}.000.{ext} …）
+    路径和视频标题中的 % 会被 ffmpeg 当作格式说明符，需转义为 %%
+    
+    Returns:
+        str: 传给 ffmpeg 的输出文件名模板
+    """
+    return str(output_dir / temp_prefix).replace('%', '%%') + f'.%03d.{output_format}'
+
+
+def _extract_segments_single_pass(ffmpeg_cmd, input_path, output_dir, base_name, segments, output_format,
+                                  codec_params, progress_callback=None):
+    """
+    单次 ffmpeg 调用完成全部分段（segment 复用器），输入只读取一遍
     
     Args:
-        size_bytes: 文件大小（字节）
+        ffmpeg_cmd: ffmpeg 命令前缀
+        input_path: 输入文件路径
+        output_dir: 输出目录
+        base_name: 输出文件名基础
+        segments: 分割段的时间范围列表
+        output_format: 输出音频格式（决定扩展名）
+        codec_params: 编码参数（流复制时为 ['-c', 'copy']）
+        progress_callback: 进度回调 callback(完成百分比, 实时倍率)
     
     Returns:
-        格式化后的字符串（如 "1.5 MB"）
+        list: 生成的音频文件列表（与 extract_audio_segments 格式相同）
     """
-    if size_bytes == 0:
-        return "0 B"
+    total = len(segments)
+    # 分割点为除第一段外每段的开始时间
+    cut_points = ','.join(f'{start:.3f}' for start, _ in segments[1:])
+    # 先写入临时文件名，完成后再按 generate_segment_filename 的规则重命名
+    temp_prefix = f'.{base_name}.splitting'
+    temp_pattern = segment_output_pattern(output_dir, temp_prefix, output_format)
     
-    units = ['B', 'KB', 'MB', 'GB', 'TB']
-    unit_index = 0
-    size = float(size_bytes)
+    cmd = ffmpeg_cmd + [
+        '-i', str(input_path),
+        '-vn',  # 禁用视频（包括封面图）
+        '-map', '0:a:0',
+        *codec_params,
+        '-f', 'segment',
+        '-reset_timestamps', '1',
+        '-y'
+    ]
+    if cut_points:
+        cmd.extend(['-segment_times', cut_points])
+    else:
+        cmd.extend(['-segment_time', str(10 ** 9)])
+    cmd.append(str(temp_pattern))
     
-    while size >= 1024 and unit_index < len(units) - 1:
-        size /= 1024
-        unit_index += 1
+    print(f"正在单次分割为 {total} 段: {' '.join(codec_params)}")
     
-    return f"{size:.2f} {units[unit_index]}"
+    try:
+        run_ffmpeg(
+            cmd, segments[-1][1], progress_callback,
+            kind='copy' if codec_params == ['-c', 'copy'] else 'encode'
+        )
+    except subprocess.CalledProcessError as e:
+        print(f"单次分割失败: {e.stderr}")
+        for leftover in output_dir.glob(f'{glob.escape(temp_prefix)}.*.{output_format}'):
+            leftover.unlink()
+        raise
+    
+    return _collect_segment_outputs(output_dir, temp_prefix, base_name, segments, output_format)
 
 
-def format_speed(speed_str):
+def _collect_segment_outputs(output_dir, temp_prefix, base_name, segments, output_format):
     """
-    格式化下载速度
-    
-    Args:
-        speed_str: 速度字符串（如 "2.5MiB/s"）
+    把 segment 复用器写出的临时文件（{temp_prefix}.000.{ext} …）按 generate_segment_filename 的规则重命名
     
     Returns:
-        格式化后的字符串（如 "2.5 MB/s"）
+        list: 生成的音频文件列表（与 extract_audio_segments 格式相同）
     """
-    if speed_str == 'N/A' or not speed_str:
-        return 'N/A'
+    total = len(segments)
+    output_files = []
+    for i, (start_time, end_time) in enumerate(segments, 1):
+        temp_path = output_dir / f'{temp_prefix}.{i - 1:03d}.{output_format}'
+        if not temp_path.exists():
+            print(f"段 {i} 处理失败，文件未生成")
+            continue
+        
+        filename = generate_segment_filename(base_name, i, total, output_format)
+        output_path = output_dir / filename
+        os.replace(temp_path, output_path)
+        
+        output_files.append({
+            'filename': filename,
+            'path': output_path,
+            'size': output_path.stat().st_size,
+            'start_time': start_time,
+            'end_time': end_time
+        })
+        print(f"段 {i} 处理完成: {filename}")
     
-    # yt-dlp 返回的速度格式可能是 "2.5MiB/s" 或 "2.5 MB/s"
-    # 统一转换为 "MB/s" 格式
-    try:
-        # 移除空格和单位，提取数字
-        import re
-        match = re.search(r'([\d.]+)', speed_str)
-        if match:
-            num = float(match.group(1))
-            # 如果包含 MiB 或 MB，保持原样；否则假设是 MB/s
-            if 'MiB' in speed_str or 'MB' in speed_str:
-                return speed_str.replace('MiB', 'MB')
-            return f"{num:.2f} MB/s"
-    except:
-        pass
+    return output_files
+
+
+class StreamingExtraction:
+    """
+    边接收边提取：输入数据块依次写入 ffmpeg 的标准输入，一次调用完成编码和分段
+    总时长事先未知，按 segment_seconds 定长切分（最后一段较短）
     
-    return speed_str
+    feed() 在接收数据的线程中调用（如请求线程），finish() 可以在其他线程中等待 ffmpeg 结束并整理输出文件；
+    从创建到 finish()/abort() 期间占用调度器的一个 CPU 槽位
+    """
+    
+    def __init__(self, output_dir, base_name, segment_seconds, profile, progress_callback=None):
+        """
+        Args:
+            output_dir: 输出目录
+            base_name: 输出文件名基础
+            segment_seconds: 每段的最大时长（秒）
+            profile: 输出档位（OutputProfile，mp3 / wav 编码）
+            progress_callback: 进度回调 callback(None, 实时倍率)（总时长未知，不报告百分比）
+        """
+        self.output_dir = output_dir
+        self.base_name = base_name
+        self.segment_seconds = segment_seconds
+        self.output_format = profile.codec
+        self._temp_prefix = f'.{base_name}.streaming'
+        ffmpeg_cmd = [FFMPEG_PATH] if FFMPEG_PATH else ['ffmpeg']
+        self._cmd = ffmpeg_cmd + [
+            '-i', 'pipe:0',
+            '-vn',  # 禁用视频
+            '-map', '0:a:0',
+            *profile.codec_params(),
+            '-f', 'segment',
+            '-segment_time', f'{segment_seconds:.3f}',
+            '-reset_timestamps', '1',
+            '-y',
+            segment_output_pattern(output_dir, self._temp_prefix, self.output_format)
+        ]
+        
+        print(f"流式提取: 每段最长 {format_time(segment_seconds)}")
+        
+        # 编码占用一个 CPU 槽位（接收数据的线程不一定属于调度器，直接借用）
+        self._borrowed = scheduler.borrow_slots('cpu', 1, block_first=True)
+        self._stderr_tail = deque(maxlen=FFMPEG_STDERR_TAIL_LINES)
+        try:
+            self._process = subprocess.Popen(
+                with_progress_args(self._cmd),
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except BaseException:
+            self._release_slot()
+            raise
+        # 持续读取 stderr 和进度输出，避免管道写满后 ffmpeg 阻塞
+        self._reader = threading.Thread(target=self._stderr_tail.extend, args=(self._process.stderr,), daemon=True)
+        self._reader.start()
+        self._progress_reader = threading.Thread(
+            target=read_ffmpeg_progress, args=(self._process.stdout, None, progress_callback), daemon=True
+        )
+        self._progress_reader.start()
+    
+    def _release_slot(self):
+        scheduler.return_slots('cpu', self._borrowed)
+        self._borrowed = 0
+    
+    def _temp_files(self):
+        return sorted(self.output_dir.glob(f'{glob.escape(self._temp_prefix)}.*.{self.output_format}'))
+    
+    def feed(self, chunks):
+        """写入输入数据；数据源出错（如上传中断）时终止 ffmpeg 并删除已写出的分段"""
+        try:
+            for chunk in chunks:
+                self._process.stdin.write(chunk)
+        except BrokenPipeError:
+            pass  # ffmpeg 提前退出，错误信息在 finish() 中报告
+        except BaseException:
+            self.abort()
+            raise
+    
+    def abort(self):
+        """终止 ffmpeg 并删除已写出的分段"""
+        self._process.kill()
+        self._process.wait()
+        self._release_slot()
+        for leftover in self._temp_files():
+            leftover.unlink()
+    
+    def finish(self):
+        """
+        结束输入并等待 ffmpeg 完成
+        
+        Returns:
+            list: 生成的音频文件列表（与 extract_audio_segments 格式相同）
+        """
+        try:
+            try:
+                self._process.stdin.close()
+            except BrokenPipeError:
+                pass
+            returncode = self._process.wait()
+            self._reader.join()
+            self._progress_reader.join()
+        finally:
+            self._release_slot()
+        
+        if returncode != 0:
+            stderr = b''.join(self._stderr_tail).decode('utf-8', 'replace')
+            print(f"流式提取失败: {stderr}")
+            for leftover in self._temp_files():
+                leftover.unlink()
+            raise subprocess.CalledProcessError(returncode, self._cmd, stderr=stderr)
+        
+        # 按实际生成的分段数还原每段的时间范围，最后一段的时长从文件头读取
+        count = len(self._temp_files())
+        segments = [(i * self.segment_seconds, (i + 1) * self.segment_seconds) for i in range(count)]
+        if segments:
+            last_path = self.output_dir / f'{self._temp_prefix}.{count - 1:03d}.{self.output_format}'
+            last_start = segments[-1][0]
+            segments[-1] = (last_start, last_start + get_video_duration(last_path))
+        
+        output_files = _collect_segment_outputs(
+            self.output_dir, self._temp_prefix, self.base_name, segments, self.output_format
+        )
+        file_index.publish(*(file_info['path'] for file_info in output_files))
+        return output_files
 
 
-def format_time(seconds):
+# =========================================================================
+# 本地文件音频提取功能
+# =========================================================================
+
+# 上传内容按块读取的大小（字节）
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# 判断 MOV/MP4 能否流式处理时最多缓存的开头字节数，超过仍无法判断时落盘处理
+UPLOAD_SNIFF_LIMIT = 8 * 1024 * 1024
+# 本地提取支持的输入文件扩展名；其中 MP4 系列（moov 在前时）可以边上传边提取
+LOCAL_EXTRACT_EXTENSIONS = ('.mov', '.mp4', '.m4v', '.m4a', '.mkv', '.webm')
+MP4_EXTENSIONS = ('.mov', '.mp4', '.m4v', '.m4a')
+# 设为 0 时关闭流式提取，上传内容总是先写入磁盘
+LOCAL_EXTRACT_STREAMING = os.environ.get('V2V_LOCAL_EXTRACT_STREAMING', '1') != '0'
+
+
+def iter_multipart_upload(stream, boundary):
     """
-    格式化时间（秒）
+    增量解析 multipart/form-data 请求体，不缓冲整个上传内容
     
     Args:
-        seconds: 秒数
+        stream: 请求体（request.stream）
+        boundary: multipart 分隔符
     
-    Returns:
-        格式化后的字符串（如 "1分30秒"）
+    Yields:
+        tuple: ('field', 字段名, 值) / ('file', 字段名, 文件名) / ('data', 字段名, 字节) / ('file_end', 字段名, None)
     """
-    if seconds < 60:
-        return f"{int(seconds)}秒"
-    elif seconds < 3600:
-        minutes = int(seconds // 60)
-        secs = int(seconds % 60)
-        return f"{minutes}分{secs}秒"
-    else:
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        return f"{hours}小时{minutes}分{secs}秒"
+    decoder = multipart.MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=1024 * 1024)
+    current_name = None
+    current_is_file = False
+    field_value = []
+    eof = False
+    while True:
+        event = decoder.next_event()
+        if isinstance(event, multipart.NeedData):
+            if eof:
+                raise ValueError('上传数据不完整')
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            eof = not chunk
+            decoder.receive_data(chunk or None)
+        elif isinstance(event, multipart.Field):
+            current_name, current_is_file, field_value = event.name, False, []
+        elif isinstance(event, multipart.File):
+            current_name, current_is_file = event.name, True
+            yield 'file', event.name, event.filename
+        elif isinstance(event, multipart.Data):
+            if current_is_file:
+                if event.data:
+                    yield 'data', current_name, event.data
+                if not event.more_data:
+                    yield 'file_end', current_name, None
+            else:
+                field_value.append(event.data)
+                if not event.more_data:
+                    yield 'field', current_name, b''.join(field_value).decode('utf-8', 'replace')
+        elif isinstance(event, multipart.Epilogue):
+            return
 
 
-def format_eta(eta_str):
+def iter_upload_file(events, name='file'):
+    """从 iter_multipart_upload 的事件中取出当前文件的内容块，到文件结束为止"""
+    for kind, field_name, payload in events:
+        if field_name != name:
+            continue
+        if kind == 'data':
+            yield payload
+        elif kind == 'file_end':
+            return
+
+
+def mp4_moov_before_mdat(head):
     """
-    格式化剩余时间
+    按顶层 box 判断 MP4/MOV 的 moov 是否位于 mdat 之前（否则 ffmpeg 无法从管道读取）
     
     Args:
-        eta_str: ETA 字符串（如 "00:02:30"）
+        head: 文件开头的字节
     
     Returns:
-        格式化后的字符串（如 "剩余2分30秒"）
+        bool: moov 在前返回 True，mdat 在前或格式不对返回 False；数据不足以判断时返回 None
     """
-    if eta_str == 'N/A' or not eta_str:
-        return '计算中...'
-    
-    # yt-dlp 返回的格式可能是 "00:02:30" 或 "2:30"
-    try:
-        parts = eta_str.split(':')
-        if len(parts) == 3:
-            hours, minutes, seconds = map(int, parts)
-            if hours > 0:
-                return f"剩余{hours}小时{minutes}分{seconds}秒"
-            elif minutes > 0:
-                return f"剩余{minutes}分{seconds}秒"
-            else:
-                return f"剩余{seconds}秒"
-        elif len(parts) == 2:
-            minutes, seconds = map(int, parts)
-            return f"剩余{minutes}分{seconds}秒"
-    except:
-        pass
-    
-    return f"剩余{eta_str}"
+    pos = 0
+    while pos + 8 <= len(head):
+        size = int.from_bytes(head[pos:pos + 4], 'big')
+        box_type = bytes(head[pos + 4:pos + 8])
+        if size == 1:
+            if pos + 16 > len(head):
+                return None
+            size = int.from_bytes(head[pos + 8:pos + 16], 'big')
+        if box_type == b'moov':
+            return True
+        if box_type == b'mdat' or size < 8:
+            return False
+        pos += size
+    return None
 
 
-def estimate_audio_size(duration_seconds, bitrate_kbps=192, format='mp3'):
+# MP4/MOV 音轨的样本描述（stsd）类型 -> 编码名（与 ffprobe 的 codec_name 一致）
+MP4_AUDIO_CODECS = {
+    b'mp4a': 'aac',
+    b'.mp3': 'mp3',
+    b'alac': 'alac',
+    b'Opus': 'opus',
+    b'fLaC': 'flac',
+    b'sowt': 'pcm_s16le',
+    b'twos': 'pcm_s16be',
+}
+
+
+def mp4_audio_codec(data):
     """
-    估算音频文件大小
+    从 MP4/MOV 开头的字节中读取第一条音轨的编码（moov/trak/mdia/hdlr 为 soun 的 stsd）
     
     Args:
-        duration_seconds: 音频时长（秒）
-        bitrate_kbps: 比特率（kbps）
-        format: 音频格式
+        data: 文件开头的字节（moov 需完整包含在内）
     
     Returns:
-        估算的文件大小（字节）
+        str: 编码名；没有音轨或编码无法识别时返回 ''；moov 不完整时返回 None
     """
-    # 音频文件大小计算公式：文件大小(字节) = (比特率(kbps) × 时长(秒)) / 8
-    # 对于MP3，这个公式比较准确；对于WAV，需要考虑采样率和位深度
-    if format == 'wav':
-        # WAV格式：假设44.1kHz采样率，16位深度，立体声
-        sample_rate = 44100
-        bit_depth = 16
-        channels = 2
-        size_bytes = (sample_rate * bit_depth * channels * duration_seconds) / 8
-    else:
-        # MP3等压缩格式
-        size_bytes = (bitrate_kbps * 1024 * duration_seconds) / 8
+    def boxes(start, end):
+        pos = start
+        while pos + 8 <= end:
+            size = int.from_bytes(data[pos:pos + 4], 'big')
+            header_size = 8
+            if size == 1:
+                size = int.from_bytes(data[pos + 8:pos + 16], 'big')
+                header_size = 16
+            elif size == 0:
+                size = end - pos
+            if size < header_size:
+                return
+            yield bytes(data[pos + 4:pos + 8]), pos + header_size, pos + size
+            pos += size
     
-    return int(size_bytes)
+    def child(start, end, box_type):
+        return next(((s, e) for t, s, e in boxes(start, end) if t == box_type), None)
+    
+    moov = child(0, len(data), b'moov')
+    if moov is None or moov[1] > len(data):
+        return None
+    for box_type, trak_start, trak_end in boxes(*moov):
+        mdia = child(trak_start, trak_end, b'mdia') if box_type == b'trak' else None
+        hdlr = child(*mdia, b'hdlr') if mdia else None
+        if hdlr is None or data[hdlr[0] + 8:hdlr[0] + 12] != b'soun':
+            continue
+        minf = child(*mdia, b'minf')
+        stbl = child(*minf, b'stbl') if minf else None
+        stsd = child(*stbl, b'stsd') if stbl else None
+        if stsd is None:
+            return ''
+        # stsd: 版本/标志(4) + 条目数(4) + 第一个条目的大小(4) + 类型(4)
+        return MP4_AUDIO_CODECS.get(bytes(data[stsd[0] + 12:stsd[0] + 16]), '')
+    return ''
 
 
-def calculate_segments(duration_seconds, max_size_mb=90, bitrate_kbps=192, format='mp3'):
+def sniff_upload(body):
     """
-    计算音频文件需要分割的段数和每段时长
+    读取上传文件的开头，判断能否边上传边交给 ffmpeg 处理
+    moov 在前时继续读到 moov 结束（不超过 UPLOAD_SNIFF_LIMIT），顺便取出音轨编码
     
     Args:
-        duration_seconds: 总时长（秒）
-        max_size_mb: 最大文件大小（MB）
-        bitrate_kbps: 比特率（kbps）
-        format: 音频格式
+        body: 文件内容的数据块迭代器
     
     Returns:
-        list: 每段的开始时间和结束时间（秒）
+        tuple: (已读取的开头字节, 能否流式处理, 音轨编码（未知时为 None）)
     """
-    # 估算总文件大小
-    total_size_bytes = estimate_audio_size(duration_seconds, bitrate_kbps, format)
-    total_size_mb = total_size_bytes / (1024 * 1024)
-    
-    # 如果不需要分割，直接返回一段
-    if total_size_mb <= max_size_mb:
-        return [(0, duration_seconds)]
-    
-    # 计算需要的段数
-    num_segments = int(total_size_mb / max_size_mb) + 1
-    
-    # 计算每段时长（尽量平均分配，最后一段可能略短）
-    segment_duration = duration_seconds / num_segments
-    
-    # 生成每段的时间范围
-    segments = []
-    for i in range(num_segments):
-        start_time = i * segment_duration
-        end_time = min((i + 1) * segment_duration, duration_seconds)
-        segments.append((start_time, end_time))
-    
-    return segments
+    head = bytearray()
+    verdict = None
+    for chunk in body:
+        head += chunk
+        if verdict is None:
+            verdict = mp4_moov_before_mdat(head)
+        if verdict is False:
+            return bytes(head), False, None
+        if verdict:
+            codec = mp4_audio_codec(head)
+            if codec is not None:
+                return bytes(head), True, codec or None
+        if len(head) >= UPLOAD_SNIFF_LIMIT:
+            break
+    return bytes(head), bool(verdict), None
 
 
-def generate_segment_filename(base_name, segment_index, total_segments, extension='mp3'):
+def extract_saved_upload(file_path, base_name, profile, progress_callback=None):
     """
-    为分割后的音频文件生成有逻辑的文件名
+    处理已写入磁盘的上传文件：读取时长和音轨编码、计算分段；
+    源音轨已满足输出档位时直接流复制分段，否则多段并行编码
     
     Args:
-        base_name: 基础文件名
-        segment_index: 段索引（从1开始）
-        total_segments: 总段数
-        extension: 文件扩展名
+        profile: 输出档位（OutputProfile）
+        progress_callback: 进度回调，见 extract_audio_segments
     
     Returns:
-        str: 完整的文件名
+        list: 生成的音频文件列表
     """
-    # 如果只有一段，不添加分段标识
-    if total_segments == 1:
-        return f"{base_name}.{extension}"
+    print(f"开始获取视频时长: {file_path}")
+    duration_seconds = get_video_duration(file_path)
+    print(f"获取到视频时长: {duration_seconds} 秒")
     
-    # 生成分段标识，确保文件名长度合理
-    segment_padding = len(str(total_segments))
-    segment_str = f"_part{segment_index:0{segment_padding}d}"
+    if duration_seconds <= 0:
+        raise ValueError('无法获取视频时长')
     
-    return f"{base_name}{segment_str}.{extension}"
+    source = probe_audio_stream(file_path)
+    output_format, copy, encode_profile = plan_audio_output(source['codec'], profile, source['bitrate_kbps'])
+    print(f"源音轨编码: {source['codec'] or '未知'}，输出 {output_format}（{'直接复制' if copy else '重新编码'}）")
+    if copy:
+        # 分段大小按源音轨的比特率估算，读不到时按整个文件的平均码率（含视频，偏大，只会多分段）
+        bitrate_kbps = source['bitrate_kbps'] or file_path.stat().st_size * 8 / 1000 / duration_seconds
+    else:
+        bitrate_kbps = encode_profile.nominal_kbps
+    
+    # 计算需要分割的段数
+    segments = calculate_segments(
+        duration_seconds,
+        max_size_mb=profile.max_part_mb,
+        bitrate_kbps=bitrate_kbps,
+        format=output_format
+    )
+    
+    # 记录分割信息
+    print(f"视频时长: {format_time(duration_seconds)}")
+    print(f"预计总大小: {estimate_audio_size(duration_seconds, bitrate_kbps, output_format) / (1024 * 1024):.2f} MB")
+    print(f"需要分割为 {len(segments)} 段")
+    
+    for i, (start, end) in enumerate(segments, 1):
+        print(f"段 {i}: {format_time(start)} - {format_time(end)}")
+    
+    print(f"开始提取音频，输出目录: {MP3_DIR}")
+    return extract_audio_segments(
+        file_path,
+        MP3_DIR,
+        base_name,
+        segments,
+        output_format=output_format,
+        profile=encode_profile,
+        split_mode='copy' if copy else 'parallel',  # 需要重新编码时多段并行
+        progress_callback=progress_callback
+    )
 
 
-def get_video_duration(video_path):
+def track_upload_progress(chunks, task_id, total_bytes):
     """
-    使用ffmpeg获取视频文件的时长
+    统计已接收的上传字节数，按 PROGRESS_MIN_INTERVAL 节流写入任务进度
     
     Args:
-        video_path: 视频文件路径
+        chunks: 上传内容的数据块迭代器
+        task_id: 任务 ID
+        total_bytes: 请求体总大小（未知时为 0）
     
-    Returns:
-        float: 视频时长（秒）
+    Yields:
+        bytes: 原样返回的数据块
     """
-    # 尝试使用ffprobe（更适合获取媒体信息）
-    if FFMPEG_PATH:
-        # 如果有FFMPEG_PATH，那么ffprobe应该在相同目录
-        ffprobe_path = Path(FFMPEG_PATH).parent / 'ffprobe'
-        if ffprobe_path.exists():
-            probe_cmd = [str(ffprobe_path)]
-        else:
-            # 回退到使用ffmpeg
-            probe_cmd = [FFMPEG_PATH]
-    else:
-        # 尝试使用系统中的ffprobe或ffmpeg
-        import shutil
-        ffprobe_path = shutil.which('ffprobe')
-        if ffprobe_path:
-            probe_cmd = [ffprobe_path]
-        else:
-            probe_cmd = ['ffmpeg']
-    
-    # 使用更可靠的方式获取视频时长
-    if probe_cmd[0].endswith('ffprobe'):
-        # 使用ffprobe获取时长
-        cmd = probe_cmd + [
-            '-i', str(video_path),
-            '-v', 'quiet',
-            '-select_streams', 'v:0',
-            '-show_entries', 'stream=duration',
-            '-of', 'csv=p=0:nk=1'
-        ]
-    else:
-        # 使用ffmpeg获取时长（不使用-show_entries，因为ffmpeg不支持这个选项）
-        cmd = probe_cmd + [
-            '-i', str(video_path),
-            '-v', 'error',
-            '-f', 'null', '-'
-        ]
-    
-    try:
-        print(f"执行时长获取命令: {' '.join(cmd)}")
-        result = subprocess.run(
-            cmd,
-            check=False,  # 不使用check=True，因为ffmpeg可能返回非零退出码但仍然能输出时长
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
-        )
-        
-        print(f"stdout: '{result.stdout.strip()}'")
-        print(f"stderr: '{result.stderr.strip()}'")
-        
-        # 尝试从stdout获取时长
-        duration_str = result.stdout.strip()
-        if duration_str:
-            return float(duration_str)
-        
-        # 如果stdout没有，尝试从stderr解析（某些ffmpeg版本可能输出到stderr）
-        import re
-        match = re.search(r'Duration: ([0-9]{2}):([0-9]{2}):([0-9]{2})\.([0-9]{2})', result.stderr)
-        if match:
-            hours = int(match.group(1))
-            minutes = int(match.group(2))
-            seconds = int(match.group(3))
-            milliseconds = int(match.group(4))
-            total_seconds = hours * 3600 + minutes * 60 + seconds + milliseconds / 100
-            return total_seconds
-        
-        print("无法从输出中解析时长")
-        return 0
-    except Exception as e:
-        print(f"获取视频时长失败: {e}")
-        import traceback
-        traceback.print_exc()
-        return 0
+    received = 0
+    started = last_update = time.monotonic()
+    for chunk in chunks:
+        received += len(chunk)
+        now = time.monotonic()
+        if now - last_update >= PROGRESS_MIN_INTERVAL:
+            last_update = now
+            speed = received / (now - started)
+            update_task(
+                task_id,
+                progress_percent=min(received * 100 / total_bytes, 100) if total_bytes else 0,
+                downloaded_bytes=received,
+                speed=speed,
+                eta=int((total_bytes - received) / speed) if total_bytes > received else None,
+            )
+        yield chunk
+    update_task(task_id, progress_percent=100, downloaded_bytes=received, eta=None)
 
 
-def extract_audio_segments(input_path, output_dir, base_name, segments, output_format='mp3', bitrate_kbps=192):
+def run_local_extract_job(task_id, file_path, base_name, profile, extraction=None):
     """
-    从视频文件中提取音频并分割为多个文件
+    本地提取的后台任务，完成后和下载任务一样通过任务状态通知前端
     
     Args:
-        input_path: 输入视频文件路径
-        output_dir: 输出目录
+        task_id: 任务 ID
+        file_path: 写入磁盘的上传文件（extraction 为 None 时使用），结束后连同所在的临时目录一起删除
         base_name: 输出文件名基础
-        segments: 分割段的时间范围列表
-        output_format: 输出音频格式
-        bitrate_kbps: 输出音频比特率
-    
-    Returns:
-        list: 生成的音频文件列表
+        profile: 输出档位（OutputProfile）
+        extraction: 数据已全部写入 ffmpeg 的 StreamingExtraction，只需等待其完成
     """
-    if FFMPEG_PATH:
-        ffmpeg_cmd = [FFMPEG_PATH]
-    else:
-        ffmpeg_cmd = ['ffmpeg']
-    
-    output_files = []
-    
-    # 设置基本参数
-    base_params = [
-        '-i', str(input_path),
-        '-vn',  # 禁用视频
-        '-ar', '44100',  # 采样率
-        '-y'  # 覆盖输出文件
-    ]
-    
-    # 设置格式特定参数
-    if output_format == 'mp3':
-        format_params = [
-            '-acodec', 'libmp3lame',
-            '-ab', f'{bitrate_kbps}k'
-        ]
-    else:  # wav
-        format_params = [
-            '-acodec', 'pcm_s16le'
-        ]
-    
-    # 处理每一段
-    for i, (start_time, end_time) in enumerate(segments, 1):
-        # 生成输出文件名
-        filename = generate_segment_filename(
-            base_name, i, len(segments), output_format
-        )
-        output_path = output_dir / filename
-        
-        # 构建完整的ffmpeg命令
-        cmd = ffmpeg_cmd + base_params + format_params
-        
-        # 如果不是第一段，需要设置开始时间和持续时间
-        duration = end_time - start_time
-        cmd.extend(['-ss', str(start_time), '-t', str(duration)])
-        
-        # 设置输出文件路径
-        cmd.append(str(output_path))
-        
-        print(f"正在处理段 {i}/{len(segments)}: {start_time:.2f}s - {end_time:.2f}s")
-        
-        try:
-            # 执行ffmpeg命令
-            subprocess.run(
-                cmd,
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
+    try:
+        if extraction is not None:
+            output_files = extraction.finish()
+        else:
+            scheduler.enter_stage('cpu')
+            update_task(task_id, status='processing', message='正在提取音频...', stage_percent=0, realtime_factor=None)
+            output_files = extract_saved_upload(
+                file_path, base_name, profile,
+                progress_callback=ffmpeg_progress_updater(task_id)
             )
-            
-            # 检查输出文件是否存在
-            if output_path.exists():
-                output_files.append({
-                    'filename': filename,
-                    'path': output_path,
-                    'size': output_path.stat().st_size,
-                    'start_time': start_time,
-                    'end_time': end_time
-                })
-                print(f"段 {i} 处理完成: {filename}")
-            else:
-                print(f"段 {i} 处理失败，文件未生成")
-                
-        except subprocess.CalledProcessError as e:
-            print(f"处理段 {i} 失败: {e.stderr}")
-            raise
+    except subprocess.CalledProcessError as e:
+        print(f"FFmpeg 错误: {e.stderr}")
+        update_task(task_id, status='error', message=f'❌ 错误: 音频提取失败 - {(e.stderr or "")[-500:]}')
+        return
+    except Exception as e:
+        print(f"音频提取过程中发生错误: {e}")
+        traceback.print_exc()
+        update_task(task_id, status='error', message=f'❌ 错误: 处理失败 - {str(e)}')
+        return
+    finally:
+        if file_path is not None:
+            shutil.rmtree(file_path.parent, ignore_errors=True)
     
-    return output_files
-
+    # 检查是否生成了输出文件
+    if not output_files:
+        update_task(task_id, status='error', message='❌ 错误: 音频提取失败，未生成输出文件')
+        return
+    
+    print(f"音频提取完成，生成 {len(output_files)} 个文件")
+    update_task(task_id, segments=len(output_files) if len(output_files) > 1 else 0)
+    mark_task_completed(
+        task_id,
+        [file_info['filename'] for file_info in output_files],
+        message=f'✅ 音频提取完成，共生成 {len(output_files)} 个文件'
+    )
 
-# =========================================================================
-# 本地文件音频提取功能
-# =========================================================================
 
 @app.route('/api/local-extract', methods=['POST'])
 def local_extract_audio():
     """
-    处理本地 MOV 文件的音频提取请求
+    处理本地视频 / 音频文件（MOV、MP4、MKV、WebM、M4A）的音频提取请求
+    请求线程只负责接收上传：moov 位于开头、需要重新编码的 MOV/MP4 边上传边交给 ffmpeg 提取；
+    其他文件（需要随机访问、或源音轨可以直接复制）写入磁盘后交给调度器排队处理
+    输出档位见 OUTPUT_PROFILES：original 保留源音频编码，mp3 / wav 类档位在源音轨已满足档位时同样直接复制
+    上传一结束即返回任务 ID，之后的进度和结果与下载任务一样通过 /api/status、/api/events 获取
+    表单字段 profile（旧版前端为 format）/ filename 需位于 file 之前（也可以通过查询参数传递）
     """
     try:
-        print("=== 开始处理本地 MOV 文件音频提取请求 ===")
+        print("=== 开始处理本地文件音频提取请求 ===")
         
         # 检查是否有文件上传
-        print(f"请求文件: {request.files.keys()}")
-        if 'file' not in request.files:
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
             return jsonify({'error': '没有文件上传'}), 400
         
-        file = request.files['file']
-        print(f"获取到文件: {file.filename}, 类型: {file.content_type}")
+        # 读取文件之前的表单字段，直到文件部分开始
+        events = iter_multipart_upload(request.stream, boundary)
+        fields = request.args.to_dict()
+        upload_filename = None
+        for kind, name, payload in events:
+            if kind == 'field':
+                fields[name] = payload
+            elif kind == 'file' and name == 'file':
+                upload_filename = payload
+                break
+        
+        if upload_filename is None:
+            return jsonify({'error': '没有文件上传'}), 400
+        print(f"获取到文件: {upload_filename}")
         
         # 检查文件名是否为空
-        if file.filename == '':
+        if upload_filename == '':
             return jsonify({'error': '没有选择文件'}), 400
         
-        # 获取输出格式和文件名
-        output_format = request.form.get('format', 'mp3').lower()
-        output_filename = request.form.get('filename', '')
-        print(f"输出格式: {output_format}, 输出文件名: {output_filename}")
+        # 获取输出档位和文件名
+        profile_name = (fields.get('profile') or fields.get('format') or DEFAULT_PROFILE).lower()
+        output_filename = fields.get('filename', '')
+        print(f"输出档位: {profile_name}, 输出文件名: {output_filename}")
         
-        # 验证输出格式
-        if output_format not in ['mp3', 'wav']:
-            return jsonify({'error': '不支持的输出格式，仅支持 MP3 和 WAV'}), 400
+        # 验证输出档位
+        profile = OUTPUT_PROFILES.get(profile_name)
+        if profile is None:
+            return jsonify({'error': f'不支持的输出格式: {profile_name}'}), 400
         
         # 验证文件格式
-        if not file.filename.lower().endswith('.mov'):
-            return jsonify({'error': '请上传 MOV 格式的视频文件'}), 400
+        extension = Path(upload_filename).suffix.lower()
+        if extension not in LOCAL_EXTRACT_EXTENSIONS:
+            return jsonify({'error': '请上传 MOV、MP4、MKV、WebM 或 M4A 格式的文件'}), 400
         
-        # 创建临时目录
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_dir_path = Path(temp_dir)
-            print(f"创建临时目录: {temp_dir_path}")
-            
-            # 保存上传的文件
-            original_filename = secure_filename(file.filename)
-            original_file_path = temp_dir_path / original_filename
-            print(f"保存上传文件到: {original_file_path}")
-            
-            try:
-                file.save(original_file_path)
-                print(f"文件保存成功，大小: {original_file_path.stat().st_size} 字节")
-            except Exception as e:
-                print(f"文件保存失败: {e}")
-                return jsonify({'error': f'文件保存失败: {str(e)}'}), 500
-            
-            # 获取视频时长
-            print(f"开始获取视频时长: {original_file_path}")
-            duration_seconds = get_video_duration(original_file_path)
-            print(f"获取到视频时长: {duration_seconds} 秒")
-            
-            if duration_seconds <= 0:
-                return jsonify({'error': '无法获取视频时长'}), 500
-            
-            # 生成输出文件名基础
-            if not output_filename:
-                # 使用原文件名（不含扩展名）
-                base_name = original_filename.rsplit('.', 1)[0]
+        # 生成输出文件名基础
+        original_filename = secure_filename(upload_filename)
+        if not output_filename:
+            # 使用原文件名（不含扩展名）
+            base_name = original_filename.rsplit('.', 1)[0]
+        else:
+            base_name = output_filename
+        
+        # 确保文件名安全
+        base_name = secure_filename(base_name)
+        print(f"输出文件基础名: {base_name}")
+        
+        # 登记任务：上传阶段显示为 downloading（已接收字节数 / 请求体大小）
+        task_id = create_task(
+            url=upload_filename,
+            filename=base_name,
+            title=upload_filename,
+            status='downloading',
+            message='正在上传...',
+            total_bytes=request.content_length or 0,
+            start_time=time.time()
+        )
+        
+        body = track_upload_progress(iter_upload_file(events), task_id, request.content_length or 0)
+        upload_dir = None
+        try:
+            if LOCAL_EXTRACT_STREAMING and extension in MP4_EXTENSIONS:
+                head, streamable, source_codec = sniff_upload(body)
             else:
-                base_name = output_filename
-            
-            # 确保文件名安全
-            base_name = secure_filename(base_name)
-            print(f"输出文件基础名: {base_name}")
-            
-            # 设置比特率
-            bitrate_kbps = 192
-            
-            # 计算需要分割的段数
-            segments = calculate_segments(
-                duration_seconds, 
-                max_size_mb=90, 
-                bitrate_kbps=bitrate_kbps, 
-                format=output_format
-            )
-            
-            # 记录分割信息
-            print(f"视频时长: {format_time(duration_seconds)}")
-            print(f"预计总大小: {estimate_audio_size(duration_seconds, bitrate_kbps, output_format) / (1024 * 1024):.2f} MB")
-            print(f"需要分割为 {len(segments)} 段")
-            
-            for i, (start, end) in enumerate(segments, 1):
-                print(f"段 {i}: {format_time(start)} - {format_time(end)}")
-            
-            try:
-                # 提取并分割音频
-                print(f"开始提取音频，输出目录: {MP3_DIR}")
-                output_files = extract_audio_segments(
-                    original_file_path,
+                head, streamable, source_codec = b'', False, None
+            # 输出原始编码、或源音轨可以直接复制时落盘处理（复制只需读一遍文件，不值得占用编码槽位）
+            if streamable and profile.codec != 'original' and not plan_audio_output(source_codec, profile)[1]:
+                # moov 在前：上传和提取同时进行，上传结束后由后台线程等待 ffmpeg 完成
+                print("moov 位于文件开头，边上传边提取")
+                extraction = StreamingExtraction(
                     MP3_DIR,
                     base_name,
-                    segments,
-                    output_format=output_format,
-                    bitrate_kbps=bitrate_kbps
+                    max_segment_duration(profile.max_part_mb, profile.nominal_kbps, profile.codec),
+                    profile,
+                    progress_callback=ffmpeg_progress_updater(task_id)
                 )
-                print(f"音频提取完成，生成 {len(output_files)} 个文件")
-            except subprocess.CalledProcessError as e:
-                # 捕获 ffmpeg 错误
-                print(f"FFmpeg 错误: {e.stderr}")
-                return jsonify({
-                    'error': f'音频提取失败: {e.stderr}'
-                }), 500
-            except Exception as e:
-                # 捕获其他错误
-                print(f"音频提取过程中发生错误: {e}")
-                traceback.print_exc()
-                return jsonify({
-                    'error': f'处理失败: {str(e)}'
-                }), 500
-            
-            # 检查是否生成了输出文件
-            if not output_files:
-                return jsonify({'error': '音频提取失败，未生成输出文件'}), 500
-            
-            # 准备响应数据
-            response_data = {
-                'success': True,
-                'message': f'音频提取完成，共生成 {len(output_files)} 个文件',
-                'files': []
-            }
-            
-            # 添加每个生成的文件信息
-            for file_info in output_files:
-                response_data['files'].append({
-                    'filename': file_info['filename'],
-                    'size': file_info['size'],
-                    'size_str': format_size(file_info['size']),
-                    'url': f'/api/audio/{urllib.parse.quote(file_info["filename"])}'
-                })
-            
-            print(f"返回响应: {response_data}")
-            # 返回成功响应
-            return jsonify(response_data)
-            
+                update_task(task_id, message='正在上传并同时提取音频...')
+                extraction.feed(itertools.chain([head], body))
+                for _ in events:
+                    pass  # 读完请求体的剩余部分
+                update_task(task_id, status='processing', message='上传完成，正在完成音频提取...', stage_percent=None)
+                # 不经过调度队列：ffmpeg 已占用借来的 CPU 槽位，排队等待可能与其他任务互相等待
+                threading.Thread(
+                    target=run_local_extract_job,
+                    args=(task_id, None, base_name, profile, extraction),
+                    name=f'v2v-extract-{task_id}',
+                    daemon=True
+                ).start()
+            else:
+                # 需要随机访问：写入临时目录（以任务 ID 命名，中断后启动时清理）后排队处理
+                upload_dir = Path(tempfile.mkdtemp(prefix=f'{task_id}.upload.', dir=DOWNLOAD_DIR))
+                original_file_path = upload_dir / original_filename
+                print(f"保存上传文件到: {original_file_path}")
+                with open(original_file_path, 'wb') as f:
+                    f.write(head)
+                    for chunk in body:
+                        f.write(chunk)
+                for _ in events:
+                    pass  # 读完请求体的剩余部分
+                print(f"文件保存成功，大小: {original_file_path.stat().st_size} 字节")
+                update_task(task_id, status='pending', message='上传完成，等待提取音频...', progress_percent=0)
+                scheduler.submit(
+                    task_id, run_local_extract_job,
+                    task_id, original_file_path, base_name, profile
+                )
+        except Exception as e:
+            print(f"接收上传文件失败: {e}")
+            traceback.print_exc()
+            if upload_dir is not None:
+                shutil.rmtree(upload_dir, ignore_errors=True)
+            update_task(task_id, status='error', message=f'❌ 错误: 上传失败 - {str(e)}')
+            return jsonify({'error': f'上传失败: {str(e)}', 'task_id': task_id}), 500
+        
+        return jsonify({
+            'success': True,
+            'task_id': task_id,
+            'message': '上传完成，正在后台提取音频'
+        })
+        
     except Exception as e:
         # 捕获所有其他错误
         print(f"处理本地提取请求时发生未捕获错误: {e}")
@@ -1170,6 +5436,12 @@ def local_extract_audio():
         return jsonify({'error': str(e)}), 500
 
 
+# 恢复上次运行未完成的任务（debug 模式下 reloader 的监视进程不执行任务，由其子进程恢复；
+# V2V_RECOVER_JOBS=0 时只导入模块，不恢复任务也不清理文件，供基准测试等脚本使用）
+if os.environ.get('V2V_RECOVER_JOBS', '1') != '0' and not (__name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'):
+    recover_jobs()
+
+
 if __name__ == '__main__':
     """
     程序入口
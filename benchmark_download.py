@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多连接分块下载基准测试
+在本地启动一个按连接限速的 HTTP 服务器（模拟对单个连接限速的视频 CDN），
+分别用 yt-dlp 的单连接下载器和 ParallelHttpFD 下载同一个文件，比较耗时并校验内容
+
+用法:
+    python3 benchmark_download.py [--size-mb 32] [--rate-kb 2048] [--connections 1 2 4 8] [--chunk-mb 4]
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# 只导入 app 模块，不恢复任务也不清理下载目录
+os.environ['V2V_RECOVER_JOBS'] = '0'
+os.environ.setdefault('V2V_DATA_DIR', tempfile.mkdtemp(prefix='v2v-bench-data-'))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='多连接分块下载基准测试')
+    parser.add_argument('--size-mb', type=float, default=32, help='测试文件大小（MB）')
+    parser.add_argument('--rate-kb', type=float, default=2048, help='服务器对每个连接的限速（KB/s）')
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 2, 4, 8], help='要测试的连接数（1 为 yt-dlp 单连接下载）')
+    parser.add_argument('--chunk-mb', type=float, default=4, help='分块大小（MB）')
+    return parser.parse_args()
+
+
+def make_handler(payload, rate):
+    """
+    创建请求处理器：支持 Range 请求，每个连接按 rate 字节/秒限速
+
+    Args:
+        payload: 文件内容
+        rate: 每个连接的限速（字节/秒）
+    """
+    block = 64 * 1024
+
+    class ThrottledHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            start, end = 0, len(payload) - 1
+            range_header = self.headers.get('Range')
+            if range_header and range_header.startswith('bytes='):
+                first, _, last = range_header[6:].partition('-')
+                start = int(first) if first else max(0, len(payload) - int(last))
+                end = min(int(last), len(payload) - 1) if first and last else len(payload) - 1
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+            else:
+                self.send_response(200)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Type', 'audio/mp4')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+
+            started = time.monotonic()
+            sent = 0
+            position = start
+            try:
+                while position <= end:
+                    data = payload[position:min(position + block, end + 1)]
+                    self.wfile.write(data)
+                    position += len(data)
+                    sent += len(data)
+                    # 发送速度超过限速时等待
+                    delay = sent / rate - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return ThrottledHandler
+
+
+def run_download(app, url, output_path, connections):
+    """
+    下载一次并返回耗时（秒）
+
+    Args:
+        app: app 模块
+        url: 测试文件地址
+        output_path: 输出文件路径
+        connections: 连接数，1 时使用 yt-dlp 的单连接下载器
+    """
+    app.DOWNLOAD_CONNECTIONS = connections
+    info = {
+        'id': 'bench',
+        'url': url,
+        'protocol': 'http',
+        'ext': 'm4a',
+        'http_headers': {},
+    }
+    opts = {'quiet': True, 'noprogress': True, 'retries': 3}
+    ydl_class = app.ParallelYoutubeDL if connections > 1 else app.yt_dlp.YoutubeDL
+    started = time.perf_counter()
+    with ydl_class(opts) as ydl:
+        if not ydl.dl(str(output_path), info):
+            raise RuntimeError(f'下载失败（{connections} 个连接）')
+    return time.perf_counter() - started
+
+
+def main():
+    args = parse_args()
+    os.environ['V2V_DOWNLOAD_CHUNK_MB'] = str(args.chunk_mb)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+
+    payload = os.urandom(int(args.size_mb * 1024 * 1024))
+    expected = hashlib.sha256(payload).hexdigest()
+    rate = args.rate_kb * 1024
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(payload, rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/audio.m4a'
+
+    print(f'测试文件 {args.size_mb:g} MB，每个连接限速 {args.rate_kb:g} KB/s，分块 {args.chunk_mb:g} MB')
+    print(f'{"连接数":<8}{"耗时(s)":>10}{"速度(MB/s)":>14}{"加速比":>10}')
+    baseline = None
+    with tempfile.TemporaryDirectory(prefix='v2v-bench-') as work_dir:
+        try:
+            for connections in args.connections:
+                output_path = Path(work_dir) / f'bench_{connections}.m4a'
+                elapsed = run_download(app, url, output_path, connections)
+                with open(output_path, 'rb') as f:
+                    if hashlib.sha256(f.read()).hexdigest() != expected:
+                        raise RuntimeError(f'下载内容校验失败（{connections} 个连接）')
+                output_path.unlink()
+                baseline = baseline or elapsed
+                print(f'{connections:<8}{elapsed:>10.2f}{len(payload) / elapsed / 1024 / 1024:>14.2f}{baseline / elapsed:>9.2f}x')
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,22 @@ let filesUpdateInterval = null; // 文件列表更新定时器
 // 跟踪已完成的任务（用于通知）
 let completedTasks = new Set();
 
+// 任务状态增量同步
+let statusCursor = 0; // 上次同步到的状态版本号
+let knownTasks = {}; // 本地缓存的任务状态（task_id -> 任务信息）
+
+// 进行中的任务状态
+const ACTIVE_STATUSES = ['pending', 'starting', 'downloading', 'converting', 'processing'];
+
+// 服务器推送（SSE）连接
+let eventSource = null;
+let eventsConnected = false; // 推送通道是否可用（不可用时回退到定时轮询）
+let eventsFailures = 0; // 连续连接失败次数
+const EVENTS_MAX_FAILURES = 3; // 超过此次数后放弃推送，改用轮询
+
+// 文件列表的 ETag（列表未变化时服务器返回 304，不重新渲染）
+let filesETag = null;
+
 // 音频播放器相关
 let currentAudioPlayer = null; // 当前播放的音频播放器
 let currentPlayingFile = null; // 当前播放的文件名
@@ -23,10 +39,98 @@ document.addEventListener('DOMContentLoaded', function() {
     // 加载文件列表
     loadFiles();
     
-    // 定期更新文件列表（每2秒，实现实时展示）
-    filesUpdateInterval = setInterval(loadFiles, 2000);
+    // 加载服务器配置的输出档位
+    loadProfiles();
+    
+    // 优先使用服务器推送；浏览器不支持时回退到定时轮询
+    if (!connectEvents()) {
+        startPollingFallback();
+    }
 });
 
+/**
+ * 连接服务器推送通道（Server-Sent Events）
+ * 任务状态和文件列表的变化由服务器主动推送，无需定时轮询
+ * @returns {boolean} 浏览器是否支持 EventSource
+ */
+function connectEvents() {
+    if (!('EventSource' in window)) {
+        return false;
+    }
+    
+    eventSource = new EventSource(`/api/events?since=${statusCursor}`);
+    
+    eventSource.addEventListener('open', function() {
+        eventsConnected = true;
+        eventsFailures = 0;
+        // 推送恢复后停止轮询
+        stopPollingFallback();
+    });
+    
+    eventSource.addEventListener('status', function(e) {
+        const delta = JSON.parse(e.data);
+        const isInitial = delta.full && statusCursor === 0;
+        applyStatusDelta(delta);
+        
+        if (Object.keys(knownTasks).length > 0) {
+            document.getElementById('progressSection').style.display = 'block';
+        }
+        
+        if (isInitial) {
+            // 页面刚打开时已完成的任务不再通知
+            Object.entries(knownTasks).forEach(([taskId, task]) => {
+                if (task.status === 'completed') {
+                    completedTasks.add(taskId);
+                }
+            });
+        } else {
+            checkCompletedTasks(knownTasks);
+        }
+    });
+    
+    eventSource.addEventListener('files', function() {
+        loadFiles();
+    });
+    
+    eventSource.addEventListener('error', function() {
+        // EventSource 会自动重连；多次失败或连接被关闭后回退到轮询
+        eventsConnected = false;
+        eventsFailures++;
+        if (eventsFailures >= EVENTS_MAX_FAILURES || eventSource.readyState === EventSource.CLOSED) {
+            eventSource.close();
+            eventSource = null;
+            startPollingFallback();
+        }
+    });
+    
+    return true;
+}
+
+/**
+ * 推送不可用时的轮询回退：定期刷新文件列表和任务状态
+ */
+function startPollingFallback() {
+    if (!filesUpdateInterval) {
+        // 定期更新文件列表（每2秒，实现实时展示）
+        filesUpdateInterval = setInterval(loadFiles, 2000);
+    }
+    startStatusUpdate();
+}
+
+/**
+ * 停止轮询回退
+ */
+function stopPollingFallback() {
+    if (filesUpdateInterval) {
+        clearInterval(filesUpdateInterval);
+        filesUpdateInterval = null;
+    }
+    if (statusUpdateInterval) {
+        clearInterval(statusUpdateInterval);
+        statusUpdateInterval = null;
+    }
+}
+
 /**
  * 请求浏览器通知权限
  */
@@ -53,7 +157,10 @@ function checkCompletedTasks(tasks) {
  */
 function showCompletionNotification(task) {
     const title = task.title || '下载完成';
-    const message = `文件已成功下载并转换为 MP3 格式`;
+    // 输出格式取自生成的文件扩展名，随任务的输出档位变化（mp3、wav、原始音轨等）
+    const firstFile = (task.output_files || [])[0] || '';
+    const ext = firstFile.includes('.') ? firstFile.split('.').pop().toUpperCase() : '';
+    const message = ext ? `文件已成功下载并转换为 ${ext} 格式` : '文件已成功下载并处理完成';
     
     // 浏览器桌面通知
     if ('Notification' in window && Notification.permission === 'granted') {
@@ -176,6 +283,7 @@ function updateRemoveButtons() {
 async function startDownload() {
     // 收集所有任务
     const taskItems = document.querySelectorAll('.task-item');
+    const profile = document.getElementById('downloadProfile').value;
     const tasks = [];
     
     taskItems.forEach(item => {
@@ -183,7 +291,7 @@ async function startDownload() {
         const filename = item.querySelector('.filename-input').value.trim();
         
         if (url) {
-            tasks.push({ url, filename });
+            tasks.push({ url, filename, profile });
         }
     });
     
@@ -216,11 +324,13 @@ async function startDownload() {
             // 显示进度区域
             document.getElementById('progressSection').style.display = 'block';
             
-            // 开始定期更新状态
-            startStatusUpdate();
-            
-            // 刷新文件列表（下载完成后会自动更新）
-            setTimeout(loadFiles, 2000);
+            // 推送通道不可用时定期更新状态（可用时由服务器推送）
+            if (!eventsConnected) {
+                startStatusUpdate();
+                
+                // 刷新文件列表（下载完成后会自动更新）
+                setTimeout(loadFiles, 2000);
+            }
             
             // 可选：清空输入框
             // clearInputs();
@@ -242,6 +352,9 @@ function isValidYouTubeUrl(url) {
     const patterns = [
         /^(https?:\/\/)?(www\.)?(youtube\.com\/watch\?v=|youtu\.be\/)[\w-]+/,
         /^(https?:\/\/)?(www\.)?youtube\.com\/shorts\/[\w-]+/,
+        // 播放列表和频道（后端会展开为多个下载任务）
+        /^(https?:\/\/)?(www\.|m\.)?youtube\.com\/playlist\?list=[\w-]+/,
+        /^(https?:\/\/)?(www\.|m\.)?youtube\.com\/(@[\w.-]+|channel\/[\w-]+|c\/[\w-]+|user\/[\w-]+)/,
     ];
     
     return patterns.some(pattern => pattern.test(url));
@@ -266,33 +379,22 @@ function startStatusUpdate() {
 
 /**
  * 从后端获取并更新任务状态显示
+ * 只请求上次同步之后有变化的任务，并只重绘这些任务
  */
 async function updateStatus() {
     try {
-        const response = await fetch('/api/status');
-        const tasks = await response.json();
+        const response = await fetch(`/api/status?since=${statusCursor}`);
+        const delta = await response.json();
+        
+        applyStatusDelta(delta);
         
         // 如果没有任务，停止更新
-        if (Object.keys(tasks).length === 0) {
+        if (Object.keys(knownTasks).length === 0) {
             return;
         }
         
-        // 更新进度列表显示
-        const progressList = document.getElementById('progressList');
-        progressList.innerHTML = '';
-        
-        let hasActiveTask = false; // 是否有进行中的任务
-        
-        // 遍历所有任务，创建进度显示项
-        for (const [taskId, task] of Object.entries(tasks)) {
-            const progressItem = createProgressItem(taskId, task);
-            progressList.appendChild(progressItem);
-            
-            // 检查是否有进行中的任务
-            if (['pending', 'starting', 'downloading', 'converting'].includes(task.status)) {
-                hasActiveTask = true;
-            }
-        }
+        // 是否有进行中的任务
+        const hasActiveTask = Object.values(knownTasks).some(task => ACTIVE_STATUSES.includes(task.status));
         
         // 如果所有任务都完成，停止更新并刷新文件列表
         if (!hasActiveTask) {
@@ -302,7 +404,7 @@ async function updateStatus() {
             loadFiles();
             
             // 检查是否有新完成的任务，发送通知
-            checkCompletedTasks(tasks);
+            checkCompletedTasks(knownTasks);
         }
         
     } catch (error) {
@@ -310,6 +412,65 @@ async function updateStatus() {
     }
 }
 
+/**
+ * 将增量状态应用到本地缓存和页面
+ * @param {Object} delta - /api/status?since= 的响应
+ */
+function applyStatusDelta(delta) {
+    const progressList = document.getElementById('progressList');
+    
+    if (delta.full) {
+        // 全量数据：整体替换
+        knownTasks = {};
+        progressList.innerHTML = '';
+    }
+    
+    // 删除已清除的任务
+    (delta.removed || []).forEach(taskId => {
+        delete knownTasks[taskId];
+        const element = progressList.querySelector(`[data-task-id="${taskId}"]`);
+        if (element) {
+            element.remove();
+        }
+    });
+    
+    // 更新或新增有变化的任务
+    for (const [taskId, task] of Object.entries(delta.tasks || {})) {
+        knownTasks[taskId] = task;
+        if (localExtractTask && taskId === localExtractTask.id) {
+            syncLocalExtractProgress(task);
+        }
+        const progressItem = createProgressItem(taskId, task);
+        const existing = progressList.querySelector(`[data-task-id="${taskId}"]`);
+        if (existing) {
+            existing.replaceWith(progressItem);
+        } else {
+            progressList.appendChild(progressItem);
+        }
+    }
+
+    // 排队位置：出队时其他任务不会出现在增量中，按排队顺序重新计算
+    if (delta.queue) {
+        const positions = new Map(delta.queue.map((taskId, index) => [taskId, index + 1]));
+        for (const [taskId, task] of Object.entries(knownTasks)) {
+            const position = task.status === 'pending' ? (positions.get(taskId) || 0) : 0;
+            if (task.queue_position === position) {
+                continue;
+            }
+            task.queue_position = position;
+            if (position > 0) {
+                task.message = `排队中，前方还有 ${position - 1} 个任务`;
+            }
+            const existing = progressList.querySelector(`[data-task-id="${taskId}"]`);
+            if (existing) {
+                existing.replaceWith(createProgressItem(taskId, task));
+            }
+        }
+    }
+
+    statusCursor = delta.cursor;
+}
+
 /**
  * 创建单个任务的进度显示元素
  * @param {string} taskId - 任务 ID
@@ -327,6 +488,7 @@ function createProgressItem(taskId, task) {
         'starting': { text: '启动中', icon: '🚀' },
         'downloading': { text: '下载中', icon: '⬇️' },
         'converting': { text: '转换中', icon: '🔄' },
+        'processing': { text: '处理中', icon: '✂️' },
         'completed': { text: '完成', icon: '✅' },
         'error': { text: '错误', icon: '❌' }
     };
@@ -405,11 +567,15 @@ function createProgressItem(taskId, task) {
             </div>
         ` : ''}
         
-        ${task.status === 'converting' ? `
+        ${task.status === 'converting' || task.status === 'processing' ? `
             <div class="progress-stats">
                 <div class="stat-item">
                     <span class="stat-label">状态</span>
-                    <span class="stat-value">正在转换为 MP3 格式...</span>
+                    <span class="stat-value">${escapeHtml(task.message || (task.status === 'converting' ? '正在转换音频格式...' : '正在处理音频...'))}</span>
+                </div>
+                <div class="stat-item">
+                    <span class="stat-label">处理速度</span>
+                    <span class="stat-value">${task.realtime_str || 'N/A'}</span>
                 </div>
                 <div class="stat-item">
                     <span class="stat-label">已用时间</span>
@@ -418,9 +584,15 @@ function createProgressItem(taskId, task) {
             </div>
             <div class="progress-bar-wrapper">
                 <div class="progress-bar-container">
-                    <div class="progress-bar progress-bar-converting" style="width: 100%">
-                        <span class="progress-bar-text">转换中...</span>
-                    </div>
+                    ${task.stage_percent !== null && task.stage_percent !== undefined ? `
+                        <div class="progress-bar progress-bar-converting" style="width: ${task.stage_percent}%">
+                            <span class="progress-bar-text">${task.stage_percent}%</span>
+                        </div>
+                    ` : `
+                        <div class="progress-bar progress-bar-converting" style="width: 100%">
+                            <span class="progress-bar-text">${task.status === 'converting' ? '转换中...' : '处理中...'}</span>
+                        </div>
+                    `}
                 </div>
             </div>
         ` : ''}
@@ -430,7 +602,7 @@ function createProgressItem(taskId, task) {
                 <div class="progress-bar-container">
                     <div class="progress-bar progress-bar-${task.status}" 
                          style="width: ${task.status === 'starting' ? '5' : '0'}%">
-                        <span class="progress-bar-text">${task.status === 'starting' ? '准备中...' : '等待中...'}</span>
+                        <span class="progress-bar-text">${task.status === 'starting' ? '准备中...' : (task.queue_position > 0 ? `排队第 ${task.queue_position} 位` : '等待中...')}</span>
                     </div>
                 </div>
             </div>
@@ -530,10 +702,15 @@ async function loadFiles() {
     }
     
     try {
-        const response = await fetch('/api/files');
+        const headers = filesETag ? { 'If-None-Match': filesETag } : {};
+        const response = await fetch('/api/files', { headers, cache: 'no-store' });
+        if (response.status === 304) {
+            return; // 文件列表没有变化
+        }
         const data = await response.json();
         
         if (data.success) {
+            filesETag = response.headers.get('ETag');
             displayFiles(data.files);
         } else {
             document.getElementById('filesList').innerHTML = 
@@ -550,6 +727,7 @@ async function loadFiles() {
  * 刷新文件列表
  */
 function refreshFiles() {
+    filesETag = null; // 手动刷新时强制重新获取
     loadFiles();
 }
 
@@ -881,11 +1059,45 @@ style.textContent = `
 document.head.appendChild(style);
 
 // =========================================================================
-// 本地 MOV 文件音频提取功能
+// 本地文件音频提取功能
 // =========================================================================
 
 /**
- * 开始本地 MOV 文件音频提取
+ * 从服务器读取输出档位，填充下载和本地提取的格式选择框
+ * 读取失败时保留页面中的默认选项
+ */
+async function loadProfiles() {
+    try {
+        const response = await fetch('/api/profiles');
+        const data = await response.json();
+        if (!data.success) {
+            return;
+        }
+        
+        ['downloadProfile', 'outputFormat'].forEach(function(id) {
+            const select = document.getElementById(id);
+            const current = select.value;
+            select.innerHTML = '';
+            data.profiles.forEach(function(profile) {
+                const option = document.createElement('option');
+                option.value = profile.name;
+                option.textContent = `${profile.label}（单个文件不超过 ${profile.max_part_mb} MB）`;
+                select.appendChild(option);
+            });
+            // 保持原来的选择，没有对应档位时使用默认档位
+            const names = data.profiles.map(profile => profile.name);
+            select.value = names.includes(current) ? current : data.default;
+        });
+    } catch (error) {
+        console.error('Failed to load profiles:', error);
+    }
+}
+
+// 本地提取支持的文件扩展名
+const LOCAL_EXTRACT_EXTENSIONS = ['.mov', '.mp4', '.m4v', '.m4a', '.mkv', '.webm'];
+
+/**
+ * 开始本地文件音频提取
  */
 async function startLocalExtract() {
     // 获取文件输入元素
@@ -895,15 +1107,16 @@ async function startLocalExtract() {
     
     // 验证文件选择
     if (!fileInput.files || fileInput.files.length === 0) {
-        alert('请选择一个 MOV 格式的视频文件');
+        alert('请选择一个视频或音频文件');
         return;
     }
     
     const file = fileInput.files[0];
     
-    // 验证文件格式
-    if (file.type !== 'video/quicktime' && !file.name.toLowerCase().endsWith('.mov')) {
-        alert('请选择 MOV 格式的视频文件');
+    // 验证文件格式（与后端 LOCAL_EXTRACT_EXTENSIONS 一致）
+    const extension = file.name.toLowerCase().slice(file.name.lastIndexOf('.'));
+    if (!LOCAL_EXTRACT_EXTENSIONS.includes(extension)) {
+        alert('请选择 MOV、MP4、MKV、WebM 或 M4A 格式的文件');
         return;
     }
     
@@ -912,14 +1125,14 @@ async function startLocalExtract() {
     updateLocalExtractProgress(0, '上传中...', 'uploading', file.name);
     
     try {
-        // 创建 FormData 对象
+        // 创建 FormData 对象（表单字段放在文件之前，服务器边接收边处理时需要先读到它们）
         const formData = new FormData();
-        formData.append('file', file);
-        formData.append('format', outputFormat);
+        formData.append('profile', outputFormat);
         
         if (outputFilename) {
             formData.append('filename', outputFilename);
         }
+        formData.append('file', file);
         
         // 创建 XMLHttpRequest 对象，用于监控上传进度
         const xhr = new XMLHttpRequest();
@@ -939,7 +1152,7 @@ async function startLocalExtract() {
         
         // 监听上传完成（准备处理）
         xhr.upload.onload = function() {
-            updateLocalExtractProgress(100, '上传完成，正在提取音频...', 'extracting', file.name);
+            updateLocalExtractProgress(100, '上传完成，等待服务器确认...', 'uploading', file.name);
         };
         
         // 监听响应
@@ -948,10 +1161,15 @@ async function startLocalExtract() {
                 try {
                     const result = JSON.parse(xhr.responseText);
                     if (result.success) {
-                        updateLocalExtractProgress(100, '提取完成！', 'completed', file.name);
-                        showToastNotification('提取成功', `已成功从 ${file.name} 中提取音频`, 'success');
-                        // 刷新文件列表
-                        setTimeout(loadFiles, 1000);
+                        // 上传完成，提取在后台进行，之后的进度跟随任务状态更新
+                        localExtractTask = { id: result.task_id, filename: file.name };
+                        updateLocalExtractProgress(0, result.message, 'extracting', file.name);
+                        if (knownTasks[result.task_id]) {
+                            syncLocalExtractProgress(knownTasks[result.task_id]);
+                        }
+                        if (!eventSource && !statusUpdateInterval) {
+                            startStatusUpdate();
+                        }
                     } else {
                         updateLocalExtractProgress(100, `错误: ${result.error}`, 'error', file.name);
                         showToastNotification('提取失败', result.error, 'error');
@@ -961,7 +1179,13 @@ async function startLocalExtract() {
                     showToastNotification('提取失败', '服务器响应格式错误', 'error');
                 }
             } else {
-                updateLocalExtractProgress(100, `请求失败: ${xhr.statusText}`, 'error', file.name);
+                let errorMessage = xhr.statusText;
+                try {
+                    errorMessage = JSON.parse(xhr.responseText).error || errorMessage;
+                } catch (error) {
+                    // 非 JSON 响应，使用状态文本
+                }
+                updateLocalExtractProgress(100, `请求失败: ${errorMessage}`, 'error', file.name);
                 showToastNotification('提取失败', `服务器错误: ${xhr.status}`, 'error');
             }
         };
@@ -996,17 +1220,34 @@ function hideLocalExtractProgress() {
     document.getElementById('localExtractProgress').style.display = 'none';
 }
 
+// 正在跟踪的本地提取任务 { id, filename }
+let localExtractTask = null;
+
 /**
- * 更新本地提取进度
- * @param {number} percent - 进度百分比 (0-100)
- * @param {string} message - 状态消息
- * @param {string} status - 状态类型 (pending, uploading, extracting, completed, error)
- * @param {string} filename - 文件名
+ * 根据后端任务状态更新本地提取进度
+ * @param {Object} task - 任务信息
  */
-// 用于存储动态进度更新的定时器
-let extractProgressInterval = null;
-// 用于存储当前的动态进度值
-let currentExtractProgress = 0;
+function syncLocalExtractProgress(task) {
+    const filename = localExtractTask.filename;
+    
+    if (task.status === 'completed') {
+        localExtractTask = null;
+        updateLocalExtractProgress(100, task.message || '提取完成！', 'completed', filename);
+        showToastNotification('提取成功', `已成功从 ${filename} 中提取音频`, 'success');
+        // 刷新文件列表
+        setTimeout(loadFiles, 1000);
+    } else if (task.status === 'error') {
+        localExtractTask = null;
+        updateLocalExtractProgress(100, task.message, 'error', filename);
+        showToastNotification('提取失败', task.message, 'error');
+    } else {
+        // 上传阶段显示已接收的比例，提取阶段显示 ffmpeg 报告的进度
+        const uploading = task.status === 'downloading';
+        const percent = Math.round((uploading ? task.progress_percent : task.stage_percent) || 0);
+        const speed = !uploading && task.realtime_factor ? `（${task.realtime_str}）` : '';
+        updateLocalExtractProgress(percent, `${task.message}${speed}`, uploading ? 'uploading' : 'extracting', filename);
+    }
+}
 
 /**
  * 更新本地提取进度
@@ -1051,20 +1292,11 @@ function updateLocalExtractProgress(percent, message, status, filename) {
     const percentElement = document.getElementById('localExtractPercent');
     const messageElement = document.getElementById('localExtractMessage');
     
-    // 处理不同状态的进度更新
-    if (status === 'extracting') {
-        // 开始动态进度更新
-        startDynamicProgress(percent, message);
-    } else {
-        // 清除动态进度更新
-        stopDynamicProgress();
-        
-        // 更新固定进度
-        barElement.style.width = `${percent}%`;
-        barTextElement.textContent = `${percent}%`;
-        percentElement.textContent = `${percent}%`;
-        messageElement.textContent = message;
-    }
+    // 更新进度
+    barElement.style.width = `${percent}%`;
+    barTextElement.textContent = `${percent}%`;
+    percentElement.textContent = `${percent}%`;
+    messageElement.textContent = message;
     
     // 更新进度条类
     barElement.className = `progress-bar ${config.barClass}`;
@@ -1089,70 +1321,6 @@ function updateLocalExtractProgress(percent, message, status, filename) {
     }
 }
 
-/**
- * 开始动态进度更新
- * @param {number} initialPercent - 初始进度百分比
- * @param {string} baseMessage - 基础状态消息
- */
-function startDynamicProgress(initialPercent, baseMessage) {
-    // 清除现有的定时器
-    stopDynamicProgress();
-    
-    // 设置初始进度
-    currentExtractProgress = initialPercent;
-    
-    // 获取元素
-    const barElement = document.getElementById('localExtractBar');
-    const barTextElement = document.getElementById('localExtractBarText');
-    const percentElement = document.getElementById('localExtractPercent');
-    const messageElement = document.getElementById('localExtractMessage');
-    
-    // 计算目标进度（在初始进度和100%之间）
-    const targetProgress = 100;
-    
-    // 更新进度函数
-    const updateProgress = () => {
-        // 计算进度增量（动态调整，使进度在提取过程中平滑增长）
-        const progressIncrement = Math.random() * 2 + 0.5;
-        
-        // 更新进度
-        currentExtractProgress += progressIncrement;
-        
-        // 确保进度不超过目标
-        if (currentExtractProgress >= targetProgress) {
-            currentExtractProgress = targetProgress;
-            stopDynamicProgress();
-        }
-        
-        // 计算剩余时间（模拟）
-        const remainingSeconds = Math.round((targetProgress - currentExtractProgress) / 2);
-        const timeMessage = remainingSeconds > 0 ? `预计剩余 ${remainingSeconds} 秒` : '';
-        
-        // 更新显示
-        const displayPercent = Math.round(currentExtractProgress);
-        barElement.style.width = `${displayPercent}%`;
-        barTextElement.textContent = `${displayPercent}%`;
-        percentElement.textContent = `${displayPercent}%`;
-        messageElement.textContent = `${baseMessage} ${timeMessage}`;
-    };
-    
-    // 设置定时器，每500毫秒更新一次进度
-    extractProgressInterval = setInterval(updateProgress, 500);
-    
-    // 立即执行一次更新
-    updateProgress();
-}
-
-/**
- * 停止动态进度更新
- */
-function stopDynamicProgress() {
-    if (extractProgressInterval) {
-        clearInterval(extractProgressInterval);
-        extractProgressInterval = null;
-    }
-}
-
 // 添加本地提取相关的 CSS 样式
 const localExtractStyle = document.createElement('style');
 localExtractStyle.textContent = `